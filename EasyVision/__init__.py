@@ -14,6 +14,7 @@ __maintainer__ = "Andrius Mikonis"
 __maintainer_email__ = "andrius.mikonis@gmail.com"
 __github_username__ = "FoxIS"
 __all__ = [
+    "codec",
     "exceptions",
     "vision",
     "engine",
@@ -30,6 +30,11 @@ except ImportError:
                 return result
             return wrapper
 
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
 
 class NamedTupleExtendHelper(object):
     """NamedTupleExtendedHelper is a helper Mixin style class that enables to extend namedtuple derived classes with fields
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Feature matcher autotuning tool
+
+Extracts features from a folder of images and benchmarks FLANN index parameters for each feature type.
+Consecutive images are matched against each other. For every feature type the fastest configuration, that finds
+enough of exact nearest neighbours, is selected together with the brute force search limit.
+Will output a json file, that can be passed as ``matcher_config`` to engines using ``FeatureMatchingMixin``.::
+
+    usage: autotune_matcher.py [-h] [-f FILE] [-e FEATURE_TYPES] [-n FEATURES]
+                               [-r RECALL]
+                               [folder]
+
+    Feature matcher autotuning tool
+
+    positional arguments:
+      folder                Folder with sample images
+
+    optional arguments:
+      -h, --help            show this help message and exit
+      -f FILE, --file FILE  Output filename of the matcher configuration
+      -e FEATURE_TYPES, --feature_types FEATURE_TYPES
+                            Comma separated feature types (e.g. ORB,SIFT)
+      -n FEATURES, --features FEATURES
+                            Maximum number of features per image
+      -r RECALL, --recall RECALL
+                            Minimum fraction of exact nearest neighbours found
+
+"""
+from argparse import ArgumentParser
+from EasyVision.vision import ImagesReader
+from EasyVision.processors import FeatureExtraction, FeatureMatchingMixin, MatcherConfig, autotune_matcher
+from EasyVision.bin.calibrate_camera import list_images
+
+
+def extract_descriptors(paths, feature_type, features):
+    """Extracts descriptors from images
+
+    :param paths: list of image paths
+    :param feature_type: feature type
+    :param features: maximum number of features per image
+    :return: list of descriptor arrays
+    """
+    descriptors = []
+    with FeatureExtraction(ImagesReader(paths), feature_type, max_features=features) as vision:
+        for frame in vision:
+            d = frame.images[0].features.descriptors
+            if d is not None:
+                descriptors.append(d.get() if hasattr(d, 'get') else d)
+    return descriptors
+
+
+def main():
+    parser = ArgumentParser(description="Feature matcher autotuning tool")
+    parser.add_argument("folder", nargs='?', default="test_data", help="Folder with sample images")
+    parser.add_argument("-f", "--file", default="matcher.json", help="Output filename of the matcher configuration")
+    parser.add_argument("-e", "--feature_types", default="ORB", help="Comma separated feature types (e.g. ORB,SIFT)")
+    parser.add_argument("-n", "--features", type=int, default=2000, help="Maximum number of features per image")
+    parser.add_argument("-r", "--recall", type=float, default=0.9,
+                        help="Minimum fraction of exact nearest neighbours found")
+
+    args = parser.parse_args()
+    paths = list_images(args.folder)
+
+    configs = {}
+    for feature_type in args.feature_types.split(','):
+        descriptors = extract_descriptors(paths, feature_type, args.features)
+        binary = feature_type in FeatureMatchingMixin.BINARY_FEATURES
+        configs[feature_type] = autotune_matcher(descriptors[1:], descriptors[:-1], binary, min_recall=args.recall)
+        print(feature_type, configs[feature_type])
+
+    MatcherConfig.save(args.file, configs)
+
+
+if __name__ == "__main__":
+    main()
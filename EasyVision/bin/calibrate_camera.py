@@ -2,10 +2,12 @@
 """Monocular camera calibration tool
 
 Uses rectangular 9x7 calibration pattern for camera intrinsic parameter calibration.
-Will output a camera calibration json file, that can be loaded and passed to PinholeCamera object.::
+Will output a camera calibration json file, that can be loaded and passed to PinholeCamera object.
+If a folder with images is passed instead of a camera, all images are processed at once in parallel.::
 
     usage: calibrate_camera.py [-h] [-f FILE] [-g GRID] [-i SIZE] [-p FPS] [-N N]
-                               [-t]
+                               [-t] [-j JOBS] [-m MAX_SIZE]
+                               [-V MAX_VIEWS] [-r REFINE]
                                camera
 
     Camera calibration tool
@@ -21,6 +23,14 @@ Will output a camera calibration json file, that can be loaded and passed to Pin
       -p FPS, --fps FPS     Frame rate
       -N N                  Number of samples to gather
       -t, --test            Test camera calibration file
+      -j JOBS, --jobs JOBS  Number of processes for calibration from a folder
+      -m MAX_SIZE, --max-size MAX_SIZE
+                            Maximum image size for pattern detection in a folder
+      -V MAX_VIEWS, --max-views MAX_VIEWS
+                            Maximum number of samples used for calibration solve
+      -r REFINE, --refine REFINE
+                            Number of iterations that drop high reprojection
+                            error samples
 
 """
 from argparse import ArgumentParser
@@ -29,6 +39,15 @@ from EasyVision.vision import VideoCapture
 from EasyVision.processors import CalibratedCamera, PinholeCamera
 import json
 import cv2
+import os
+from glob import glob
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def list_images(folder):
+    """Returns sorted list of image files in a folder"""
+    return sorted(path for path in glob(os.path.join(folder, '*')) if path.lower().endswith(IMAGE_EXTENSIONS))
 
 
 def main():
@@ -41,6 +60,13 @@ def main():
     parser.add_argument("-N", type=int, default=30, help="Number of samples to gather")
     parser.add_argument("-t", "--test", const=True, default=False, action='store_const',
                         help="Test camera calibration file")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of processes for calibration from a folder")
+    parser.add_argument("-m", "--max-size", type=int, default=1024,
+                        help="Maximum image size for pattern detection in a folder")
+    parser.add_argument("-V", "--max-views", type=int, default=None,
+                        help="Maximum number of samples used for calibration solve")
+    parser.add_argument("-r", "--refine", type=int, default=0,
+                        help="Number of iterations that drop high reprojection error samples")
 
     args = parser.parse_args()
     grid = tuple(int(i) for i in args.grid.split(','))
@@ -51,6 +77,13 @@ def main():
     except:
         camera = args.camera
 
+    if not args.test and os.path.isdir(str(camera)):
+        cam = CalibratedCamera.calibrate_offline(list_images(camera), grid_shape=grid, max_size=args.max_size,
+                                                 processes=args.jobs, max_views=args.max_views, refine=args.refine)
+        with open(args.file, "w") as f:
+            f.write(json.dumps(cam.todict(), indent=4))
+        return
+
     camera_model = None
     if args.test:
         with open(args.file) as f:
@@ -58,7 +91,8 @@ def main():
 
     builder = Builder(
         VideoCapture, Args(camera, width=size[0], height=size[1], fps=int(args.fps)),
-        CalibratedCamera, Args(camera_model, max_samples=args.N, grid_shape=grid, display_results=True)
+        CalibratedCamera, Args(camera_model, max_samples=args.N, grid_shape=grid, max_views=args.max_views,
+                               refine=args.refine, display_results=True)
     )
 
     if args.test:
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 """Stereo camera calibration tool.
-Will calibrate a stereo camera pair using 9x7 rectangular calibration pattern.::
+Will calibrate a stereo camera pair using 9x7 rectangular calibration pattern.
+If folders with images are passed instead of cameras, all image pairs are processed at once in parallel.
+Images are paired in sorted order.::
 
     usage: calibrate_stereo.py [-h] [-f FILE] [-i SIZE] [-p FPS] [-g GRID] [-N N]
-                               [-t] [-d]
+                               [-t] [-d] [-j JOBS] [-m MAX_SIZE]
+                               [-V MAX_VIEWS] [-r REFINE]
                                left right
 
     Stereo Camera calibration tool
@@ -21,6 +24,14 @@ Will calibrate a stereo camera pair using 9x7 rectangular calibration pattern.::
       -N N                  Number of samples to gather
       -t, --test            Test camera calibration file
       -d, --disparity       Calculate Disparity Map
+      -j JOBS, --jobs JOBS  Number of processes for calibration from folders
+      -m MAX_SIZE, --max-size MAX_SIZE
+                            Maximum image size for pattern detection in folders
+      -V MAX_VIEWS, --max-views MAX_VIEWS
+                            Maximum number of samples used for calibration solve
+      -r REFINE, --refine REFINE
+                            Number of iterations that drop high reprojection
+                            error samples
 
 """
 
@@ -28,8 +39,10 @@ from argparse import ArgumentParser
 from EasyVision.processorstackbuilder import Args, Builder
 from EasyVision.vision import VideoCapture
 from EasyVision.processors import CalibratedCamera, CalibratedStereoCamera, StereoCamera, ImageTransform
+from EasyVision.bin.calibrate_camera import list_images
 import json
 import cv2
+import os
 
 
 def main():
@@ -45,6 +58,13 @@ def main():
                         help="Test camera calibration file")
     parser.add_argument("-d", "--disparity", const=True, default=False, action='store_const',
                         help="Calculate Disparity Map")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of processes for calibration from folders")
+    parser.add_argument("-m", "--max-size", type=int, default=1024,
+                        help="Maximum image size for pattern detection in folders")
+    parser.add_argument("-V", "--max-views", type=int, default=None,
+                        help="Maximum number of samples used for calibration solve")
+    parser.add_argument("-r", "--refine", type=int, default=0,
+                        help="Number of iterations that drop high reprojection error samples")
 
     args = parser.parse_args()
     grid = tuple(int(i) for i in args.grid.split(','))
@@ -57,6 +77,15 @@ def main():
         left = args.left
         right = args.right
 
+    if not args.test and os.path.isdir(str(left)) and os.path.isdir(str(right)):
+        cam = CalibratedStereoCamera.calibrate_offline(list_images(left), list_images(right), grid_shape=grid,
+                                                       max_size=args.max_size, processes=args.jobs,
+                                                       max_views=args.max_views, refine=args.refine)
+        with open(args.file, "w") as f:
+            f.write(json.dumps(cam.todict(), indent=4))
+            print("{} was written".format(args.file))
+        return
+
     camera_model = None
     if args.test:
         with open(args.file) as f:
@@ -74,8 +103,8 @@ def main():
             ImageTransform, Args(ocl=args.test),
             CalibratedCamera, Args(None if camera_model is None else camera_model.right)
         ),
-        CalibratedStereoCamera, Args(camera_model, max_samples=args.N, grid_shape=grid,
-                                     calculate_disparity=args.disparity, display_results=True)
+        CalibratedStereoCamera, Args(camera_model, max_samples=args.N, grid_shape=grid, max_views=args.max_views,
+                                     refine=args.refine, calculate_disparity=args.disparity, display_results=True)
     )
 
     if args.test:
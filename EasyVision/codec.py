@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Binary wire format used to transfer frames between processes and machines.
+
+An encoded message consists of a small header, raw out-of-band buffers and a pickle payload::
+
+    | magic | number of buffers | payload size | buffer sizes ... | buffer 0 | pad | buffer 1 | pad | ... | payload |
+
+On Python 3.8+ pickle protocol 5 is used, so contiguous ``ndarray`` objects (images, masks, descriptors, points)
+are never copied into the pickle stream. They are passed as separate buffers instead, that can be written
+to a pipe, socket or file one after another. Decoding reconstructs arrays as views into the received
+buffer, so no copies are made on either side. Decoded arrays are always writable: read-only input, such as
+``bytes``, is copied once into a writable buffer first. On older Python versions everything is pickled in-band.
+
+Buffers are padded to ``ALIGNMENT`` bytes, so that decoded arrays are properly aligned.
+Note, that encoded buffers reference the original arrays, so those must not be modified until the message is sent.
+For backward compatibility ``decode``, ``loads`` and ``recv`` treat data that does not start with the header magic
+as a plain pickle. ``load`` and ``recvall`` only accept encoded messages and raise ``ValueError`` otherwise.
+"""
+
+import struct
+import numpy as np
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+MAGIC = b'EVW1'
+ALIGNMENT = 8
+OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+_HEADER = struct.Struct('<4sIQ')
+_SIZE = struct.Struct('<Q')
+
+
+def _padding(size):
+    """Returns a number of bytes required to align the next buffer"""
+    return -size % ALIGNMENT
+
+
+def _layout(sizes, payload_size):
+    """Returns buffer offsets, payload offset and the total size of the message body"""
+    offsets = []
+    offset = 0
+    for size in sizes:
+        offsets.append(offset)
+        offset += size + _padding(size)
+    return offsets, offset, offset + payload_size
+
+
+def _parse_header(header):
+    """Parses fixed size header and returns number of buffers and payload size"""
+    magic, num_buffers, payload_size = _HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError("Invalid wire format header")
+    return num_buffers, payload_size
+
+
+def _parse_sizes(data, num_buffers):
+    """Parses buffer sizes that follow the fixed size header"""
+    return [_SIZE.unpack_from(data, i * _SIZE.size)[0] for i in range(num_buffers)]
+
+
+def _decode_body(body, sizes, payload_size):
+    """Unpickles the payload using buffers that are sliced out of the message body"""
+    offsets, payload_offset, total = _layout(sizes, payload_size)
+    payload = body[payload_offset:total]
+    if OUT_OF_BAND:
+        return pickle.loads(payload, buffers=[body[o:o + s] for o, s in zip(offsets, sizes)])
+    return pickle.loads(payload.tobytes())
+
+
+def _allocate(size):
+    """Allocates uninitialized writable buffer for the message body"""
+    return memoryview(np.empty(size, dtype=np.uint8))
+
+
+def encode(obj):
+    """Encodes an object without copying any of the contiguous ndarrays it contains.
+
+    :param obj: any picklable object, usually Frame, Image or Features
+    :return: a tuple of (header, buffers, payload). Buffers are memoryviews pointing to the original arrays.
+    """
+    buffers = []
+    if OUT_OF_BAND:
+        payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        buffers = [buf.raw() for buf in buffers]
+    else:
+        payload = pickle.dumps(obj, protocol=-1)
+    header = _HEADER.pack(MAGIC, len(buffers), len(payload)) + b''.join(_SIZE.pack(buf.nbytes) for buf in buffers)
+    return header, buffers, payload
+
+
+def chunks(obj):
+    """Encodes an object into a list of bytes-like chunks, that form a contiguous message when written in order.
+
+    :param obj: any picklable object
+    :return: a list of bytes-like objects
+    """
+    header, buffers, payload = encode(obj)
+    result = [header]
+    for buf in buffers:
+        result.append(buf)
+        pad = _padding(buf.nbytes)
+        if pad:
+            result.append(b'\0' * pad)
+    result.append(payload)
+    return result
+
+
+def decode(data):
+    """Decodes an object from a contiguous message. Arrays will be writable views into ``data``.
+    If ``data`` is read-only (e.g. ``bytes``), it is copied once into a writable buffer.
+
+    :param data: bytes-like object containing a message created with ``chunks`` or ``dumps``
+    :return: decoded object
+    """
+    view = memoryview(data)
+    if view[:len(MAGIC)].tobytes() != MAGIC:
+        return pickle.loads(data)
+    if OUT_OF_BAND and view.readonly:
+        writable = _allocate(view.nbytes)
+        writable[:] = view.cast('B')
+        view = writable
+    num_buffers, payload_size = _parse_header(view)
+    sizes = _parse_sizes(view[_HEADER.size:], num_buffers)
+    return _decode_body(view[_HEADER.size + num_buffers * _SIZE.size:], sizes, payload_size)
+
+
+def dumps(obj):
+    """Encodes an object into a single bytes object. Note, that joining the chunks copies the data once."""
+    return b''.join(chunks(obj))
+
+
+def loads(data):
+    """Decodes an object from bytes-like object. Same as ``decode``."""
+    return decode(data)
+
+
+def pack_into(buf, obj):
+    """Encodes an object directly into a preallocated writable buffer, e.g. a shared memory block.
+    Decode it with ``decode``, that will return arrays as views into that buffer.
+
+    :param buf: writable bytes-like object
+    :param obj: any picklable object
+    :return: number of bytes written
+    :raises ValueError: if encoded object does not fit into the buffer
+    """
+    header, buffers, payload = encode(obj)
+    offsets, payload_offset, total = _layout([b.nbytes for b in buffers], len(payload))
+    view = memoryview(buf).cast('B')
+    if len(header) + total > len(view):
+        raise ValueError("Encoded object of size {} does not fit into buffer of size {}".format(
+            len(header) + total, len(view)))
+    view[:len(header)] = header
+    body = view[len(header):]
+    for offset, b in zip(offsets, buffers):
+        body[offset:offset + b.nbytes] = b
+    body[payload_offset:total] = payload
+    return len(header) + total
+
+
+def dump(obj, buf):
+    """Writes encoded object into a buffer-like object that supports ``write`` method"""
+    for chunk in chunks(obj):
+        buf.write(chunk)
+
+
+def load(buf):
+    """Reads encoded object from a buffer-like object that supports ``read`` method.
+    Unlike ``decode`` plain pickles are not accepted.
+    """
+    header = buf.read(_HEADER.size)
+    num_buffers, payload_size = _parse_header(header)
+    sizes = _parse_sizes(buf.read(num_buffers * _SIZE.size), num_buffers)
+    body = _allocate(_layout(sizes, payload_size)[2])
+    if hasattr(buf, 'readinto'):
+        view = body
+        while len(view):
+            n = buf.readinto(view)
+            if not n:
+                raise EOFError("Unexpected end of buffer")
+            view = view[n:]
+    else:
+        body[:] = buf.read(len(body))
+    return _decode_body(body, sizes, payload_size)
+
+
+def send(conn, obj):
+    """Sends an object through ``multiprocessing.Connection``. Every buffer is sent as a separate message,
+    so that large arrays are never joined together.
+
+    :param conn: multiprocessing Connection object
+    :param obj: any picklable object
+    """
+    header, buffers, payload = encode(obj)
+    conn.send_bytes(header)
+    for buf in buffers:
+        conn.send_bytes(buf)
+    conn.send_bytes(payload)
+
+
+def recv(conn):
+    """Receives an object sent with ``send`` from ``multiprocessing.Connection``.
+    Every message is received directly into its place in a preallocated message body.
+
+    :param conn: multiprocessing Connection object
+    :return: received object
+    """
+    header = conn.recv_bytes()
+    if header[:len(MAGIC)] != MAGIC:
+        return pickle.loads(header)
+    num_buffers, payload_size = _parse_header(header)
+    sizes = _parse_sizes(header[_HEADER.size:], num_buffers)
+    offsets, payload_offset, total = _layout(sizes, payload_size)
+    body = _allocate(total)
+    for offset in offsets:
+        conn.recv_bytes_into(body, offset)
+    conn.recv_bytes_into(body, payload_offset)
+    return _decode_body(body, sizes, payload_size)
+
+
+def sendall(sock, chunks):
+    """Sends pre-encoded chunks (see ``chunks``) through a socket"""
+    for chunk in chunks:
+        sock.sendall(chunk)
+
+
+def recvall(sock):
+    """Receives an object sent with ``sendall`` from a socket directly into a preallocated message body.
+
+    :param sock: connected socket object
+    :return: received object
+    :raises ValueError: if received data is not an encoded message
+    """
+    header = _recv_into(sock, _allocate(_HEADER.size))
+    num_buffers, payload_size = _parse_header(header)
+    sizes = _parse_sizes(_recv_into(sock, _allocate(num_buffers * _SIZE.size)), num_buffers)
+    body = _recv_into(sock, _allocate(_layout(sizes, payload_size)[2]))
+    return _decode_body(body, sizes, payload_size)
+
+
+def _recv_into(sock, body):
+    """Helper method to fill the whole buffer from a socket"""
+    view = body
+    while len(view):
+        n = sock.recv_into(view)
+        if not n:
+            raise EOFError("Connection closed while receiving data")
+        view = view[n:]
+    return body
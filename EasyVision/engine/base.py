@@ -7,6 +7,7 @@ implement ``compute`` method instead of ``capture`` and in addition to a ``Frame
 from EasyVision.base import *
 from EasyVision.vision.base import VisionBase
 from EasyVision.processors.base import Features
+import cv2
 import numpy as np
 from collections import namedtuple
 import heapq
@@ -142,6 +143,41 @@ class OdometryBase(EngineBase):
         """Feature Type that the odometry is working with"""
         pass
 
+    @staticmethod
+    def _predict_rotation(pts, R, matrix):
+        """Predicts locations of distant points in the next frame, assuming only the rotation ``R`` recovered
+        from the essential matrix of (next, last) point pairs, i.e. ``x_last = R * x_next + t``.
+
+        :param pts: Nx2 array of point locations in the last frame
+        :param R: 3x3 rotation matrix or None for no motion
+        :param matrix: 3x3 camera matrix
+        :return: Nx2 array of predicted point locations
+        """
+        pts = np.float32(pts).reshape(-1, 2)
+        if R is None or not len(pts):
+            return pts
+        H = np.dot(np.dot(matrix, np.transpose(R)), np.linalg.inv(matrix))
+        return cv2.perspectiveTransform(pts.reshape(-1, 1, 2), H).reshape(-1, 2)
+
+    @staticmethod
+    def _predict_projection(points_3d, R, t, matrix):
+        """Projects points in the last camera coordinates into the next frame using relative pose ``R, t``
+        as returned by odometry engines, i.e. inverse of solvePnP result.
+
+        :param points_3d: Nx3 array of points in the last camera coordinates
+        :param R: 3x3 rotation matrix
+        :param t: translation vector
+        :param matrix: 3x3 camera matrix
+        :return: Nx2 array of predicted point locations. Points behind the camera are set to NaN
+        """
+        points_3d = np.float64(points_3d).reshape(-1, 3)
+        points = np.dot(points_3d, R) - np.ravel(t)
+        projected = np.dot(points, np.transpose(matrix))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pts = projected[:, :2] / projected[:, 2:]
+        pts[points[:, 2] <= 0] = np.nan
+        return pts
+
 
 class MapBase(EasyVisionBase):
     """MapBase is an abstract base class for Mapping with Visual Odometry
@@ -41,7 +41,7 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
     """
 
     def __init__(self, vision, _map=None, feature_type=None, pose=None, num_features=6000, min_features=1000,
-                 min_matches=30, distance_thresh=None, ratio=.7, reproj_thresh=None,
+                 min_matches=30, distance_thresh=None, ratio=.7, reproj_thresh=None, search_radius=None,
                  debug=False, display_results=False, *args, **kwargs):
         """Instance initialization.
 
@@ -55,6 +55,8 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
         :param distance_thresh: Distance threshold for matching
         :param ratio: Lowe's ratio
         :param reproj_thresh: Reprojection threshold
+        :param search_radius: Enables guided matching. Features are matched only within this radius in pixels
+            around locations predicted from the last relative rotation
         """
         feature_extractor_provided = False
         if not isinstance(vision, ProcessorBase) and not isinstance(vision, VisionBase) and not isinstance(vision, PyroCapture):
@@ -96,7 +98,7 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
 
         self._lk_params = dict(
             winSize=(21, 21),
-            #maxLevel = 3,
+            maxLevel=3,
             criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
         )
 
@@ -104,23 +106,37 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
         self._map = _map
         self._last_image = None
         self._last_kps = None
+        self._reference = None
         self._last_features = None
         self._last_pose = None
         self._pose = pose
         self._min_matches = min_matches
         self._ratio = ratio
+        self._search_radius = search_radius
         if distance_thresh is not None:
             self._distance_thresh = distance_thresh
         if reproj_thresh is not None:
             self._reproj_thresh = reproj_thresh
+        self._extractor = _vision.get_source('FeatureExtraction')
         super(VisualOdometry2DEngine, self).__init__(_vision, debug=debug, display_results=display_results, *args, **kwargs)
 
     def setup(self):
         super(VisualOdometry2DEngine, self).setup()
+        if not self._extract:
+            # features are detected on demand, when there are not enough tracked points
+            self._extractor.enabled = False
+        self._reference = None
+        # key points are in coordinates of undistorted images, e.g. after cropping or undistorting points
+        calibrated = self.vision.get_source('CalibratedCamera')
+        if isinstance(calibrated, CalibratedCamera) and calibrated.undistorted_camera is not None:
+            self._camera = calibrated.undistorted_camera
         if self._map is not None:
             self._map.setup()
 
     def release(self):
+        if not self._extract:
+            self._extractor.enabled = True
+        self._reference = None
         super(VisualOdometry2DEngine, self).release()
         if self._map is not None:
             self._map.release()
@@ -131,7 +147,10 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
             return None
         current_image = frame.images[0]
 
-        pose = self._compute_match(frame.timestamp, current_image, absolute_scale) if self._extract else self._compute_track(current_image, absolute_scale)
+        if self._extract:
+            pose = self._compute_match(frame.timestamp, current_image, absolute_scale)
+        else:
+            pose = self._compute_track(frame.timestamp, current_image, absolute_scale)
 
         self._last_image = current_image
 
@@ -146,7 +165,7 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
         :return: computed and updated pose
         """
         if not self._last_image:
-            self._last_kps = np.float32([x.pt for x in current_image.features.points])
+            self._last_kps = current_image.features.pts
         else:
             M = self._match_features(self._last_features, current_image.features)
 
@@ -168,9 +187,10 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
                     P1 = np.dot(self._camera.matrix, np.hstack((np.eye(3, 3), np.zeros((3, 1)))))
                     P2 = np.dot(self._camera.matrix, np.hstack((R, t)))
 
-                    last_inliers = np.float32([p for m, p in zip(mask, last) if m])
-                    current_inliers = np.float32([p for m, p in zip(mask, current) if m])
-                    descriptors = np.array([p for m, p in zip(mask, descriptors) if m], dtype=descriptors.dtype)
+                    inliers = mask.ravel() > 0
+                    last_inliers = last[inliers]
+                    current_inliers = current[inliers]
+                    descriptors = descriptors[inliers]
 
                     points_4d_hom = cv2.triangulatePoints(P1, P2, np.expand_dims(current_inliers, axis=1), np.expand_dims(last_inliers, axis=1))
                     points_4d = points_4d_hom / np.tile(points_4d_hom[-1, :], (4, 1))
@@ -207,34 +227,44 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
     def _compute_track(self, timestamp, current_image, absolute_scale):
         """Helper method to compute pose from tracked features.
 
-        FIXME: currently broken code
+        Key points of the last frame are tracked into the current frame with pyramidal Lucas-Kanade optical flow.
+        Features are detected only when the number of tracked points drops below ``min_features``.
+        The current image is kept as a host array and used as a reference image for the next frame.
 
         :param timestamp: current frame timestamp
         :param current_image: current image
         :param absolute_scale: absolute scale that is being passed from ``compute`` method
         :return: computed and updated pose
         """
-        self.vision.enable = False
-        if not self._last_image:
-            self._last_kps = np.array([x.pt for x in current_image.features.points], dtype=np.float32)
-        else:
-            self._last_kps, cur_kps = self._track_features(self._last_image.image, current_image.image, self._last_kps)
-
-            if self.debug:
-                img = cv2.cvtColor(current_image.image, cv2.COLOR_GRAY2BGR)
-                for a, b in zip(last, current):
-                    cv2.line(img, (a[0], a[1]), (b[0], b[1]), (0, 0, 255))
-                for x, y in self._last_kps:
-                    cv2.circle(img, (x, y), 5, (0, 255, 0))
-                cv2.imshow(self.name, img)
-
-            E, mask = cv2.findEssentialMat(cur_kps, self._last_kps,
-                                           focal=self._camera.focal_point[0], pp=self._camera.center,
-                                           method=cv2.RANSAC, prob=0.999, threshold=self._reproj_thresh)
-            last_kps = np.float32([kp for m, kp in zip(mask, self._last_kps) if m])
-            cur_kps = np.float32([kp for m, kp in zip(mask, cur_kps) if m])
-            _, R, t, mask = cv2.recoverPose(E, cur_kps, last_kps,
-                                            focal=self._camera.focal_point[0], pp=self._camera.center)
+        image = current_image.image.get() if isinstance(current_image.image, cv2.UMat) else current_image.image
+
+        if self._reference is None or len(self._last_kps) < self._min_matches:
+            # nothing to track, e.g. the first frame or a blank or textureless last frame
+            self._last_kps = self._detect_features(current_image)
+            self._reference = image
+            return self._pose
+
+        last, current = self._track_features(self._reference, image, self._last_kps)
+        self._reference = image
+
+        if len(current) < self._min_matches:
+            print("failed to track features")
+            self._last_kps = self._detect_features(current_image)
+            return self._pose
+
+        E, mask = cv2.findEssentialMat(current, last,
+                                       focal=self._camera.focal_point[0], pp=self._camera.center,
+                                       method=cv2.RANSAC, prob=0.999, threshold=self._reproj_thresh)
+        if E is None or E.shape != (3, 3):
+            print("failed to find essential matrix")
+            self._last_kps = self._detect_features(current_image)
+            return self._pose
+
+        inliers = mask.ravel() > 0
+        last, current = last[inliers], current[inliers]
+        ret, R, t, mask = cv2.recoverPose(E, current, last, focal=self._camera.focal_point[0], pp=self._camera.center)
+
+        if ret:
             if self._pose:
                 self._pose = self._pose._replace(
                     timestamp=timestamp,
@@ -245,14 +275,30 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
                 self._pose = Pose(timestamp, R, t)
             self._last_pose = Pose(timestamp, R, t)
 
-            if len(self._last_kps) < self._min_features:
-                current_image = self.vision.process(current_image)
-                cur_kps = np.array([x.pt for x in current_image.features.points], dtype=np.float32)
+            if self._map is not None:
+                self._pose = self._map.update(self._pose, scale=absolute_scale)
 
-            self._last_kps = cur_kps
+        if self.debug:
+            img = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            for a, b in zip(np.int32(last), np.int32(current)):
+                cv2.line(img, (int(a[0]), int(a[1])), (int(b[0]), int(b[1])), (0, 0, 255))
+                cv2.circle(img, (int(b[0]), int(b[1])), 3, (0, 255, 0))
+            cv2.imshow(self.name, img)
+
+        if len(current) < self._min_features:
+            current = self._detect_features(current_image)
+        self._last_kps = current
 
         return self._pose
 
+    def _detect_features(self, image):
+        """Helper method that detects features of an image when tracking.
+
+        :param image: image to detect features in
+        :return: key point coordinates
+        """
+        return np.float32(self._extractor.process(image).features.pts).reshape(-1, 2)
+
     @property
     def feature_type(self):
         return self._feature_type
@@ -303,18 +349,17 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
         :param px_ref: last frame features
         :return: last frame points, same points in current frame
         """
-        kp2, st, err = cv2.calcOpticalFlowPyrLK(image_ref, image_cur, px_ref, None, **self._lk_params)  # shape: [k,2] [k,1] [k,1]
+        kp2, st, err = cv2.calcOpticalFlowPyrLK(image_ref, image_cur, px_ref, None, **self._lk_params)
+        if st is None:
+            # no points were tracked
+            return px_ref[:0], px_ref[:0]
 
-        umat = isinstance(st, cv2.UMat)
-        if umat:
+        if isinstance(st, cv2.UMat):
             st = st.get()
             kp2 = kp2.get()
 
-        st = st.reshape(st.shape[0])
-        kp1 = px_ref[st == 1]
-        kp2 = kp2[st == 1]
-
-        return kp1, kp2
+        st = st.ravel() == 1
+        return px_ref[st], kp2.reshape(-1, 2)[st]
 
     def _match_features(self, featuresA, featuresB):
         """Helper method to match features and filter out outliers.
@@ -323,26 +368,27 @@ class VisualOdometry2DEngine(FeatureMatchingMixin, OdometryBase):
         :param featuresB: Features from current frame
         :return: points from last frame, corresponding points from current frame and descriptors
         """
-        kpsA, descriptorsA, _ = featuresA
-        kpsB, descriptorsB, _ = featuresB
-
-        matches = super(VisualOdometry2DEngine, self)._match_features(descriptorsA, descriptorsB, self._feature_type, self._ratio, self._distance_thresh, self._min_matches)
+        if self._search_radius is not None:
+            R = self._last_pose.rotation if self._last_pose is not None else None
+            predicted = self._predict_rotation(featuresA.pts, R, self._camera.matrix)
+            matches = self._match_guided(featuresA.descriptors, featuresB.descriptors, predicted, featuresB.pts,
+                                         self._search_radius, self._feature_type, self._ratio, self._distance_thresh,
+                                         self._min_matches)
+        else:
+            matches = self._match(featuresA.descriptors, featuresB.descriptors, self._feature_type, self._ratio,
+                                  self._distance_thresh, self._min_matches)
 
-        if matches is None or not matches:
+        if matches is None:
             return None
 
-        ptsA = [kpsA[m.queryIdx].pt for m in matches]
-        ptsB = [kpsB[m.trainIdx].pt for m in matches]
-        mask = [0.5 < p[0] ** 2 + p[1] ** 2 < 200 * 200 for p in ((a[0] - b[0], a[1] - b[1]) for a, b in zip(ptsA, ptsB))]
+        ptsA = matches.query(featuresA)
+        ptsB = matches.train(featuresB)
+        distance = ((ptsA - ptsB) ** 2).sum(axis=1)
+        mask = (0.5 < distance) & (distance < 200 * 200)
 
-        ptsA = np.float32([p for m, p in zip(mask, ptsA) if m])
-        ptsB = np.float32([p for m, p in zip(mask, ptsB) if m])
-
-        if isinstance(descriptorsB, cv2.UMat):
-            descriptors = descriptorsB.get()
-        else:
-            descriptors = descriptorsB
-        descriptors = np.array([descriptors[m.trainIdx] for m in matches], dtype=descriptors.dtype)
+        ptsA = ptsA[mask]
+        ptsB = ptsB[mask]
+        descriptors = matches.train(featuresB.descriptors)[mask]
 
         if len(ptsA) < self._min_matches:
             print("prune fail")
@@ -40,7 +40,8 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
     """
 
     def __init__(self, vision, _map=None, feature_type=None, pose=None, num_features=3000,
-                 min_matches=30, distance_thresh=None, reproj_thresh=None, reproj_error=None, *args, **kwargs):
+                 min_matches=30, distance_thresh=None, reproj_thresh=None, reproj_error=None, search_radius=None,
+                 *args, **kwargs):
         """Instance initialization.
 
         :param vision: capturing source object.
@@ -54,6 +55,8 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
         :param ratio: Lowe's ratio
         :param reproj_thresh: Reprojection threshold
         :param reproj_error: Reprojection Error used in triangulation
+        :param search_radius: Enables guided matching. Features are matched only within this radius in pixels
+            around locations predicted from the last relative pose
         """
         feature_extractor_provided = False
         if not isinstance(vision, ProcessorBase) and not isinstance(vision, VisionBase) and not isinstance(vision, PyroCapture):
@@ -101,6 +104,8 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
 
         self._ratio = 0.7
         self._min_matches = min_matches
+        self._search_radius = search_radius
+        self._last_R = None
 
         if distance_thresh is not None:
             self._distance_thresh = distance_thresh
@@ -113,6 +118,10 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
 
     def setup(self):
         super(VisualOdometry3D2DEngine, self).setup()
+        # key points are in coordinates of undistorted images, e.g. after cropping or undistorting points
+        calibrated = self.vision.get_source('CalibratedCamera')
+        if isinstance(calibrated, CalibratedCamera) and calibrated.undistorted_camera is not None:
+            self._camera = calibrated.undistorted_camera
         if self._map is not None:
             self._map.setup()
 
@@ -138,20 +147,27 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
 
         if len(self._images) == 3 and self._images[-3][1] is not None:
             # TODO filter those features that have similar distance from -3 and -2
-            matches = self._match_features(self._images[-3][1].descriptors, self._images[-1][0].descriptors,
-                                           self._feature_type, self._ratio, self._distance_thresh / 3, self._min_matches)
+            if self._search_radius is not None:
+                if self._last_pose:
+                    predicted = self._predict_projection(self._images[-3][1].points3d, self._last_pose.rotation,
+                                                         self._last_pose.translation, self._camera.matrix)
+                else:
+                    predicted = self._images[-3][1].pts
+                matches = self._match_guided(self._images[-3][1].descriptors, self._images[-1][0].descriptors,
+                                             predicted, self._images[-1][0].pts, self._search_radius,
+                                             self._feature_type, self._ratio, self._distance_thresh / 3,
+                                             self._min_matches)
+            else:
+                matches = self._match(self._images[-3][1].descriptors, self._images[-1][0].descriptors,
+                                      self._feature_type, self._ratio, self._distance_thresh / 3, self._min_matches)
 
-            if matches is None or not matches:
+            if matches is None:
                 print("failed to find matches")
                 return frame, self._pose
 
-            points_3d = np.float32([self._images[-3][1].points3d[m.queryIdx] for m in matches])
-            points_2d = np.float32([self._images[-1][0].points[m.trainIdx].pt for m in matches])
-            if isinstance(self._images[-3][1].descriptors, cv2.UMat):
-                descriptors = self._images[-3][1].descriptors.get()
-            else:
-                descriptors = self._images[-3][1].descriptors
-            descriptors = np.array([descriptors[m.queryIdx] for m in matches], dtype=descriptors.dtype)
+            points_3d = np.float32(matches.query(self._images[-3][1].points3d))
+            points_2d = matches.train(self._images[-1][0])
+            descriptors = matches.query(self._images[-3][1].descriptors)
 
             _r, _t = None, None
             use_rt = False
@@ -196,8 +212,8 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
             if self.debug and featuresA is not None and featuresB is not None:
                 img = cv2.cvtColor(self._images[1][2], cv2.COLOR_GRAY2BGR)
                 img = img.get() if isinstance(img, cv2.UMat) else img
-                last = [kp.pt for kp in featuresA.points]
-                current = [kp.pt for kp in featuresB.points]
+                last = featuresA.pts
+                current = featuresB.pts
                 for i, p in enumerate(zip(last, current)):
                     a, b = p
                     m = i in inliers
@@ -263,9 +279,15 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
         kpsA, descriptorsA, _ = featuresA
         kpsB, descriptorsB, _ = featuresB
 
-        matches = self._match_features(descriptorsA, descriptorsB, self._feature_type, self._ratio, self._distance_thresh, self._min_matches)
+        if self._search_radius is not None:
+            predicted = self._predict_rotation(featuresA.pts, self._last_R, self._camera.matrix)
+            matches = self._match_guided(descriptorsA, descriptorsB, predicted, featuresB.pts, self._search_radius,
+                                         self._feature_type, self._ratio, self._distance_thresh, self._min_matches)
+        else:
+            matches = self._match(descriptorsA, descriptorsB, self._feature_type, self._ratio, self._distance_thresh,
+                                  self._min_matches)
 
-        if matches is None or not matches:
+        if matches is None:
             return None, None
 
         umat_descriptors = isinstance(descriptorsA, cv2.UMat)
@@ -273,20 +295,17 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
             descriptorsA = descriptorsA.get()
             descriptorsB = descriptorsB.get()
 
-        kpsA = [kpsA[m.queryIdx] for m in matches]
-        kpsB = [kpsB[m.trainIdx] for m in matches]
-        mask = [0.5 < p[0] ** 2 + p[1] ** 2 < 200 * 200 for p in ((a.pt[0] - b.pt[0], a.pt[1] - b.pt[1]) for a, b in zip(kpsA, kpsB))]
-        if sum(mask) < self._min_matches:
+        idxA, idxB = matches.query_idx, matches.train_idx
+        distance = ((featuresA.pts[idxA] - featuresB.pts[idxB]) ** 2).sum(axis=1)
+        mask = (0.5 < distance) & (distance < 200 * 200)
+        if mask.sum() < self._min_matches:
             print("prune fail")
             return None, None
 
-        kpsA = [p for M, p in zip(mask, kpsA) if M]
-        kpsB = [p for M, p in zip(mask, kpsB) if M]
-        dA = [descriptorsA[m.queryIdx] for M, m in zip(mask, matches) if M]
-        dB = [descriptorsB[m.trainIdx] for M, m in zip(mask, matches) if M]
+        idxA, idxB = idxA[mask], idxB[mask]
 
-        current = np.float32([kp.pt for kp in kpsB])
-        last = np.float32([kp.pt for kp in kpsA])
+        current = featuresB.pts[idxB]
+        last = featuresA.pts[idxA]
 
         E, mask = cv2.findEssentialMat(current, last, focal=self._camera.focal_point[0], pp=self._camera.center,
                                        method=cv2.RANSAC, prob=0.999, threshold=self._reproj_thresh)
@@ -296,14 +315,17 @@ class VisualOdometry3D2DEngine(FeatureMatchingMixin, OdometryBase):
         if not ret:
             print("recoverPose fail")
             return None, None
+        self._last_R = R
 
-        kpsA = [kp for m, kp in zip(mask, kpsA) if m]
-        kpsB = [kp for m, kp in zip(mask, kpsB) if m]
-        dA = np.array([d for m, d in zip(mask, dA) if m], dtype=descriptorsA.dtype)
-        dB = np.array([d for m, d in zip(mask, dB) if m], dtype=descriptorsB.dtype)
+        inliers = mask.ravel() > 0
+        idxA, idxB = idxA[inliers], idxB[inliers]
+        kpsA = kpsA[idxA]
+        kpsB = kpsB[idxB]
+        dA = descriptorsA[idxA]
+        dB = descriptorsB[idxB]
 
-        last = np.float32([kp.pt for kp in kpsA])
-        current = np.float32([kp.pt for kp in kpsB])
+        last = featuresA.pts[idxA]
+        current = featuresB.pts[idxB]
 
         P1 = np.dot(self._camera.matrix, np.hstack((np.eye(3, 3), np.zeros((3, 1)))))
         P2 = np.dot(self._camera.matrix, np.hstack((R, t)))
@@ -34,10 +34,12 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
     6. return current pose
     """
 
+    STEREO_MATCHING = ('auto', 'full', 'rows', 'disparity')
+
     def __init__(self, vision, _map=None, feature_type=None, pose=None,
                  num_features=None, nlevels=None,
                  ratio=None, distance_thresh=None, reproj_thresh=None, reproj_error=None,
-                 min_dZ=None, max_dZ=None, max_dY=None, max_dX=None,
+                 min_dZ=None, max_dZ=None, max_dY=None, max_dX=None, search_radius=None, stereo_matching='auto',
                  *args, **kwargs):
         """Instance Initialization.
 
@@ -55,20 +57,41 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
         :param max_dZ: maximum feature distance difference for stereo matching
         :param max_dY: maximum feature Y difference for stereo matching
         :param max_dX: maximum feature X difference for stereo matching
+        :param search_radius: Enables guided matching of consecutive frames. Features are matched only within
+            this radius in pixels around last 3d points projected with the last relative pose
+        :param stereo_matching: left-right matching strategy. ``full`` matches all left and right features,
+            ``rows`` matches only features within ``max_dY`` rows and ``(0, max_dX)`` disparity range, which requires
+            rectified images. ``auto`` selects ``rows`` for frames rectified by CalibratedStereoCamera.
+            ``disparity`` samples disparity image of CalibratedStereoCamera with ``calculate_disparity`` set at left
+            key points and reprojects them with Q matrix of the camera. Only left image features are needed then.
+            Disparity must be computed synchronously, i.e. ``async_disparity`` must not be set, as otherwise
+            disparity of the previous frame would be sampled.
         """
 
         if not isinstance(_map, MapBase) and _map is not None:
             raise TypeError("Occupancy Map must be of type MapBase")
+        if stereo_matching not in self.STEREO_MATCHING:
+            raise ValueError("Stereo matching must be one of {}".format("/".join(self.STEREO_MATCHING)))
 
         feature_extractor_provided = False
         if not isinstance(vision, ProcessorBase) and not isinstance(vision, CalibratedStereoCamera) and not isinstance(vision, PyroCapture):
             raise TypeError("Vision must be either CalibratedStereoCamera or ProcessorBase or PyroCapture")
 
         if isinstance(vision, ProcessorBase) or isinstance(vision, PyroCapture):
-            if vision.get_source('CalibratedStereoCamera') is None:
+            stereo_camera = vision.get_source('CalibratedStereoCamera')
+            if stereo_camera is None:
                 raise TypeError("Vision must contain CalibratedStereoCamera")
-
-            if vision.get_source('FeatureExtraction')[0] is not None:
+            if stereo_matching == 'disparity' and isinstance(stereo_camera, CalibratedStereoCamera) and \
+                    stereo_camera.async_disparity:
+                raise ValueError("Disparity stereo matching requires synchronous disparity")
+
+            extractor = vision.get_source('FeatureExtraction')
+            extractor = extractor[0] if isinstance(extractor, tuple) else extractor
+            if stereo_matching == 'disparity' and extractor is not None:
+                # right image features are not used, so only the left image may be processed
+                feature_type = extractor.feature_type
+                feature_extractor_provided = True
+            elif extractor is not None:
                 fe = vision.feature_type
                 assert(fe[0] == fe[1])
 
@@ -91,10 +114,14 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
             defaults.pop('display_results', None)
 
         self._feature_type = feature_type
+        if stereo_matching == 'disparity':
+            defaults['processor_mask'] = '100'
         _vision = FeatureExtraction(vision, feature_type=feature_type, **defaults) if not feature_extractor_provided else vision
 
         self._camera = _vision.camera
         assert(isinstance(self.camera, StereoCamera))
+        if stereo_matching == 'disparity' and self._camera.Q is None:
+            raise ValueError("Camera must have Q matrix for disparity stereo matching")
         self._last_frame = None
         self._pose = pose
         self._last_pose = None
@@ -111,6 +138,8 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
         self._max_dZ = self._dZ * 2
         self._dY = 2
         self._dX = 300
+        self._search_radius = search_radius
+        self._stereo_matching = stereo_matching
 
         if feature_type == 'ORB':
             self._distance_thresh = 120
@@ -158,7 +187,19 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
             print('no frame')
             return None
 
-        stereo_features = self._calculate_3d(frame.images[0].features, frame.images[1].features)
+        if self._stereo_matching == 'disparity':
+            if len(frame.images) < 3:
+                raise ValueError("Disparity stereo matching requires CalibratedStereoCamera with calculate_disparity")
+            stereo_features = self._sample_disparity(frame.images[0].features, frame.images[2].image)
+        else:
+            stereo_features = self._calculate_3d(frame.images[0].features, frame.images[1].features, frame.rectified)
+
+        if stereo_features is None:
+            # not enough stereo features, the next frame starts over
+            self._last_frame = frame
+            self._last_3dfeatures = None
+            print('no stereo features')
+            return frame, self._pose
 
         if self._last_3dfeatures is not None:
             matches = self._match_stereo(self._last_3dfeatures, stereo_features)
@@ -299,16 +340,38 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
         self._last_3dfeatures = stereo_features
         return frame, self._pose
 
-    def _calculate_3d(self, featuresA, featuresB):
+    @property
+    def stereo_matching(self):
+        """Gets/Sets left-right matching strategy"""
+        return self._stereo_matching
+
+    @stereo_matching.setter
+    def stereo_matching(self, value):
+        if value not in self.STEREO_MATCHING:
+            raise ValueError("Stereo matching must be one of {}".format("/".join(self.STEREO_MATCHING)))
+        self._stereo_matching = value
+
+    def _calculate_3d(self, featuresA, featuresB, rectified=False):
         """ Finds stereo correspondances and triangulates the points.
         will return corresponding left/right points and triangulated points
-        :return: (left, right, 3d points) or None
+
+        :param featuresA: left image features
+        :param featuresB: right image features
+        :param rectified: indicates whether the images are rectified, used by ``auto`` stereo matching
+        :return: (left, right, 3d points, left descriptors) or None
         """
         kpsA, descriptorsA, _ = featuresA
         kpsB, descriptorsB, _ = featuresB
-        matches = self._match_features(descriptorsA, descriptorsB, self._feature_type, self._ratio, self._distance_thresh, self._min_matches)
+        if self._stereo_matching == 'rows' or (self._stereo_matching == 'auto' and rectified):
+            # right feature of a rectified pair lies on the same row band, to the left of the left feature
+            matches = self._match_guided(descriptorsA, descriptorsB, featuresA.pts, featuresB.pts,
+                                         (-self._dX, 0, -self._dY, self._dY), self._feature_type, self._ratio,
+                                         self._distance_thresh, self._min_matches)
+        else:
+            matches = self._match(descriptorsA, descriptorsB, self._feature_type, self._ratio, self._distance_thresh,
+                                  self._min_matches)
 
-        if matches is None or not matches:
+        if matches is None:
             return None
 
         umat_descriptors = isinstance(descriptorsA, cv2.UMat)
@@ -316,18 +379,18 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
             descriptorsA = descriptorsA.get()
             descriptorsB = descriptorsB.get()
 
-        kpsA = [kpsA[m.queryIdx] for m in matches]
-        kpsB = [kpsB[m.trainIdx] for m in matches]
-        mask = [abs(a.pt[1] - b.pt[1]) < self._dY and 0 < a.pt[0] - b.pt[0] < self._dX for a, b in zip(kpsA, kpsB)]
+        idxA, idxB = matches.query_idx, matches.train_idx
+        left = featuresA.pts[idxA]
+        right = featuresB.pts[idxB]
+        disparity = left[:, 0] - right[:, 0]
+        mask = (np.abs(left[:, 1] - right[:, 1]) < self._dY) & (0 < disparity) & (disparity < self._dX)
 
-        dA = np.array([descriptorsA[m.queryIdx] for M, m in zip(mask, matches) if M], dtype=descriptorsA.dtype)
-        dB = np.array([descriptorsB[m.trainIdx] for M, m in zip(mask, matches) if M], dtype=descriptorsB.dtype)
+        idxA, idxB = idxA[mask], idxB[mask]
+        dA = descriptorsA[idxA]
+        dB = descriptorsB[idxB]
 
-        kpsA = [p for M, p in zip(mask, kpsA) if M]
-        kpsB = [p for M, p in zip(mask, kpsB) if M]
-
-        left = np.float32([kp.pt for kp in kpsA])
-        right = np.float32([kp.pt for kp in kpsB])
+        left = left[mask]
+        right = right[mask]
 
         if self._camera.left.projection is None or self._camera.left.projection is None:
             P1 = np.dot(self._camera.left.matrix, np.hstack((np.eye(3, 3), np.zeros((3, 1)))))
@@ -345,44 +408,84 @@ class VisualOdometryStereoEngine(FeatureMatchingMixin, OdometryBase):
             dB = cv2.UMat(dB)
         return left, right, point_3d, dA
 
+    def _sample_disparity(self, features, disparity):
+        """Calculates 3d points of left image features from a disparity image.
+        Disparity is sampled at the nearest pixel of every key point, features without valid disparity are dropped.
+        Points are reprojected with Q matrix of the camera.
+
+        :param features: left image features
+        :param disparity: fixed-point disparity image as returned by ``StereoDisparity``, i.e. multiplied by 16
+        :return: (left, right, 3d points, left descriptors) or None
+        """
+        kps, descriptors, _ = features
+        if kps is None or not len(kps):
+            return None
+        disparity = disparity.get() if isinstance(disparity, cv2.UMat) else disparity
+        umat_descriptors = isinstance(descriptors, cv2.UMat)
+        if umat_descriptors:
+            descriptors = descriptors.get()
+
+        pts = np.float32(features.pts)
+        height, width = disparity.shape[:2]
+        x = np.clip(np.rint(pts[:, 0]).astype(np.int32), 0, width - 1)
+        y = np.clip(np.rint(pts[:, 1]).astype(np.int32), 0, height - 1)
+        d = disparity[y, x].astype(np.float32) / 16.0
+        mask = (0 < d) & (d < self._dX)
+        if mask.sum() < self._min_matches:
+            return None
+
+        left = pts[mask]
+        d = d[mask]
+        right = np.stack((left[:, 0] - d, left[:, 1]), axis=1)
+        point_3d = cv2.perspectiveTransform(np.dstack((left[:, 0], left[:, 1], d)), self._camera.Q).reshape(-1, 3)
+
+        dA = descriptors[mask]
+        if umat_descriptors:
+            dA = cv2.UMat(dA)
+        return left, right, point_3d, dA
+
     def _match_stereo(self, last_features, new_features):
         """Matches Last frame features with new frame features.
         Filters matched features based on triangulated points.
 
         :return: (last2d, last3d, last_descr, new2d, new3d, new_descr, last_points_right, new_points_right) or None
         """
-        matches = self._match_features(last_features[3], new_features[3],
-                self._feature_type, self._ratio, self._distance_thresh / 3, self._min_matches)
+        if self._search_radius is not None:
+            if self._last_pose:
+                predicted = self._predict_projection(last_features[2], self._last_pose.rotation,
+                                                     self._last_pose.translation, self._camera.left.matrix)
+            else:
+                predicted = last_features[0]
+            matches = self._match_guided(last_features[3], new_features[3], predicted, new_features[0],
+                                         self._search_radius, self._feature_type, self._ratio,
+                                         self._distance_thresh / 3, self._min_matches)
+        else:
+            matches = self._match(last_features[3], new_features[3],
+                                  self._feature_type, self._ratio, self._distance_thresh / 3, self._min_matches)
 
         if matches is None:
             return None
 
-        last_points_3d = [last_features[2][m.queryIdx] for m in matches]
-        new_points_3d = [new_features[2][m.trainIdx] for m in matches]
+        last_points_3d = matches.query(last_features[2])
+        new_points_3d = matches.train(new_features[2])
 
         dZ = 3 * sum(i[0] ** 2 for i in self._last_pose.translation) ** .5 if self._last_pose else self._dZ
         dZ = min(self._max_dZ, max(self._dZ, dZ))
         self._dZ = dZ
-        mask = [abs(a[2] - b[2]) < dZ for a, b in zip(last_points_3d, new_points_3d)]
+        mask = np.abs(last_points_3d[:, 2] - new_points_3d[:, 2]) < dZ
 
-        if sum(mask) < self._min_matches:
+        if mask.sum() < self._min_matches:
             return None
 
-        new_points_3d = np.float32([p for M, p in zip(mask, new_points_3d) if M])
-        last_points_3d = np.float32([p for M, p in zip(mask, last_points_3d) if M])
-        new_points_2d = np.float32([new_features[0][m.trainIdx] for M, m in zip(mask, matches) if M])
-        new_points_2d_right = np.float32([new_features[1][m.trainIdx] for M, m in zip(mask, matches) if M])
-        last_points_2d = np.float32([last_features[0][m.queryIdx] for M, m in zip(mask, matches) if M])
-        last_points_2d_right = np.float32([last_features[1][m.queryIdx] for M, m in zip(mask, matches) if M])
-
-        if isinstance(last_features[3], cv2.UMat):
-            last_descriptors = last_features[3].get()
-            new_descriptors = new_features[3].get()
-        else:
-            last_descriptors = last_features[3]
-            new_descriptors = new_features[3]
-        last_descriptors = np.array([last_descriptors[m.queryIdx] for M, m in zip(mask, matches) if M], dtype=last_descriptors.dtype)
-        new_descriptors = np.array([new_descriptors[m.trainIdx] for M, m in zip(mask, matches) if M], dtype=new_descriptors.dtype)
+        matches = matches.subset(mask)
+        new_points_3d = np.float32(new_points_3d[mask])
+        last_points_3d = np.float32(last_points_3d[mask])
+        new_points_2d = np.float32(matches.train(new_features[0]))
+        new_points_2d_right = np.float32(matches.train(new_features[1]))
+        last_points_2d = np.float32(matches.query(last_features[0]))
+        last_points_2d_right = np.float32(matches.query(last_features[1]))
+        last_descriptors = matches.query(last_features[3])
+        new_descriptors = matches.train(new_features[3])
 
         return last_points_2d, last_points_3d, last_descriptors, new_points_2d, new_points_3d, new_descriptors, last_points_2d_right, new_points_2d_right
 
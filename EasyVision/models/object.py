@@ -6,6 +6,7 @@
 from .base import *
 from collections import namedtuple
 from EasyVision.vision import Image, Frame
+from EasyVision.processors import KeyPoints
 import cv2
 import numpy as np
 
@@ -98,8 +99,8 @@ class ObjectModel(ModelBase):
 
             thumb = thumb[y:y + h, x:x + w]
             outline = np.float32([(i[0][0] - x, i[0][1] - y) for i in outline])
-            kp = [p._replace(pt=(p.pt[0] - x, p.pt[1] - y)) for p in image.features.points]
-            features = image.features._replace(points=kp)
+            points = image.features.points
+            features = image.features._replace(points=KeyPoints(points.pts - (x, y), points.attrs))
         else:
             h, w, _ = image.image.shape
             pts = (
@@ -186,7 +187,7 @@ class ObjectModel(ModelBase):
             self._views += [ModelView(thumb, outline, features, image.feature_type)]
             return self
 
-        N = max(views, key=lambda x: len(x.matches))
+        N = max(view.matches.count for view in views)
         if N <= len(image.features.points) / 3:
             self.views += [ModelView(thumb, outline, features, image.feature_type)]
             return self
@@ -211,13 +212,13 @@ class ObjectModel(ModelBase):
         outline = view.outline
         _outline = outline.reshape((-1, 1, 2))
 
-        matches = matcher._match_features(descriptorsA, descriptorsB, view.feature_type, min_matches=self._min_matches, **kwargs)
+        matches = matcher._match(descriptorsA, descriptorsB, view.feature_type, min_matches=self._min_matches, **kwargs)
 
-        if matches is None or len(matches) < self._min_matches:
+        if matches is None:
             return None
 
-        ptsA = np.float32([kpsA[m.queryIdx].pt for m in matches])
-        ptsB = np.float32([kpsB[m.trainIdx].pt for m in matches])
+        ptsA = matches.query(image.features)
+        ptsB = matches.train(view.features)
 
         results = ()
 
@@ -227,23 +228,29 @@ class ObjectModel(ModelBase):
             if H is None:
                 return results
 
-            if sum(inliers) < self._min_matches or sum(inliers) < len(descriptorsB) * .01:
+            inliers = inliers.ravel() > 0
+            if inliers.sum() < self._min_matches or inliers.sum() < len(descriptorsB) * .01:
                 return results
 
             __outline = cv2.perspectiveTransform(_outline, H)
-            inside = [inlier and cv2.pointPolygonTest(__outline, (pt[0], pt[1]), False) >= 0 for inlier, pt in zip(inliers, ptsA)]
+            inside = inliers & ObjectModel._inside(__outline, ptsA)
 
-            if sum(inside) < self._min_matches:
+            if inside.sum() < self._min_matches:
                 return results
 
-            _matches = [m for i, m in zip(inside, matches) if i]
-            matches = [m for i, m in zip(inside, matches) if not i]
-            ptsA = np.float32([pt for i, pt in zip(inside, ptsA) if not i])
-            ptsB = np.float32([pt for i, pt in zip(inside, ptsB) if not i])
-            results += (MatchResult(self, view, image, _matches, H, __outline),)
+            results += (MatchResult(self, view, image, matches.subset(inside), H, __outline),)
+            matches = matches.subset(~inside)
+            ptsA = ptsA[~inside]
+            ptsB = ptsB[~inside]
 
         return results
 
+    @staticmethod
+    def _inside(outline, pts):
+        """Helper method that tests which points are inside of an outline polygon"""
+        return np.array([cv2.pointPolygonTest(outline, (float(x), float(y)), False) >= 0 for x, y in pts.tolist()],
+                        dtype=bool)
+
     def _draw(self, view_matches):
         """Helper method to draw matches"""
         for index, match in enumerate(view_matches):
@@ -254,6 +261,6 @@ class ObjectModel(ModelBase):
                                flags=2)
             res = cv2.drawMatches(match.image.image, match.image.features.keypoints,
                                   match.view.image, match.view.features.keypoints,
-                                  match.matches, None, **params)
+                                  match.matches.todmatches(), None, **params)
             res = cv2.polylines(res, [np.int32(match.outline)], True, [255, 0, 0], 3, 8)
             cv2.imshow(name, res)
\ No newline at end of file
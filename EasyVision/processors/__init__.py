@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
-from .base import Features, KeyPoint
+from .base import Features, KeyPoint, KeyPoints, BufferPool
 
-from .featureextractor import FeatureExtraction, FeatureMatchingMixin
+from .featureextractor import FeatureExtraction, FeatureMatchingMixin, FeatureBudget, Matches, MatcherConfig, \
+    autotune_matcher
 from .blobextractor import BlobExtraction, Blobs
 from .calibratedcamera import CalibratedCamera, PinholeCamera
 from .calibratedstereocamera import CalibratedStereoCamera, StereoCamera
+from .disparity import StereoDisparity
 from .imagetransform import ImageTransform
 from .histogrambackprojection import HistogramBackprojection
 from .backgroundseparation import BackgroundSeparation
 from .mptransform import MultiProcessing
 from .mttransform import MultiThreading
 from .mctransform import MultiConsumers
+from .pipeline import Pipeline
 from .synchronization import Synchronize
@@ -53,10 +53,10 @@ class BackgroundSeparation(ProcessorBase):
     def process(self, image):
         lr = 0 if self._background_num > self._max_background_num else .9
         mask = self._subtractor.apply(image.image, learningRate=lr)
-        mask = cv2.filter2D(mask, -1, self._disc)
-        _, mask = cv2.threshold(mask, 100, 255, 0)
+        mask = cv2.filter2D(mask, -1, self._disc, dst=self.buffers.get_like(mask))
+        _, mask = cv2.threshold(mask, 100, 255, 0, dst=mask)
         if image.mask is not None:
-            mask = cv2.bitwise_and(mask, image.mask)
+            mask = cv2.bitwise_and(mask, image.mask, dst=mask)
         self._background_num += 1
         if self.display_results:
              cv2.imshow("%s" % self.name, mask)
@@ -6,6 +6,11 @@ Can also be used to build processor stacks with the help of Processor Stack Buil
 """
 
 from EasyVision.vision.base import *
+from EasyVision.vision.capturegroup import CaptureGroup
+from EasyVision import codec
+from multiprocessing.pool import ThreadPool
+import threading as mt
+import sys
 import cv2
 import numpy as np
 
@@ -14,11 +19,6 @@ try:
 except:
     pass
 
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
 
 class KeyPoint(namedtuple('KeyPoint', 'pt size angle response octave class_id')):
     """KeyPoint struct that mirrors cv2.KeyPoint. Mainly used for serialization as pickle does not understand cv2.KeyPoint.
@@ -35,35 +35,153 @@ class KeyPoint(namedtuple('KeyPoint', 'pt size angle response octave class_id'))
         return KeyPoint(**d)
 
 
+class KeyPoints(object):
+    """Compact array-backed sequence of key points.
+
+    Point coordinates are stored as a contiguous float32 Nx2 array, that is exposed as ``pts``, so that it can be
+    sliced and passed to OpenCV directly. The rest of key point fields are stored in a structured array.
+    Indexing with an integer returns ``KeyPoint``, indexing with a slice, mask or index array returns ``KeyPoints``.
+    A list of ``cv2.KeyPoint`` is created lazily and cached.
+    """
+    __slots__ = ('_pts', '_attrs', '_keypoints')
+
+    DTYPE = np.dtype([('size', np.float32), ('angle', np.float32), ('response', np.float32),
+                      ('octave', np.int32), ('class_id', np.int32)])
+
+    def __init__(self, pts, attrs=None, keypoints=None):
+        """KeyPoints instance initialization
+
+        :param pts: Nx2 array of point coordinates
+        :param attrs: structured array of ``KeyPoints.DTYPE`` with the rest of key point fields
+        :param keypoints: optional list of cv2.KeyPoint objects, that correspond to the points
+        """
+        self._pts = np.ascontiguousarray(pts, dtype=np.float32).reshape(-1, 2)
+        if attrs is None:
+            attrs = np.zeros(len(self._pts), dtype=self.DTYPE)
+            attrs['class_id'] = -1
+        self._attrs = attrs
+        self._keypoints = keypoints
+
+    @staticmethod
+    def fromkeypoints(keypoints):
+        """Creates KeyPoints object from a list of cv2.KeyPoint or KeyPoint objects"""
+        keypoints = list(keypoints)
+        attrs = np.array([(kp.size, kp.angle, kp.response, kp.octave, kp.class_id) for kp in keypoints],
+                         dtype=KeyPoints.DTYPE)
+        if len(keypoints) and isinstance(keypoints[0], cv2.KeyPoint):
+            return KeyPoints(cv2.KeyPoint_convert(keypoints), attrs, keypoints)
+        return KeyPoints([kp.pt for kp in keypoints], attrs)
+
+    @property
+    def pts(self):
+        """Contiguous float32 Nx2 array of point coordinates"""
+        return self._pts
+
+    @property
+    def attrs(self):
+        """Structured array of the rest of key point fields"""
+        return self._attrs
+
+    @property
+    def sizes(self):
+        return self._attrs['size']
+
+    @property
+    def angles(self):
+        return self._attrs['angle']
+
+    @property
+    def responses(self):
+        return self._attrs['response']
+
+    @property
+    def octaves(self):
+        return self._attrs['octave']
+
+    @property
+    def class_ids(self):
+        return self._attrs['class_id']
+
+    @property
+    def keypoints(self):
+        """Returns a cached list of cv2.KeyPoint items"""
+        if self._keypoints is None:
+            self._keypoints = [cv2.KeyPoint(x=float(x), y=float(y), size=float(a['size']), angle=float(a['angle']),
+                                            response=float(a['response']), octave=int(a['octave']),
+                                            class_id=int(a['class_id']))
+                               for (x, y), a in zip(self._pts.tolist(), self._attrs)]
+        return self._keypoints
+
+    def __len__(self):
+        return len(self._pts)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            x, y = self._pts[index].tolist()
+            a = self._attrs[index]
+            return KeyPoint((x, y), float(a['size']), float(a['angle']), float(a['response']),
+                            int(a['octave']), int(a['class_id']))
+        return KeyPoints(self._pts[index], self._attrs[index])
+
+    def __eq__(self, other):
+        return isinstance(other, KeyPoints) and np.array_equal(self._pts, other._pts) and \
+            np.array_equal(self._attrs, other._attrs)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "KeyPoints({})".format(len(self))
+
+    def __reduce__(self):
+        """Used for pickle serialization. cv2.KeyPoint cache is not serialized."""
+        return self.__class__, (self._pts, self._attrs)
+
+
 class Features(namedtuple('Features', 'points descriptors points3d')):
     """Image Features structure.
-    Contains feature points either as 2d points or KeyPoint, descriptors and associated 3d points.
+    Contains feature points either as 2d points or KeyPoints, descriptors and associated 3d points.
     Basically points can be anything.
+    Key points are stored as ``KeyPoints``, so coordinates of any kind of points are accessible as ``pts`` array.
+    Points and descriptors may be None if only 3d points are present, e.g. a dense point cloud of a disparity map.
     """
     __slots__ = ()
 
     def __new__(cls, points, descriptors, points3d=None):
-        if len(points) and hasattr(points[0], 'pt'):
-            points = tuple(KeyPoint(pt.pt, pt.size, pt.angle, pt.response, pt.octave, pt.class_id) for pt in points)
+        if points is None or isinstance(points, KeyPoints):
+            pass
+        elif len(points) and hasattr(points[0], 'pt'):
+            points = KeyPoints.fromkeypoints(points)
         elif not isinstance(points, np.ndarray):
             points = np.float32(points)
         if not isinstance(points3d, np.ndarray) and points3d is not None:
             points3d = np.float32(points3d)
         return super(Features, cls).__new__(cls, points, descriptors, points3d)
 
+    @property
+    def pts(self):
+        """Returns point coordinates as float32 Nx2 array"""
+        return self.points.pts if isinstance(self.points, KeyPoints) else self.points
+
     @property
     def keypoints(self):
         """Returns a list of cv2.KeyPoint items for displaying purposes"""
-        return [cv2.KeyPoint(x=pt.pt[0], y=pt.pt[1], _size=pt.size, _angle=pt.angle,
-                             _response=pt.response, _octave=pt.octave, _class_id=pt.class_id) for pt in self.points]
+        if isinstance(self.points, KeyPoints):
+            return self.points.keypoints
+        return [cv2.KeyPoint(x=float(x), y=float(y), size=1) for x, y in np.reshape(self.points, (-1, 2)).tolist()]
 
     def todict(self):
         """Converts Features into a dictionary"""
         d = {
-            'points': [pt.todict() for pt in self.points] if len(points) and isinstance(points[0], KeyPoint) else self.points.tolist(),
-            'points3d': self.points.tolist(),
-            'descriptors': self.descriptors.tolist(),
-            'dtype': self.descriptors.dtype.name
+            'points': [pt.todict() for pt in self.points] if isinstance(self.points, KeyPoints) else
+                      self.points.tolist() if self.points is not None else None,
+            'points3d': self.points3d.tolist() if self.points3d is not None else None,
+            'descriptors': self.descriptors.tolist() if self.descriptors is not None else None,
+            'dtype': self.descriptors.dtype.name if self.descriptors is not None else None
         }
         return d
 
@@ -71,34 +189,96 @@ class Features(namedtuple('Features', 'points descriptors points3d')):
     def fromdict(d):
         """Creates Features object from a dictionary"""
         pts = d['points']
-        if len(pts) and isinstance(pts[0], dict):
+        if pts is not None and len(pts) and isinstance(pts[0], dict):
             points = [KeyPoint.fromdict(pt) for pt in pts]
         else:
             points = pts
-        descriptors = np.array(d['descriptors'], dtype=np.dtype(d['dtype']))
+        descriptors = np.array(d['descriptors'], dtype=np.dtype(d['dtype'])) if d['descriptors'] is not None else None
         return Features(points, descriptors, d['points3d'])
 
     def tobytes(self):
-        """Uses pickle to serialize Features into bytes"""
-        return pickle.dumps(self, protocol=-1)
+        """Uses ``EasyVision.codec`` to serialize Features into bytes"""
+        return codec.dumps(self)
 
     @staticmethod
     def frombytes(data):
-        """Uses pickle to deserialize Features from bytes"""
-        return pickle.loads(data)
+        """Uses ``EasyVision.codec`` to deserialize Features from bytes"""
+        return codec.loads(data)
 
     def tobuffer(self, buf):
-        """Uses pickle to serialize Features to buffer-like object"""
-        pickle.dump(self, buf, protocol=-1)
+        """Uses ``EasyVision.codec`` to serialize Features to buffer-like object"""
+        codec.dump(self, buf)
 
     @staticmethod
     def frombuffer(buf):
-        """Uses pickle to deserialize Features from buffer-like object"""
-        return pickle.load(buf)
+        """Uses ``EasyVision.codec`` to deserialize Features from buffer-like object"""
+        return codec.load(buf)
 
     def __reduce__(self):
         """Used for pickle serialization in order to deal with UMat descriptors"""
-        return self.__class__, (self.points, self.descriptors.get() if isinstance(self.descriptors, cv2.UMat) else self.descriptors)
+        descriptors = self.descriptors.get() if isinstance(self.descriptors, cv2.UMat) else self.descriptors
+        return self.__class__, (self.points, descriptors, self.points3d)
+
+
+class BufferPool(object):
+    """Pool of reusable output arrays keyed by shape and dtype. Mainly used for ``dst`` arguments of OpenCV functions.
+
+    A buffer is handed out again only when nothing but the pool references it, i.e. after all the frames, images
+    and views that used it were released downstream. So a buffer is never overwritten while it is still in use.
+    In a steady state capturing loop no large arrays are allocated.
+    If all pooled buffers of a key are in use, a new untracked array is returned.
+
+    .. note::
+        Tracking relies on reference counting, so on Python implementations without it buffers are never reused.
+    """
+
+    def __init__(self, max_buffers=8):
+        """BufferPool instance initialization
+
+        :param max_buffers: maximum number of pooled buffers per shape and dtype
+        """
+        self._max_buffers = max_buffers
+        self._buffers = {}
+        self._lock = mt.Lock()
+
+    @staticmethod
+    def _refcount(buffers, index):
+        """Helper method that returns reference count of a pooled buffer"""
+        return sys.getrefcount(buffers[index]) if hasattr(sys, 'getrefcount') else sys.maxsize
+
+    def get(self, shape, dtype=np.uint8):
+        """Returns a free buffer of specified shape and dtype. Contents of the buffer are undefined.
+
+        :param shape: shape of the buffer
+        :param dtype: dtype of the buffer
+        :return: ndarray
+        """
+        dtype = np.dtype(dtype)
+        key = (tuple(shape), dtype.str)
+        with self._lock:
+            buffers = self._buffers.setdefault(key, [])
+            for i in range(len(buffers)):
+                if self._refcount(buffers, i) <= _FREE_REFCOUNT:
+                    return buffers[i]
+            buf = np.empty(shape, dtype=dtype)
+            if len(buffers) < self._max_buffers:
+                buffers.append(buf)
+            return buf
+
+    def get_like(self, array, shape=None, dtype=None):
+        """Returns a free buffer with the same shape and dtype as array, unless they are overridden."""
+        return self.get(array.shape if shape is None else shape, array.dtype if dtype is None else dtype)
+
+    def clear(self):
+        """Drops all pooled buffers"""
+        with self._lock:
+            self._buffers = {}
+
+    def __len__(self):
+        return sum(len(buffers) for buffers in self._buffers.values())
+
+
+_FREE_REFCOUNT = BufferPool._refcount([np.empty(0)], 0)
 
 
 class ProcessorBase(VisionBase):
@@ -108,6 +288,13 @@ class ProcessorBase(VisionBase):
     Mask is a string of '1' and '0', where index of the mask is the same as the index of frame image.
     Processor mask will override frame processor mask.
 
+    If ``parallel_images`` is set, images of a frame are processed concurrently in a thread pool.
+    This mostly benefits multi image frames, e.g. stereo, as most of OpenCV functions release the GIL.
+    Note, that ``process`` must be thread safe in that case.
+
+    Output arrays should be taken from ``buffers`` pool and passed as ``dst`` arguments, so that they are reused
+    once downstream stages have released previous frames.
+
     Abstract methods:
         process
 
@@ -120,7 +307,8 @@ class ProcessorBase(VisionBase):
         in ``__init__`` method. All internal attributes should be starting from "_", e.g. ``self._my_internal_var = 0``.
     """
 
-    def __init__(self, vision, processor_mask=None, append=False, null_image=False, enabled=True, *args, **kwargs):
+    def __init__(self, vision, processor_mask=None, append=False, null_image=False, enabled=True,
+                 parallel_images=False, executor=None, *args, **kwargs):
         """Instance initialization. Must be called using super().__init__(*args, *kwargs)
 
         :param vision: capturing source object.
@@ -128,6 +316,10 @@ class ProcessorBase(VisionBase):
         :param append: indicates whether to replace images or append to the frame
         :param null_image: indicates whether to set image.image to None for processed image
         :param enabled: indicates whether to run processing
+        :param parallel_images: indicates whether to process frame images in parallel.
+            If an integer is passed, it specifies the number of worker threads.
+        :param executor: an optional shared executor with ``map`` method, e.g. ThreadPool, that will be used to
+            process images in parallel. It is not released by the processor.
         """
         if not isinstance(vision, VisionBase) and vision is not None:
             raise TypeError("Vision object must be of type VisionBase")
@@ -136,6 +328,10 @@ class ProcessorBase(VisionBase):
         self._enabled = True
         self._append = append
         self._null_image = null_image
+        self._parallel_images = parallel_images
+        self._executor = executor
+        self._pool = None
+        self._buffers = BufferPool()
         self.enabled = enabled
         super(ProcessorBase, self).__init__(*args, **kwargs)
 
@@ -151,7 +347,29 @@ class ProcessorBase(VisionBase):
 
     def capture(self):
         super(ProcessorBase, self).capture()
-        frame = self._vision.capture()
+        return self._process_frame(self._vision.capture())
+
+    def grab(self):
+        """Grabs a frame from the source. Processors that override ``capture`` do not grab anything,
+        so that their ``retrieve`` captures the whole frame."""
+        if self._overrides_capture():
+            return True
+        return self._vision.grab()
+
+    def retrieve(self):
+        """Retrieves a frame grabbed by the source and processes it"""
+        if self._overrides_capture():
+            return self.capture()
+        super(ProcessorBase, self).capture()
+        return self._process_frame(self._vision.retrieve())
+
+    def _overrides_capture(self):
+        """Helper method that checks whether derived class implements its own ``capture``"""
+        return getattr(self.__class__.capture, '__func__', self.__class__.capture) is not \
+            getattr(ProcessorBase.capture, '__func__', ProcessorBase.capture)
+
+    def _process_frame(self, frame):
+        """Helper method that calls ``process`` for every image in the frame according to processor mask"""
         if not self.enabled:
             return frame
         elif frame:
@@ -162,23 +380,42 @@ class ProcessorBase(VisionBase):
             processor_mask = self._processor_mask if self._processor_mask is not None else frame.processor_mask
             if processor_mask is None:
                 processor_mask = "1" * len(frame.images)
+            executor = self._executor or self._pool
+            if executor is not None and processor_mask[:len(frame.images)].count("1") > 1:
+                selected = [img for m, img in zip(processor_mask, frame.images) if m != "0"]
+                processed = iter(list(executor.map(self.process, selected)))
+                process = lambda x: next(processed)
+            else:
+                process = self.process
             if not self._append:
-                images = tuple(m == "0" and img or postprocess(self.process(img)) for m, img in zip(processor_mask, frame.images))
+                images = tuple(m == "0" and img or postprocess(process(img)) for m, img in zip(processor_mask, frame.images))
             else:
-                images = tuple(postprocess(self.process(img)) for m, img in zip(processor_mask, frame.images) if m != "0")
+                images = tuple(postprocess(process(img)) for m, img in zip(processor_mask, frame.images) if m != "0")
                 images = frame.images + images
             return frame._replace(images=images)
 
     def setup(self):
         if self._vision is not None:
             self._vision.setup()
+        if self._parallel_images and self._executor is None:
+            self._pool = ThreadPool(None if self._parallel_images is True else int(self._parallel_images))
         super(ProcessorBase, self).setup()
 
     def release(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._buffers.clear()
         if self._vision is not None:
             self._vision.release()
         super(ProcessorBase, self).release()
 
+    @property
+    def buffers(self):
+        """Returns a pool of reusable output arrays for this processor"""
+        return self._buffers
+
     @property
     def source(self):
         """Returns a source for this processor"""
@@ -188,7 +425,7 @@ class ProcessorBase(VisionBase):
         """Recursively searches for a source class by class name"""
         if self.__class__.__name__ == name:
             return self
-        elif isinstance(self._vision, ProcessorBase) or self._vision.__class__.__name__ == 'CameraPairProxy':
+        elif isinstance(self._vision, ProcessorBase) or isinstance(self._vision, CaptureGroup):
             return self._vision.get_source(name)
         elif self._vision.__class__.__name__ == name:
             return self._vision
@@ -9,9 +9,6 @@ from .histogrambackprojection import HistogramBackprojection
 from collections import namedtuple
 
 
-KeyPoint = namedtuple('KeyPoint', ['pt', 'size', 'angle', 'response', 'octave', 'class_id'])
-
-
 class Blobs(namedtuple('Features', ['points', 'descriptors'])):
     """Structure that contains blob information and mirrors Features class.
 
@@ -19,15 +16,17 @@ class Blobs(namedtuple('Features', ['points', 'descriptors'])):
     """
     __slots__ = ()
 
+    @property
+    def pts(self):
+        return self.points.pts
+
     @property
     def keypoints(self):
-        return [cv2.KeyPoint(x=pt.pt[0], y=pt.pt[1], _size=pt.size, _angle=pt.angle,
-                             _response=pt.response, _octave=pt.octave, _class_id=pt.class_id) for pt in self.points]
+        return self.points.keypoints
 
     @classmethod
     def _make(cls, keypoints, descriptors):
-        points = [KeyPoint(pt.pt, pt.size, pt.angle, pt.response, pt.octave, pt.class_id) for pt in keypoints]
-        return super(Blobs, cls)._make((points, descriptors))
+        return super(Blobs, cls)._make((KeyPoints.fromkeypoints(keypoints), descriptors))
 
 
 class BlobExtraction(ProcessorBase):
@@ -5,9 +5,162 @@
 
 import cv2
 import numpy as np
+import hashlib
+import os
+from multiprocessing import Pool
 from .base import *
 
 
+CHESSBOARD_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+def find_chessboard_corners(image, grid_shape, max_size=1024):
+    """Finds chessboard corners in an image. Detection is done on a downscaled image with ``CALIB_CB_FAST_CHECK``,
+    so that images without the pattern are rejected quickly. Found corners are refined at full resolution.
+
+    :param image: either grayscale/BGR image or a path to an image file
+    :param grid_shape: shape of the calibration pattern
+    :param max_size: maximum image width or height the detection is run at
+    :return: a tuple of (found, corners, image size)
+    """
+    gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE) if isinstance(image, string_types) else image
+    if gray is None:
+        raise IOError("Could not read image {}".format(image))
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    size = gray.shape[::-1]
+
+    scale = min(1.0, float(max_size) / max(size)) if max_size else 1.0
+    small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ret, corners = cv2.findChessboardCorners(small, grid_shape, None, CHESSBOARD_FLAGS)
+    if not ret:
+        return False, None, size
+
+    corners /= scale
+    window = int(round(5 / scale)) + 1
+    corners = cv2.cornerSubPix(gray, corners, (window, window), (-1, -1), SUBPIX_CRITERIA)
+    return True, corners, size
+
+
+def _find_chessboard_corners(args):
+    """Helper function for running ``find_chessboard_corners`` in a process pool"""
+    return find_chessboard_corners(*args)
+
+
+def find_chessboard_corners_batch(images, grid_shape, max_size=1024, processes=None):
+    """Finds chessboard corners in many images in parallel using a process pool.
+
+    :param images: a list of image paths or images
+    :param grid_shape: shape of the calibration pattern
+    :param max_size: maximum image width or height the detection is run at
+    :param processes: number of processes. Defaults to the number of CPUs. 1 disables the pool.
+    :return: a list of (found, corners, image size) tuples in the same order as images
+    """
+    jobs = [(image, grid_shape, max_size) for image in images]
+    if processes == 1 or len(jobs) < 2:
+        return [_find_chessboard_corners(job) for job in jobs]
+    pool = Pool(processes)
+    try:
+        return pool.map(_find_chessboard_corners, jobs, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+COVERAGE_GRID = 4
+SCALE_LEVELS = 3
+TILT_STEP = 0.2
+OUTLIER_FACTOR = 2.0
+MIN_VIEWS = 4
+
+
+def _coverage_bins(objp, corners, shape, camera=0):
+    """Helper function that returns a set of coverage bins a detected calibration pattern falls into.
+    Bins describe image cells covered by the pattern, its scale relative to the image and tilt in x and y."""
+    pts = corners.reshape(-1, 2).astype(np.float64)
+    size = np.float64(shape)
+    cells = np.minimum(np.int32(pts / size * COVERAGE_GRID), COVERAGE_GRID - 1)
+    bins = set((camera, 'cell', x, y) for x, y in np.unique(cells, axis=0))
+
+    extent = pts.max(axis=0) - pts.min(axis=0)
+    scale = np.hypot(*extent) / np.hypot(*size)
+    bins.add((camera, 'scale', min(int(scale * SCALE_LEVELS), SCALE_LEVELS - 1)))
+
+    # perspective terms of pattern to image homography in normalized coordinates describe the tilt of the pattern
+    obj = objp.reshape(-1, 3)[:, :2].astype(np.float64)
+    obj = (obj - obj.min(axis=0)) / np.maximum(obj.max(axis=0) - obj.min(axis=0), 1e-9)
+    H, _ = cv2.findHomography(obj, pts / size)
+    if H is not None:
+        H /= H[2, 2]
+        bins.add((camera, 'tilt', int(np.clip(np.round(H[2, 0] / TILT_STEP), -1, 1)),
+                  int(np.clip(np.round(H[2, 1] / TILT_STEP), -1, 1))))
+    return bins
+
+
+def _view_errors(objpoints, imgpoints, shape):
+    """Helper function that calibrates a camera and returns RMS reprojection error of every view"""
+    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, shape, None, None)
+    errors = []
+    for objp, corners, rvec, tvec in zip(objpoints, imgpoints, rvecs, tvecs):
+        projected, _ = cv2.projectPoints(objp, rvec, tvec, mtx, dist)
+        errors.append(np.sqrt(np.mean(np.sum((projected.reshape(-1, 2) - corners.reshape(-1, 2)) ** 2, axis=1))))
+    return np.float64(errors)
+
+
+def select_calibration_views(objpoints, imgpoints, shape, max_views=None, refine=0):
+    """Selects a subset of calibration views, so that calibration solve time stays bounded for many samples.
+
+    Views are binned by pattern position in the image, its scale and tilt. Then views are greedily selected one
+    by one, preferring those that cover the most new bins and then those that fall into the least covered bins,
+    so nearly duplicate views are skipped.
+    Optionally calibration is run ``refine`` times on selected views and views with reprojection error
+    much higher than the median are dropped.
+
+    :param objpoints: a list of calibration pattern object points
+    :param imgpoints: a list of detected corners of every view. For stereo a list of (left, right) tuples.
+    :param shape: image size (width, height)
+    :param max_views: maximum number of views to select. None selects all views
+    :param refine: number of outlier rejection iterations
+    :return: a sorted list of selected view indices
+    """
+    views = [corners if isinstance(corners, tuple) else (corners,) for corners in imgpoints]
+    indices = list(range(len(views)))
+
+    if max_views is not None and len(views) > max_views:
+        # bins are sorted, so that scores do not depend on set iteration order
+        bins = [sorted(set.union(*(_coverage_bins(objp, corners, shape, camera)
+                                   for camera, corners in enumerate(view))), key=repr)
+                for objp, view in zip(objpoints, views)]
+        counts = {}
+        selected = []
+        while len(selected) < max_views:
+            best = max(indices, key=lambda i: (sum(b not in counts for b in bins[i]),
+                                               sum(1.0 / (1 + counts.get(b, 0)) for b in bins[i])))
+            selected.append(best)
+            indices.remove(best)
+            for b in bins[best]:
+                counts[b] = counts.get(b, 0) + 1
+        indices = sorted(selected)
+
+    for _ in range(refine):
+        errors = np.max([_view_errors([objpoints[i] for i in indices], [views[i][camera] for i in indices], shape)
+                         for camera in range(len(views[0]))], axis=0)
+        keep = errors <= OUTLIER_FACTOR * np.median(errors)
+        if keep.all() or keep.sum() < MIN_VIEWS:
+            break
+        indices = [i for i, k in zip(indices, keep) if k]
+    return indices
+
+
+def chessboard_object_points(grid_shape, square_size):
+    """Returns object points of the calibration pattern, like (0,0,0), (1,0,0), (2,0,0) ....,(6,5,0)"""
+    objp = np.zeros((np.prod(grid_shape), 3), np.float32)
+    objp[:, :2] = np.indices(grid_shape).T.reshape(-1, 2)
+    objp *= square_size
+    return objp
+
+
 class PinholeCamera(namedtuple('PinholeCamera', ['size', 'matrix', 'distortion', 'rectify', 'projection'])):
     """Pinhole Camera model for calibrated camera processor.
 
@@ -52,6 +205,14 @@ class PinholeCamera(namedtuple('PinholeCamera', ['size', 'matrix', 'distortion',
         """Image center in pixels"""
         return (self.matrix[0, 2], self.matrix[1, 2])
 
+    @property
+    def digest(self):
+        """Hash of camera parameters as a hex string. Used as a key for cached undistortion maps."""
+        h = hashlib.sha1(repr(tuple(self.size)).encode())
+        for value in (self.matrix, self.distortion, self.rectify, self.projection):
+            h.update(b'|' if value is None else np.ascontiguousarray(value, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
     @staticmethod
     def fromdict(as_dict):
         """Creates camera object from dict"""
@@ -102,9 +263,23 @@ class PinholeCamera(namedtuple('PinholeCamera', ['size', 'matrix', 'distortion',
 class CalibratedCamera(ProcessorBase):
     """Class implementing Calibrated Camera undistort/rectify and calibration using rectangular calibration pattern.
 
+    Undistortion maps are converted to the fixed-point representation (CV_16SC2 + CV_16UC1), that halves memory
+    traffic of ``remap``. If ``map_cache`` directory is set, maps are saved there and loaded on the next ``setup``
+    instead of being recomputed. Cached maps are keyed by ``PinholeCamera.digest`` and map options.
+
+    If ``alpha`` is set, new camera matrix is computed with ``getOptimalNewCameraMatrix``. With ``crop`` output
+    images are cropped to the valid pixels ROI. Camera model of output images is available as ``undistorted_camera``.
+
+    In ``points`` mode images are passed through untouched and no remapping is done. Instead ``FeatureExtraction``
+    processors stacked on top undistort coordinates of extracted key points with ``undistort_points``.
+    Resulting coordinates are the same as if features were extracted from undistorted images.
     """
 
-    def __init__(self, vision, camera, grid_shape=(7, 6), square_size=20, max_samples=20, frame_delay=1, *args, **kwargs):
+    MODES = ('image', 'points')
+
+    def __init__(self, vision, camera, grid_shape=(7, 6), square_size=20, max_samples=20, frame_delay=1,
+                 interpolation=cv2.INTER_NEAREST, fixed_point=True, alpha=None, crop=False, map_cache=None,
+                 mode='image', max_views=None, refine=0, *args, **kwargs):
         """CalibratedCamera instance initialization
 
         :param vision: source vision object
@@ -113,7 +288,19 @@ class CalibratedCamera(ProcessorBase):
         :param square_size: size of the calibration pattern element e.g. in mm.
         :param max_samples: number of samples to collect for calibration
         :param frame_delay: how many frames to skip. Useful online calibration using camera.
+        :param interpolation: interpolation used for ``remap``, e.g. ``cv2.INTER_LINEAR``
+        :param fixed_point: indicates whether to use fixed-point undistortion maps
+        :param alpha: free scaling parameter for ``getOptimalNewCameraMatrix`` between 0 (only valid pixels)
+            and 1 (all source pixels). Only used if camera has no projection matrix.
+        :param crop: indicates whether to crop output images to valid pixels ROI. Only used together with alpha.
+        :param map_cache: optional directory where undistortion maps are cached
+        :param mode: either ``image`` to remap whole images or ``points`` to undistort only key point coordinates
+        :param max_views: maximum number of collected samples used for calibration solve, see
+            ``select_calibration_views``. None uses all samples.
+        :param refine: number of iterations that drop samples with high reprojection error
         """
+        if mode not in self.MODES:
+            raise ValueError("Mode must be one of {}".format("/".join(self.MODES)))
 
         calibrate = camera is None
         if not calibrate:
@@ -129,7 +316,17 @@ class CalibratedCamera(ProcessorBase):
             self._frame_delay = frame_delay
             self._last_timestamp = None
 
-        self._cache_mapped = None
+        self._max_views = max_views
+        self._refine = refine
+        self._interpolation = interpolation
+        self._fixed_point = fixed_point
+        self._alpha = alpha
+        self._crop = crop
+        self._map_cache = map_cache
+        self._mode = mode
+        self._map1, self._map2 = None, None
+        self._projection = None
+        self._undistorted_camera = None
         self._calibrate = calibrate
         self.__setup_called = False
         super(CalibratedCamera, self).__init__(vision, *args, **kwargs)
@@ -137,22 +334,103 @@ class CalibratedCamera(ProcessorBase):
     def __setup(self):
         if self._calibrate:
             # prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(6,5,0)
-            self._objp = np.zeros((np.prod(self._grid_shape), 3), np.float32)
-            self._objp[:, :2] = np.indices(self._grid_shape).T.reshape(-1, 2)
-            self._objp *= self._square_size
+            self._objp = chessboard_object_points(self._grid_shape, self._square_size)
 
             # Arrays to store object points and image points from all the images.
             self._objpoints = []  # 3d point in real world space
             self._imgpoints = []  # 2d points in image plane.
             self._calibration_samples = 0
         else:
-            self._mapx, self._mapy = cv2.initUndistortRectifyMap(
-                    self.camera.matrix,
-                    self.camera.distortion,
-                    self.camera.rectify,
-                    self.camera.projection,
-                    self.camera.size,
-                    cv2.CV_32FC1)
+            if self._mode == 'points':
+                _, self._projection, roi = self._new_camera()
+                size = roi[2:]
+            else:
+                self._map1, self._map2, self._projection = self._load_maps()
+                size = self._map1.shape[1::-1]
+            self._undistorted_camera = PinholeCamera(tuple(int(i) for i in size), self._projection[:, :3],
+                                                     np.zeros_like(self.camera.distortion))
+
+    def _load_maps(self):
+        """Helper method that loads undistortion maps from the cache or computes them
+
+        :return: map1, map2 and a new camera matrix
+        """
+        path = None
+        if self._map_cache is not None:
+            key = "{}|{}|{}|{}".format(self.camera.digest, self._fixed_point, self._alpha, self._crop)
+            path = os.path.join(self._map_cache, "undistort_{}.npz".format(hashlib.sha1(key.encode()).hexdigest()))
+            if os.path.isfile(path):
+                try:
+                    with np.load(path) as data:
+                        return data['map1'], data['map2'], np.float64(data['matrix'])
+                except (IOError, OSError, ValueError, KeyError):
+                    pass
+
+        maps = self._compute_maps()
+
+        if path is not None:
+            if not os.path.isdir(self._map_cache):
+                os.makedirs(self._map_cache)
+            tmp_path = path + ".{}.tmp".format(os.getpid())
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, map1=maps[0], map2=maps[1], matrix=maps[2])
+            try:
+                # os.replace overwrites existing files on Windows too, python 2.7 falls back to os.rename
+                getattr(os, 'replace', os.rename)(tmp_path, path)
+            except OSError:
+                # another process has already written the same maps
+                os.remove(tmp_path)
+        return maps
+
+    def _compute_maps(self):
+        """Helper method that computes undistortion maps
+
+        :return: map1, map2 and a new camera matrix
+        """
+        camera = self.camera
+        projection, matrix, (x, y, w, h) = self._new_camera()
+        map1, map2 = cv2.initUndistortRectifyMap(camera.matrix, camera.distortion, camera.rectify, projection,
+                                                 camera.size, cv2.CV_32FC1)
+        map1, map2 = map1[y:y + h, x:x + w], map2[y:y + h, x:x + w]
+        if self._fixed_point:
+            map1, map2 = cv2.convertMaps(map1, map2, cv2.CV_16SC2)
+        else:
+            map1, map2 = np.ascontiguousarray(map1), np.ascontiguousarray(map2)
+        return map1, map2, matrix
+
+    def _new_camera(self):
+        """Helper method that computes new camera matrix for undistorted images
+
+        :return: projection matrix for ``initUndistortRectifyMap``, projection matrix of undistorted images
+            and ROI (x, y, width, height) of undistorted images
+        """
+        camera = self.camera
+        projection, roi = camera.projection, None
+        if projection is None and self._alpha is not None:
+            projection, roi = cv2.getOptimalNewCameraMatrix(camera.matrix, camera.distortion, camera.size,
+                                                            self._alpha, camera.size)
+        matrix = np.float64(camera.matrix if projection is None else projection)
+        if self._crop and roi is not None and roi[2] > 0 and roi[3] > 0:
+            matrix = matrix.copy()
+            matrix[0, 2] -= roi[0]
+            matrix[1, 2] -= roi[1]
+        else:
+            roi = (0, 0) + tuple(camera.size)
+        return projection, matrix, tuple(roi)
+
+    def undistort_points(self, points):
+        """Undistorts and rectifies point coordinates in one call.
+        Resulting coordinates correspond to ``undistorted_camera``.
+
+        :param points: Nx2 array of distorted point coordinates
+        :return: Nx2 float32 array of undistorted point coordinates
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        if not len(points):
+            return points.reshape(-1, 2)
+        camera = self.camera
+        return cv2.undistortPoints(points, camera.matrix, camera.distortion, R=camera.rectify,
+                                   P=self._projection).reshape(-1, 2)
 
     def setup(self):
         self.__setup()
@@ -177,6 +455,17 @@ class CalibratedCamera(ProcessorBase):
         if self.__setup_called:
             self.__setup()
 
+    @property
+    def undistorted_camera(self):
+        """Returns PinholeCamera of undistorted images, i.e. new camera matrix, output size and no distortion.
+        Is None in calibration mode."""
+        return self._undistorted_camera
+
+    @property
+    def mode(self):
+        """Returns undistortion mode, either ``image`` or ``points``"""
+        return self._mode
+
     def process(self, image):
         if self._calibrate:
             img = image.image
@@ -195,13 +484,17 @@ class CalibratedCamera(ProcessorBase):
                 cv2.imshow(self.name, img)
 
             return Image(self, gray, features=(ret, corners), feature_type='corners')
+        elif self._mode == 'points':
+            return image
         else:
-            mapped = cv2.remap(image.image, self._mapx, self._mapy, cv2.INTER_NEAREST, dst=self._cache_mapped)
+            img = image.image
+            dst = None if isinstance(img, cv2.UMat) else \
+                self.buffers.get_like(img, shape=self._map1.shape[:2] + img.shape[2:])
+            mapped = cv2.remap(img, self._map1, self._map2, self._interpolation, dst=dst)
 
             if self.display_results:
                 cv2.imshow(self.name, mapped)
 
-            self._cache_mapped = image.image
             return image._replace(image=mapped)
 
     def calibrate(self):
@@ -234,6 +527,44 @@ class CalibratedCamera(ProcessorBase):
 
     def _finish_calibration(self, objpoints, imgpoints, shape):
         """Helper method that executes camera calibration algorithm. Factored out specifically for ``CalibratedStereoCamera``"""
+        indices = select_calibration_views(objpoints, imgpoints, shape, self._max_views, self._refine)
+        return CalibratedCamera.calibrate_camera([objpoints[i] for i in indices], [imgpoints[i] for i in indices], shape)
+
+    @staticmethod
+    def calibrate_camera(objpoints, imgpoints, shape):
+        """Executes camera calibration algorithm
+
+        :param objpoints: a list of calibration pattern object points
+        :param imgpoints: a list of corresponding image points
+        :param shape: image size (width, height)
+        :return: PinholeCamera object
+        """
         ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, shape, None, None)
 
-        return PinholeCamera(shape, mtx, dist)
+        return PinholeCamera(tuple(int(i) for i in shape), mtx, dist)
+
+    @staticmethod
+    def calibrate_offline(images, grid_shape=(7, 6), square_size=20, max_size=1024, processes=None, max_views=None,
+                          refine=0):
+        """Calibrates camera from a set of images at once. Chessboard detection is run in parallel in a process pool.
+
+        :param images: a list of image paths or images
+        :param grid_shape: shape of the calibration pattern
+        :param square_size: size of the calibration pattern element e.g. in mm.
+        :param max_size: maximum image width or height the chessboard detection is run at
+        :param processes: number of processes used for detection. Defaults to the number of CPUs.
+        :param max_views: maximum number of views used for calibration solve. None uses all views.
+        :param refine: number of iterations that drop views with high reprojection error
+        :return: PinholeCamera object
+        :raises ValueError: if the pattern was not found in any of the images
+        """
+        results = [(corners, size) for ret, corners, size in
+                   find_chessboard_corners_batch(images, grid_shape, max_size, processes) if ret]
+        if not results:
+            raise ValueError("Calibration pattern was not found in any image")
+        shape = results[0][1]
+        objpoints = [chessboard_object_points(grid_shape, square_size)] * len(results)
+        imgpoints = [corners for corners, _ in results]
+        indices = select_calibration_views(objpoints, imgpoints, shape, max_views, refine)
+        return CalibratedCamera.calibrate_camera([objpoints[i] for i in indices], [imgpoints[i] for i in indices],
+                                                 shape)
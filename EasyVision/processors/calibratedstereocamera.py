@@ -6,9 +6,10 @@
 import cv2
 import numpy as np
 from .base import *
-from .calibratedcamera import PinholeCamera
+from .calibratedcamera import PinholeCamera, CalibratedCamera, find_chessboard_corners_batch, chessboard_object_points, \
+    select_calibration_views
+from .disparity import StereoDisparity
 from EasyVision.vision import PyroCapture
-import threading as mt
 
 
 class StereoCamera(namedtuple('StereoCamera', 'left right R T E F Q')):
@@ -85,228 +86,77 @@ class StereoCamera(namedtuple('StereoCamera', 'left right R T E F Q')):
             R, T, E, F, Q)
 
 
-class CaptureThread(mt.Thread):
-    """Capturing thread for a camera pair
-
-    TODO: Synchronization
-    """
-
-    def __init__(self, vision):
-        super(CaptureThread, self).__init__()
-        self._vision = vision
-        self._running = False
-        self._capture = mt.Event()
-        self._ready = mt.Event()
-        self.frame = None
-        self._ready.clear()
-        self._capture.clear()
-
-    def capture_prepare(self):
-        self._ready.clear()
-        self._capture.set()
-
-    def capture_finish(self):
-        if not self._running:
-            return None
-        self._ready.wait()
-        return self.frame
-
-    def __getattr__(self, name):
-        return getattr(self._vision, name)
-
-    def run(self):
-        self._running = True
-
-        try:
-            self._ready.set()
-
-            while True:
-                if self._capture.wait():
-                    if not self._running:
-                        break
-                    self.frame = self._vision.capture()
-                    self._capture.clear()
-                    self._ready.set()
-        except:
-            raise
-        finally:
-            self._running = False
-            self.frame = None
-            self._ready.set()
-
-
-class CameraPairProxy(VisionBase):
-    """Capturing proxy class
+class CameraPairProxy(CaptureGroup):
+    """Capturing proxy class for a stereo camera pair.
+    Left and right cameras are grabbed back-to-back and processed in parallel.
 
     """
 
     def __init__(self, _self, left, right):
-        self._left = CaptureThread(left)
-        self._right = CaptureThread(right)
         self._self = _self
-        super(CameraPairProxy, self).__init__()
-
-    def setup(self):
-        self._left._vision.setup()
-        self._right._vision.setup()
-        self._left.start()
-        self._right.start()
-        if not self._left._ready.wait():
-            raise TimeoutError()
-        if not self._right._ready.wait():
-            raise TimeoutError()
-        super(CameraPairProxy, self).setup()
-
-    def release(self):
-        self._left._running = False
-        self._right._running = False
-        self._left._capture.set()
-        self._right._capture.set()
-        self._left.join()
-        self._right.join()
-        self._left._vision.release()
-        self._right._vision.release()
-        super(CameraPairProxy, self).release()
-
-    def capture(self):
-        super(CameraPairProxy, self).capture()
-        self._left.capture_prepare()
-        self._right.capture_prepare()
-        left, right = self._left.capture_finish(), self._right.capture_finish()
-
-        if left is None or right is None:
-            return None
-
-        return left._replace(images=left.images + right.images)
-
-    def get_source(self, source):
-        return self._left.get_source(source), self._right.get_source(source)
-
-    def __getattr__(self, name):
-        return getattr(self._left, name), getattr(self._right, name)
-
-    @property
-    def is_open(self):
-        return self._left.is_open and self._right.is_open
+        super(CameraPairProxy, self).__init__((left, right))
 
     @property
-    def frame_size(self):
-        return self._left.frame_size
+    def left(self):
+        """Returns left camera capturing source"""
+        return self._sources[0]
 
     @property
-    def fps(self):
-        return self._left.fps
-
-    @property
-    def name(self):
-        return "({} : {})".format(self._left._vision.name, self._right._vision.name)
-
-    @property
-    def frame_count(self):
-        return self._left.frame_count
-
-    @property
-    def path(self):
-        return "{} : {}".format(self._left.path, self._right.path)
+    def right(self):
+        """Returns right camera capturing source"""
+        return self._sources[1]
 
     @property
     def description(self):
         return "Stereo Pair Vision Proxy"
 
-    @property
-    def devices(self):
-        return self._left.devices
-
-    @property
-    def autoexposure(self):
-        return self._left.autoexposure, self._right.autoexposure
-
-    @property
-    def autofocus(self):
-        return self._left.autofocus, self._right.autofocus
-
-    @property
-    def autowhitebalance(self):
-        return self._left.autowhitebalance, self._right.autowhitebalance
-
-    @property
-    def autogain(self):
-        return self._left.autogain, self._right.autogain
 
-    @property
-    def exposure(self):
-        return self._left.exposure, self._right.exposure
-
-    @property
-    def focus(self):
-        return self._left.focus, self._right.focus
-
-    @property
-    def whitebalance(self):
-        return self._left.whitebalance, self._right.whitebalance
-
-    @property
-    def gain(self):
-        return self._left.gain, self._right.gain
-
-    @autoexposure.setter
-    def autoexposure(self, value):
-        self._left.autoexposure = value
-        self._right.autoexposure = value
-
-    @autofocus.setter
-    def autofocus(self, value):
-        self._left.autofocus = value
-        self._right.autofocus = value
-
-    @autowhitebalance.setter
-    def autowhitebalance(self, value):
-        self._left.autowhitebalance = value
-        self._right.autowhitebalance = value
-
-    @autogain.setter
-    def autogain(self, value):
-        self._left.autogain = value
-        self._right.autogain = value
-
-    @exposure.setter
-    def exposure(self, value):
-        self._left.exposure = value
-        self._right.exposure = value
-
-    @focus.setter
-    def focus(self, value):
-        self._left.focus = value
-        self._right.focus = value
-
-    @whitebalance.setter
-    def whitebalance(self, value):
-        self._left.whitebalance = value
-        self._right.whitebalance = value
-
-    @gain.setter
-    def gain(self, value):
-        self._left.gain = value
-        self._right.gain = value
+class CalibratedStereoCamera(ProcessorBase):
+    """Implements calibrated stereo camera calibration, rectification/undistort in conjuction with CalibratedCamera
 
+    In ``rectify`` mode both CalibratedCamera processors are assigned stereo rectification (R1/P1 and R2/P2)
+    of the camera, so that both views are remapped with stereo rectification maps. Views are remapped
+    in parallel as left and right stacks are retrieved concurrently. It is checked on ``setup`` that both views
+    are remapped as whole images into the same size. Captured frames are marked as ``rectified``,
+    so that stereo matching may rely on epipolar lines being aligned with image rows.
+    """
 
-class CalibratedStereoCamera(ProcessorBase):
-    """Implements calibrated stereo camera calibration, rectification/undistort in conjuction with CalibratedCamera"""
+    CRITERIA = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 100, 1e-5)
+    FLAGS = cv2.CALIB_FIX_PRINCIPAL_POINT | cv2.CALIB_FIX_FOCAL_LENGTH | cv2.CALIB_FIX_ASPECT_RATIO | \
+        cv2.CALIB_ZERO_TANGENT_DIST | cv2.CALIB_SAME_FOCAL_LENGTH | cv2.CALIB_FIX_K3 | cv2.CALIB_FIX_K4 | \
+        cv2.CALIB_FIX_K5
 
     def __init__(self, left, right, camera=None, calculate_disparity=False, num_disparities=255, block_size=15,
-                 grid_shape=(9, 6), square_size=20, max_samples=20, frame_delay=1, *args, **kwargs):
+                 grid_shape=(9, 6), square_size=20, max_samples=20, frame_delay=1, max_views=None, refine=0,
+                 disparity_algorithm='BM', disparity_scale=1.0, disparity_roi=None, async_disparity=False,
+                 reproject=False, rectify=None, *args, **kwargs):
         """CalibratedStereoCamera instance initialization
 
         :param left: Left camera capturing source
         :param right: Right camera capturing source
         :param camera: StereoCamera object
         :param calculate_disparity: flag indicating whether to calculate disparity map from stereo
-        :param num_disparities: Disparity map calculation parameter
+        :param num_disparities: Disparity map calculation parameter. Rounded up to be divisible by 16
         :param block_size: Disparity map calculation parameter
         :param grid_shape: Calibration grid shape
         :param square_size: Calibration grid element size e.g. in mm.
         :param max_samples: number of samples to capture for calibration
         :param frame_delay: number of frames to skip
+        :param max_views: maximum number of collected samples used for calibration solve. None uses all samples.
+        :param refine: number of iterations that drop samples with high reprojection error
+        :param disparity_algorithm: disparity algorithm, either BM or SGBM
+        :param disparity_scale: downscale factor in (0, 1] the disparity is computed at
+        :param disparity_roi: optional region of interest (x, y, width, height) the disparity is computed for
+        :param async_disparity: compute disparity in a worker thread. Disparity then lags one frame behind.
+        :param reproject: reproject disparity into 3D points using Q matrix of the camera.
+            Dense HxWx3 point cloud is set as ``points3d`` of Features of the disparity image.
+        :param rectify: indicates whether to rectify both views and mark frames as rectified.
+            Camera must have rectification and projection matrices for both views and both CalibratedCamera
+            processors must be in ``image`` mode. If None, rectify mode is enabled if camera has these matrices
+            and both CalibratedCamera processors remap images. In ``points`` mode key points are still undistorted
+            with rectification and projection matrices, but frames are not marked as rectified.
+            Note, that False only clears the flag: CalibratedCamera processors are always assigned cameras
+            of the StereoCamera, so they apply its rectification as before.
         """
 
         calibrate = camera is None
@@ -330,6 +180,12 @@ class CalibratedStereoCamera(ProcessorBase):
 
             if left._calibrate or right._calibrate:
                 raise ValueError("Left and Right cameras must NOT be set to calibrate mode")
+            has_rectification = all(cam.rectify is not None and cam.projection is not None
+                                    for cam in (camera.left, camera.right))
+            if rectify is None:
+                rectify = has_rectification and all(self._remaps_images(source) for source in (left, right))
+            elif rectify and not has_rectification:
+                raise ValueError("Camera must have rectification and projection matrices for rectify mode")
         else:
             if not left._calibrate or not right._calibrate:
                 raise ValueError("Left and Right cameras must be set to calibrate mode")
@@ -362,28 +218,26 @@ class CalibratedStereoCamera(ProcessorBase):
             self._grid_shape = grid_shape
             self._square_size = square_size
             self._camera = None
-            self._stereocalib_criteria = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 100, 1e-5)
-            self._flags = 0
-            #self.flags |= cv2.CALIB_FIX_INTRINSIC
-            self._flags |= cv2.CALIB_FIX_PRINCIPAL_POINT
-            #self.flags |= cv2.CALIB_USE_INTRINSIC_GUESS
-            self._flags |= cv2.CALIB_FIX_FOCAL_LENGTH
-            self._flags |= cv2.CALIB_FIX_ASPECT_RATIO
-            self._flags |= cv2.CALIB_ZERO_TANGENT_DIST
-            # self.flags |= cv2.CALIB_RATIONAL_MODEL
-            self._flags |= cv2.CALIB_SAME_FOCAL_LENGTH
-            self._flags |= cv2.CALIB_FIX_K3
-            self._flags |= cv2.CALIB_FIX_K4
-            self._flags |= cv2.CALIB_FIX_K5
+            self._stereocalib_criteria = self.CRITERIA
+            self._flags = self.FLAGS
             self._max_samples = max_samples
             self._last_timestamp = None
 
         vision = CameraPairProxy(self, left, right)
 
+        self._max_views = max_views
+        self._refine = refine
         self._calibrate = calibrate
         self._calculate_disparity = calculate_disparity
         self._num_disparities = num_disparities
         self._block_size = block_size
+        self._disparity_algorithm = disparity_algorithm
+        self._disparity_scale = disparity_scale
+        self._disparity_roi = disparity_roi
+        self._async_disparity = async_disparity
+        self._reproject = reproject
+        self._rectify = bool(rectify) and not calibrate
+        self._disparity = None
         super(CalibratedStereoCamera, self).__init__(vision, *args, **kwargs)
 
     def setup(self):
@@ -397,8 +251,39 @@ class CalibratedStereoCamera(ProcessorBase):
             self.imgpoints_r = []
             self.calibration_samples = 0
         if self._calculate_disparity:
-            self._stereoBM = cv2.StereoBM_create(self._num_disparities, self._block_size)
+            Q = self._camera.Q if self._reproject and self._camera is not None else None
+            self._disparity = StereoDisparity(self._disparity_algorithm, self._num_disparities, self._block_size,
+                                              self._disparity_scale, self._disparity_roi, self._async_disparity, Q)
+            self._disparity.setup()
         super(CalibratedStereoCamera, self).setup()
+        if self._rectify:
+            self._check_rectified()
+
+    @staticmethod
+    def _remaps_images(source):
+        """Helper method that returns True if CalibratedCamera of a source remaps whole images.
+        Remote sources are assumed to do so, as they are checked on the server side."""
+        if isinstance(source, PyroCapture):
+            return True
+        camera = source.get_source('CalibratedCamera')
+        return camera is not None and camera.mode == 'image'
+
+    def _check_rectified(self):
+        """Helper method that checks, that both views are remapped into rectified images of the same size"""
+        cameras = [source.get_source('CalibratedCamera') for source in self.source.sources
+                   if not isinstance(source, PyroCapture)]
+        if any(camera is None for camera in cameras):
+            raise TypeError("Left/Right must have CalibratedCamera for rectify mode")
+        if any(camera.mode != 'image' or not camera.enabled for camera in cameras):
+            raise ValueError("Left and Right CalibratedCamera must remap images for rectify mode")
+        if len(set(camera.undistorted_camera.size for camera in cameras)) > 1:
+            raise ValueError("Left and Right rectified images must be of the same size")
+
+    def release(self):
+        if self._disparity is not None:
+            self._disparity.release()
+            self._disparity = None
+        super(CalibratedStereoCamera, self).release()
 
     @property
     def description(self):
@@ -408,28 +293,42 @@ class CalibratedStereoCamera(ProcessorBase):
     def camera(self):
         return self._camera
 
+    @property
+    def async_disparity(self):
+        """Returns True if disparity is computed asynchronously and lags one frame behind"""
+        return self._async_disparity
+
+    @property
+    def rectified(self):
+        """Returns True if captured frames are rectified"""
+        return self._rectify
+
     @camera.setter
     def camera(self, value):
         if not isinstance(value, StereoCamera):
             raise TypeError("Must be StereoCamera")
+        if self._rectify and any(cam.rectify is None or cam.projection is None for cam in (value.left, value.right)):
+            raise ValueError("Camera must have rectification and projection matrices for rectify mode")
         self._camera = value
-        self.source._left.camera = value.left
-        self.source._right.camera = value.right
+        if self._disparity is not None and self._reproject:
+            self._disparity.Q = value.Q
+        for source, camera in zip(self.source.sources, (value.left, value.right)):
+            if not isinstance(source, PyroCapture):
+                source.get_source('CalibratedCamera').camera = camera
+            else:
+                source.remote_set('camera', camera)
 
     def capture(self):
         frame = super(CalibratedStereoCamera, self).capture()
+        if frame and self._rectify:
+            frame = frame._replace(rectified=True)
         if frame and self._calculate_disparity and not self._calibrate:
-            try:
-                left = cv2.cvtColor(frame.images[0].image, cv2.COLOR_BGR2GRAY)
-                right = cv2.cvtColor(frame.images[1].image, cv2.COLOR_BGR2GRAY)
-            except cv2.error:
-                left = frame.images[0].image
-                right = frame.images[1].image
-            disparity = self._stereoBM.compute(left, right)
+            disparity, points = self._disparity.submit(frame.images[0].image, frame.images[1].image)
             if self.display_results:
                 disp = cv2.normalize(disparity, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
                 cv2.imshow("Disparity", disp)
-            img = Image(self, disparity)
+            features = Features(None, None, points) if points is not None else None
+            img = Image(self, disparity, features=features, feature_type='points3d' if points is not None else None)
             frame = frame._replace(images=frame.images + (img,), processor_mask="110")
         return frame
 
@@ -441,14 +340,9 @@ class CalibratedStereoCamera(ProcessorBase):
                 img = cv2.drawChessboardCorners(image.image, self._grid_shape, corners, ret)
                 cv2.putText(img, "Samples added: {}/{}".format(self.calibration_samples, self._max_samples),
                             (20, 11), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0), 1, 8)
-                cv2.imshow("Left" if image.source is self._vision._left._vision else "Right", img)
-        else:
-            # TODO: rectified images
-            img = image.image
-            if self.display_results:
-                cv2.imshow("Left" if image.source is self._vision._left._vision else "Right", img)
-            print (image.source, self._vision._left._vision)
-
+                cv2.imshow("Left" if image.source is self._vision.left else "Right", img)
+        elif self.display_results:
+            cv2.imshow("Left" if image.source is self._vision.left else "Right", image.image)
         return image
 
     def calibrate(self):
@@ -484,16 +378,41 @@ class CalibratedStereoCamera(ProcessorBase):
 
     def _finish_calibration(self, objpoints, imgpoints_l, imgpoints_r, shape):
         """Helper method that is factored out in the same spirit as in ``CalibratedCamera``"""
-        left_camera = self.source._left._finish_calibration(objpoints, imgpoints_l, shape)
-        right_camera = self.source._right._finish_calibration(objpoints, imgpoints_r, shape)
+        indices = select_calibration_views(objpoints, list(zip(imgpoints_l, imgpoints_r)), shape,
+                                           self._max_views, self._refine)
+        objpoints = [objpoints[i] for i in indices]
+        imgpoints_l = [imgpoints_l[i] for i in indices]
+        imgpoints_r = [imgpoints_r[i] for i in indices]
 
+        left_camera = self.source.left._finish_calibration(objpoints, imgpoints_l, shape)
+        right_camera = self.source.right._finish_calibration(objpoints, imgpoints_r, shape)
+
+        return CalibratedStereoCamera.calibrate_stereo(objpoints, imgpoints_l, imgpoints_r, shape, left_camera,
+                                                       right_camera, self._stereocalib_criteria, self._flags)
+
+    @staticmethod
+    def calibrate_stereo(objpoints, imgpoints_l, imgpoints_r, shape, left_camera, right_camera,
+                         criteria=CRITERIA, flags=FLAGS):
+        """Executes stereo calibration and rectification algorithms
+
+        :param objpoints: a list of calibration pattern object points
+        :param imgpoints_l: a list of corresponding left image points
+        :param imgpoints_r: a list of corresponding right image points
+        :param shape: image size (width, height)
+        :param left_camera: initial left PinholeCamera
+        :param right_camera: initial right PinholeCamera
+        :param criteria: stereo calibration termination criteria
+        :param flags: stereo calibration flags
+        :return: StereoCamera object
+        """
+        shape = tuple(int(i) for i in shape)
         ret, M1, d1, M2, d2, R, T, E, F = cv2.stereoCalibrate(
             objpoints,
             imgpoints_l, imgpoints_r,
             left_camera.matrix, left_camera.distortion,
             right_camera.matrix, right_camera.distortion,
             shape,
-            criteria=self._stereocalib_criteria, flags=self._flags)
+            criteria=criteria, flags=flags)
 
         R1, R2, P1, P2, Q, vb1, vb2 = cv2.stereoRectify(
             M1,
@@ -509,3 +428,42 @@ class CalibratedStereoCamera(ProcessorBase):
         right_camera = PinholeCamera(shape, M2, d2, R2, P2)
 
         return StereoCamera(left_camera, right_camera, R, T, E, F, Q)
+
+    @staticmethod
+    def calibrate_offline(left_images, right_images, grid_shape=(9, 6), square_size=20, max_size=1024, processes=None,
+                          max_views=None, refine=0):
+        """Calibrates stereo camera from a set of image pairs at once.
+        Chessboard detection is run for all images in parallel in a process pool.
+        Only pairs where the pattern was found in both images are used.
+
+        :param left_images: a list of left image paths or images
+        :param right_images: a list of corresponding right image paths or images
+        :param grid_shape: shape of the calibration pattern
+        :param square_size: size of the calibration pattern element e.g. in mm.
+        :param max_size: maximum image width or height the chessboard detection is run at
+        :param processes: number of processes used for detection. Defaults to the number of CPUs.
+        :param max_views: maximum number of image pairs used for calibration solve. None uses all pairs.
+        :param refine: number of iterations that drop pairs with high reprojection error
+        :return: StereoCamera object
+        :raises ValueError: if the pattern was not found in any of the image pairs
+        """
+        if len(left_images) != len(right_images):
+            raise ValueError("Number of left and right images must match")
+        results = find_chessboard_corners_batch(list(left_images) + list(right_images), grid_shape, max_size, processes)
+        pairs = [(left, right) for left, right in zip(results[:len(left_images)], results[len(left_images):])
+                 if left[0] and right[0]]
+        if not pairs:
+            raise ValueError("Calibration pattern was not found in any image pair")
+
+        shape = pairs[0][0][2]
+        objpoints = [chessboard_object_points(grid_shape, square_size)] * len(pairs)
+        indices = select_calibration_views(objpoints, [(left[1], right[1]) for left, right in pairs], shape,
+                                           max_views, refine)
+        pairs = [pairs[i] for i in indices]
+        objpoints = objpoints[:len(pairs)]
+        imgpoints_l = [left[1] for left, _ in pairs]
+        imgpoints_r = [right[1] for _, right in pairs]
+        left_camera = CalibratedCamera.calibrate_camera(objpoints, imgpoints_l, shape)
+        right_camera = CalibratedCamera.calibrate_camera(objpoints, imgpoints_r, shape)
+        return CalibratedStereoCamera.calibrate_stereo(objpoints, imgpoints_l, imgpoints_r, shape,
+                                                       left_camera, right_camera)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Implements dense stereo disparity computation for rectified stereo pairs.
+
+"""
+
+import cv2
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from .base import BufferPool
+
+
+class StereoDisparity(object):
+    """Computes disparity maps of rectified stereo pairs using either block matching (BM) or semi-global block
+    matching (SGBM).
+
+    Disparity may be computed on downscaled images and upsampled back to the full resolution. It may be limited
+    to a region of interest, pixels outside of it are set to the invalid disparity value.
+    Resulting disparity is a fixed-point int16 map, where actual disparity is multiplied by 16, same as OpenCV returns.
+    Optionally disparity is reprojected into a 3D point cloud using disparity-to-depth matrix Q.
+
+    In asynchronous mode computation runs in a worker thread one frame behind, i.e. ``submit`` starts computation
+    for the current pair and returns the result of the previous one. The very first call waits for its own result.
+
+    Usage::
+
+        disparity = StereoDisparity('SGBM', num_disparities=64, scale=0.5)
+        disparity.setup()
+        disp, points = disparity.compute(left, right)
+        disparity.release()
+    """
+
+    ALGORITHMS = ('BM', 'SGBM')
+    INVALID = -16
+
+    def __init__(self, algorithm='BM', num_disparities=64, block_size=15, scale=1.0, roi=None,
+                 asynchronous=False, Q=None, **kwargs):
+        """StereoDisparity instance initialization
+
+        :param algorithm: either BM or SGBM
+        :param num_disparities: maximum disparity at full resolution. Will be rounded up to be divisible by 16
+        :param block_size: matched block size
+        :param scale: downscale factor in (0, 1] the disparity is computed at
+        :param roi: optional region of interest (x, y, width, height) at full resolution
+        :param asynchronous: indicates whether to run computation in a worker thread one frame behind
+        :param Q: optional 4x4 disparity-to-depth matrix. If set, disparity is reprojected into 3D
+        :param kwargs: additional arguments for ``StereoBM_create`` or ``StereoSGBM_create``
+        """
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError("Algorithm must be one of {}".format("/".join(self.ALGORITHMS)))
+        if not 0 < scale <= 1:
+            raise ValueError("Scale must be in (0, 1] range")
+        self._algorithm = algorithm
+        self._num_disparities = num_disparities
+        self._block_size = block_size
+        self._scale = scale
+        self._roi = roi
+        self._asynchronous = asynchronous
+        self._Q = None if Q is None else np.float64(Q)
+        self._kwargs = kwargs
+        self._matcher = None
+        self._pool = None
+        self._pending = None
+        self._buffers = BufferPool()
+
+    @staticmethod
+    def _round_disparities(num_disparities):
+        """Helper method that rounds number of disparities up to be divisible by 16"""
+        return max(16, (int(np.ceil(num_disparities)) + 15) // 16 * 16)
+
+    def setup(self):
+        num_disparities = self._round_disparities(self._num_disparities * self._scale)
+        if self._algorithm == 'BM':
+            block_size = max(5, self._block_size | 1)
+            self._matcher = cv2.StereoBM_create(num_disparities, block_size, **self._kwargs)
+        else:
+            block_size = max(1, self._block_size | 1)
+            defaults = dict(P1=8 * block_size ** 2, P2=32 * block_size ** 2, mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+            defaults.update(self._kwargs)
+            self._matcher = cv2.StereoSGBM_create(0, num_disparities, block_size, **defaults)
+        if self._asynchronous:
+            self._pool = ThreadPool(1)
+        self._pending = None
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._pending = None
+        self._matcher = None
+        self._buffers.clear()
+
+    @property
+    def algorithm(self):
+        """Returns disparity algorithm name"""
+        return self._algorithm
+
+    @property
+    def num_disparities(self):
+        """Returns maximum disparity at full resolution"""
+        return self._round_disparities(self._num_disparities * self._scale) / self._scale
+
+    @property
+    def Q(self):
+        """Gets/Sets disparity-to-depth matrix used for reprojection"""
+        return self._Q
+
+    @Q.setter
+    def Q(self, value):
+        self._Q = None if value is None else np.float64(value)
+
+    def submit(self, left, right):
+        """Computes disparity of a stereo pair. In asynchronous mode returns the result of the previous pair.
+
+        :param left: left rectified image
+        :param right: right rectified image
+        :return: a tuple of (disparity, points 3d or None)
+        """
+        if not self._asynchronous:
+            return self.compute(left, right)
+
+        pending = self._pool.apply_async(self.compute, (left, right))
+        previous, self._pending = self._pending, pending
+        return (previous or pending).get()
+
+    def compute(self, left, right):
+        """Computes disparity of a stereo pair synchronously
+
+        :param left: left rectified image
+        :param right: right rectified image
+        :return: a tuple of (disparity, points 3d or None)
+        """
+        left, right = self._gray(left), self._gray(right)
+        height, width = left.shape[:2]
+        x, y, w, h = self._roi if self._roi is not None else (0, 0, width, height)
+        # matching needs pixels to the left of the region of interest to search for disparities
+        x0 = max(0, x - int(np.ceil(self.num_disparities)))
+        left, right = left[y:y + h, x0:x + w], right[y:y + h, x0:x + w]
+
+        if self._scale != 1:
+            small = cv2.resize(left, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA), \
+                cv2.resize(right, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+            disparity = self._matcher.compute(*small)
+            disparity = cv2.resize(disparity, left.shape[1::-1], interpolation=cv2.INTER_NEAREST)
+            valid = disparity >= 0
+            np.multiply(disparity, 1.0 / self._scale, out=disparity, where=valid, casting='unsafe')
+        else:
+            disparity = self._matcher.compute(left, right)
+
+        if (x0, y, x + w - x0, h) != (0, 0, width, height):
+            full = self._buffers.get((height, width), np.int16)
+            full.fill(self.INVALID)
+            full[y:y + h, x:x + w] = disparity[:, x - x0:]
+            disparity = full
+
+        points = None
+        if self._Q is not None:
+            points = cv2.reprojectImageTo3D(np.float32(disparity) / 16.0, self._Q, handleMissingValues=True)
+        return disparity, points
+
+    def _gray(self, image):
+        """Helper method that converts color images to grayscale"""
+        if isinstance(image, cv2.UMat):
+            image = image.get()
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._buffers.get(image.shape[:2], image.dtype))
+        return image
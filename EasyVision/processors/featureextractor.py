@@ -5,16 +5,194 @@
 
 import cv2
 import numpy as np
+import threading as mt
+import json
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
+from collections import OrderedDict, namedtuple
 from .base import *
 
 
+def anms(pts, responses, n, robust=0.9):
+    """Adaptive non-maximal suppression. Selects ``n`` strong key points, that are spatially well distributed.
+
+    Suppression radius of every point is the distance to the nearest point, that is sufficiently stronger.
+    Points with the largest suppression radii are selected.
+    Radii are computed exactly with a vectorised grid search. Only points in neighbouring grid cells are compared.
+    Points, that have no stronger neighbours there, are searched again with twice as large cells.
+
+    :param pts: Nx2 array of point coordinates
+    :param responses: N responses of points
+    :param n: number of points to select
+    :param robust: robustness coefficient, a point is suppressed only by points with ``response * robust`` greater
+        than its response
+    :return: sorted array of indices of selected points
+    """
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    responses = np.asarray(responses, dtype=np.float32)
+    if len(pts) <= n:
+        return np.arange(len(pts))
+
+    # sorted by response every point is suppressed only by a prefix of stronger points
+    order = np.argsort(-responses, kind='stable')
+    pts, responses = pts[order], responses[order]
+    stronger = np.searchsorted(-responses * robust, -responses, side='left')
+
+    pts = pts - pts.min(axis=0)
+    extent = max(pts.max(), 1.0)
+    cell = 2 * np.sqrt(max(np.prod(pts.max(axis=0)), 1.0) / len(pts))
+    radii = np.full(len(pts), np.inf)
+    queries = np.flatnonzero(stronger > 0)
+    while len(queries):
+        cols = int(extent // cell) + 1
+        cells = (pts[:, 1] // cell) * cols + pts[:, 0] // cell
+        perm = np.argsort(cells, kind='stable')
+        sorted_cells = cells[perm]
+        nearest = np.full(len(queries), np.inf)
+        for offset in (-cols - 1, -cols, -cols + 1, -1, 0, 1, cols - 1, cols, cols + 1):
+            target = cells[queries] + offset
+            lo = np.searchsorted(sorted_cells, target, side='left')
+            counts = np.searchsorted(sorted_cells, target, side='right') - lo
+            total = counts.sum()
+            if not total:
+                continue
+            owner = np.repeat(np.arange(len(queries)), counts)
+            candidates = perm[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)]
+            valid = candidates < stronger[queries[owner]]
+            owner, candidates = owner[valid], candidates[valid]
+            np.minimum.at(nearest, owner, np.square(pts[candidates] - pts[queries[owner]]).sum(axis=1))
+        # points outside of the neighbouring cells are farther than the cell size
+        resolved = (nearest <= cell * cell) | (cell > extent)
+        radii[queries[resolved]] = nearest[resolved]
+        queries = queries[~resolved]
+        cell *= 2
+    return np.sort(order[np.argsort(-radii, kind='stable')[:n]])
+
+
+class FeatureBudget(object):
+    """Feature budget controller, that adjusts number of key points and detector threshold frame by frame
+    in order to hit either target key point count or target latency.
+
+    Stages report their measured times with ``report``. ``FeatureExtraction`` reports its own time as
+    ``extraction``, other stages, e.g. matching or pose estimation of an engine, may report theirs.
+    Sum of the last reported stage times is compared with ``target_time`` and the budget is scaled accordingly.
+
+    Detector threshold is adjusted so that the detector yields between ``oversampling`` and twice
+    ``oversampling`` times the budget of candidates, that are then reduced with ANMS.
+
+    A budget belongs to a single ``FeatureExtraction`` and is updated once for every processed image.
+    Do not share one budget between e.g. left and right extractors of a stereo pair, use one budget per extractor.
+
+    Usage::
+
+        budget = FeatureBudget(target_time=0.03)
+        with FeatureExtraction(vision, 'ORB', budget=budget) as vision:
+            for frame in vision:
+                start = default_timer()
+                ... match features ...
+                budget.report('matching', default_timer() - start)
+    """
+
+    def __init__(self, target_count=None, target_time=None, min_features=100, max_features=10000, gain=0.5,
+                 oversampling=2.0):
+        """FeatureBudget instance initialization
+
+        :param target_count: target number of key points
+        :param target_time: target time in seconds of all reported stages
+        :param min_features: minimum budget
+        :param max_features: maximum budget
+        :param gain: exponent of correction factors. Lower values give smoother but slower adaptation.
+        :param oversampling: minimum ratio of detected candidates to the budget
+        """
+        if target_count is None and target_time is None:
+            raise ValueError("Either target count or target time must be set")
+        self._target_count = target_count
+        self._target_time = target_time
+        self._min_features = min_features
+        self._max_features = max_features
+        self._gain = gain
+        self._oversampling = oversampling
+        self._budget = int(np.clip(target_count if target_count is not None else max_features,
+                                   min_features, max_features))
+        self._threshold = None
+        self._times = {}
+        self._lock = mt.Lock()
+
+    @property
+    def budget(self):
+        """Returns current number of key points to keep"""
+        return self._budget
+
+    @property
+    def threshold(self):
+        """Gets/Sets current detector threshold. None if detector has no threshold."""
+        return self._threshold
+
+    @threshold.setter
+    def threshold(self, value):
+        self._threshold = float(value) if value is not None else None
+
+    @property
+    def times(self):
+        """Returns a dict of the last reported stage times"""
+        return dict(self._times)
+
+    def report(self, stage, elapsed):
+        """Reports measured time of a stage
+
+        :param stage: name of the stage
+        :param elapsed: time in seconds
+        """
+        with self._lock:
+            self._times[stage] = elapsed
+
+    def update(self, detected):
+        """Adjusts budget and threshold after a frame
+
+        :param detected: number of key points detected before suppression
+        :return: new budget
+        """
+        with self._lock:
+            return self._update(detected)
+
+    def _update(self, detected):
+        """Helper method that adjusts budget and threshold. Must be called with the lock held."""
+        budget = float(self._budget)
+        if self._target_time is not None and self._times:
+            elapsed = sum(self._times.values())
+            budget *= np.clip(self._target_time / max(elapsed, 1e-6), 0.5, 2.0) ** self._gain
+        if self._target_count is not None:
+            budget = min(budget, self._target_count) if self._target_time is not None else self._target_count
+        self._budget = int(np.clip(round(budget), self._min_features, self._max_features))
+
+        if self._threshold is not None:
+            ratio = detected / (self._oversampling * self._budget)
+            if ratio < 1 or ratio > 2:
+                # lower threshold yields more candidates
+                self._threshold *= np.clip(ratio if ratio < 1 else ratio / 2, 0.5, 2.0) ** self._gain
+        return self._budget
+
+
 class FeatureExtraction(ProcessorBase):
     """Class that implements feature extraction from capturing source.
     Will update Image object in the frame with Features object.
 
+    If there is a CalibratedCamera in ``points`` mode below in the stack, key point coordinates are undistorted
+    after extraction.
+
+    If ``grid`` is set, the image is split into a grid of tiles, that are detected in parallel in a thread pool.
+    Every tile is extended by ``overlap`` pixels, so that features near tile borders are detected and described
+    the same way as in the whole image. Only features inside the tile itself are kept, so there are no duplicates.
+    Every tile keeps at most ``tile_features`` strongest features, that gives uniform spatial distribution.
+    For ORB the default budget is ``nfeatures`` divided by the number of tiles.
+
+    If ``max_features`` is set, ``max_features`` key points are selected with adaptive non-maximal suppression (ANMS)
+    before descriptors are computed. With a ``FeatureBudget`` controller number of selected key points and
+    detector threshold are adjusted every frame.
     """
 
-    def __init__(self, vision, feature_type, extract=True, *args, **kwargs):
+    def __init__(self, vision, feature_type, extract=True, grid=None, tile_features=None, overlap=31,
+                 tile_threads=None, max_features=None, budget=None, *args, **kwargs):
         """
 
         :param vision:
@@ -22,6 +200,12 @@ class FeatureExtraction(ProcessorBase):
             types may be supported(e.g. SURF and SIFT are patented and thus excluded from standard OpenCV build) and not all
             feature types support feature extraction, i.e. only detection is supported.
         :param extract: if set to False will only detect features.
+        :param grid: optional grid of tiles (columns, rows) for tiled detection
+        :param tile_features: maximum number of features per tile
+        :param overlap: number of pixels tiles are extended by. Should not be less than descriptor patch radius.
+        :param tile_threads: number of threads for tiled detection. Defaults to the number of CPUs.
+        :param max_features: number of key points selected with ANMS
+        :param budget: optional FeatureBudget controller, that overrides ``max_features``
         """
         if feature_type in ['FAST', 'GFTT'] and extract:
                 raise ValueError("Cannot extract features with %s detector" % feature_type)
@@ -30,54 +214,96 @@ class FeatureExtraction(ProcessorBase):
         self._kwargs.pop('debug', None)
         self._kwargs.pop('display_results', None)
         self._kwargs.pop('processor_mask', None)
+        self._kwargs.pop('parallel_images', None)
+        self._kwargs.pop('executor', None)
+        if budget is not None and not isinstance(budget, FeatureBudget):
+            raise TypeError("Budget must be FeatureBudget")
+        if grid is not None and (len(grid) != 2 or min(grid) < 1):
+            raise ValueError("Grid must be a tuple of (columns, rows)")
+        if grid is not None and tile_features is None and feature_type == 'ORB':
+            tile_features = int(np.ceil(self._kwargs.get('nfeatures', 10000) / float(grid[0] * grid[1])))
         self._feature_type = feature_type
         self._extract = extract
+        self._grid = tuple(grid) if grid is not None else None
+        self._tile_features = tile_features
+        self._overlap = overlap
+        self._tile_threads = tile_threads
+        self._tile_pool = None
+        self._tile_local = None
+        self._max_features = max_features
+        self._budget = budget
         self._detector = self._descriptor = None
+        self._undistort = None
         super(FeatureExtraction, self).__init__(vision, *args, **kwargs)
 
     def setup(self):
         super(FeatureExtraction, self).setup()
+        calibrated = self.get_source('CalibratedCamera') if isinstance(self.source, ProcessorBase) else None
+        self._undistort = calibrated if getattr(calibrated, 'mode', None) == 'points' else None
+        self._detector, self._descriptor = self._create_descriptor()
+        if self._budget is not None:
+            self._budget.threshold = self._get_threshold(self._detector or self._descriptor)
+        if self._grid is not None:
+            self._tile_local = mt.local()
+            self._tile_pool = ThreadPool(self._tile_threads)
+
+    def _create_descriptor(self, **kwargs):
+        """Helper method that creates detector and descriptor objects
+
+        :param kwargs: arguments that override the ones passed on initialization
+        :return: a tuple of detector and descriptor. Detector is None if descriptor detects features itself.
+        """
+        detector = None
+        defaults = dict(nfeatures=10000) if self._feature_type == 'ORB' else dict()
+        defaults.update(self._kwargs)
+        defaults.update(kwargs)
         if self._feature_type == 'ORB':
-            defaults = dict(nfeatures=10000)
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.ORB_create(**defaults)
+            descriptor = cv2.ORB_create(**defaults)
         elif self._feature_type == 'BRISK':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.BRISK_create(**defaults)
+            descriptor = cv2.BRISK_create(**defaults)
         elif self._feature_type == 'SURF':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.xfeatures2d.SURF_create(**defaults)
+            descriptor = cv2.xfeatures2d.SURF_create(**defaults)
         elif self._feature_type == 'SIFT':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.xfeatures2d.SIFT_create(**defaults)
+            descriptor = cv2.xfeatures2d.SIFT_create(**defaults)
         elif self._feature_type == 'KAZE':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.KAZE_create(**defaults)
+            descriptor = cv2.KAZE_create(**defaults)
         elif self._feature_type == 'AKAZE':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.AKAZE_create(**defaults)
+            descriptor = cv2.AKAZE_create(**defaults)
         elif self._feature_type == 'FREAK':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.xfeatures2d.FREAK_create(**defaults)
-            self._detector = cv2.xfeatures2d.SURF_create()
+            descriptor = cv2.xfeatures2d.FREAK_create(**defaults)
+            detector = cv2.xfeatures2d.SURF_create()
         elif self._feature_type == 'FAST':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.FastFeatureDetector_create(**defaults)
+            descriptor = cv2.FastFeatureDetector_create(**defaults)
         elif self._feature_type == 'GFTT':
-            defaults = dict()
-            defaults.update(self._kwargs)
-            self._descriptor = cv2.GFTTDetector_create(**defaults)
+            descriptor = cv2.GFTTDetector_create(**defaults)
         else:
             raise ValueError("Invalid feature type")
+        return detector, descriptor
+
+    @staticmethod
+    def _get_threshold(detector):
+        """Helper method that returns detector threshold or None if detector has no threshold"""
+        for name in ('getFastThreshold', 'getThreshold', 'getQualityLevel'):
+            if hasattr(detector, name):
+                return getattr(detector, name)()
+        return None
+
+    @staticmethod
+    def _set_threshold(detector, value):
+        """Helper method that sets detector threshold keeping its type"""
+        for name in ('FastThreshold', 'Threshold', 'QualityLevel'):
+            if hasattr(detector, 'set' + name):
+                current = getattr(detector, 'get' + name)()
+                value = max(1, int(round(value))) if isinstance(current, int) else float(value)
+                getattr(detector, 'set' + name)(value)
+                return
 
     def release(self):
+        if self._tile_pool is not None:
+            self._tile_pool.terminate()
+            self._tile_pool.join()
+            self._tile_pool = None
+        self._tile_local = None
         super(FeatureExtraction, self).release()
 
     @property
@@ -89,23 +315,130 @@ class FeatureExtraction(ProcessorBase):
         """Returns feature type that was set for this processor"""
         return self._feature_type
 
+    @property
+    def budget(self):
+        """Returns FeatureBudget controller"""
+        return self._budget
+
+    @property
+    def max_features(self):
+        """Returns number of key points selected with ANMS. None if ANMS is not used."""
+        return self._budget.budget if self._budget is not None else self._max_features
+
     def process(self, image):
-        if not self._detector:
-            keypoints, descriptors = self._descriptor.detect(image.image, image.mask), None
+        start = default_timer()
+        if self._grid is not None:
+            features, detected = self._detect_tiled(image.image, image.mask)
+            if self.display_results:
+                self._draw_keypoints(image.image, features.keypoints)
         else:
-            keypoints, descriptors = self._detector.detect(image.image, image.mask), None
+            keypoints, descriptors, detected = self._detect(self._detector, self._descriptor, image.image,
+                                                            image.mask, self.max_features)
+            if self.display_results:
+                self._draw_keypoints(image.image, keypoints)
+
+            #if isinstance(descriptors, cv2.UMat):
+            #    # this will enhance matching when using OCL detector/extractor
+            #    descriptors = descriptors.get()
+
+            features = Features(keypoints, descriptors)
 
+        if self._undistort is not None and self._undistort.enabled:
+            points = features.points
+            features = features._replace(points=KeyPoints(self._undistort.undistort_points(points.pts), points.attrs))
+
+        if self._budget is not None:
+            self._budget.report('extraction', default_timer() - start)
+            self._budget.update(detected)
+            if self._budget.threshold is not None:
+                self._set_threshold(self._detector or self._descriptor, self._budget.threshold)
+        return image._replace(features=features, feature_type=self._feature_type)
+
+    def _detect(self, detector, descriptor, image, mask, max_features=None):
+        """Helper method that detects key points, selects ``max_features`` of them with ANMS
+        and computes their descriptors
+
+        :return: a tuple of key points, descriptors and number of key points detected before selection
+        """
+        keypoints, descriptors = (detector or descriptor).detect(image, mask), None
+        detected = len(keypoints)
+        if max_features is not None and len(keypoints) > max_features:
+            points = KeyPoints.fromkeypoints(keypoints)
+            keypoints = [keypoints[i] for i in anms(points.pts, points.responses, max_features)]
         if self._extract:
-            keypoints, descriptors = self._descriptor.compute(image.image, keypoints)
+            keypoints, descriptors = descriptor.compute(image, keypoints)
+        return keypoints, descriptors, detected
+
+    def tiles(self, size):
+        """Splits an image into a grid of tiles
 
-        if self.display_results:
-            self._draw_keypoints(image.image, keypoints)
+        :param size: image size (width, height)
+        :return: a list of tiles ((x0, y0, x1, y1), (ex0, ey0, ex1, ey1)), where the first rectangle is the tile
+            itself and the second one is the tile extended with the overlap and clipped to the image
+        """
+        width, height = size
+        cols, rows = self._grid
+        xs = np.linspace(0, width, cols + 1).round().astype(int)
+        ys = np.linspace(0, height, rows + 1).round().astype(int)
+        return [((x0, y0, x1, y1), (max(0, x0 - self._overlap), max(0, y0 - self._overlap),
+                                    min(width, x1 + self._overlap), min(height, y1 + self._overlap)))
+                for y0, y1 in zip(ys[:-1], ys[1:]) for x0, x1 in zip(xs[:-1], xs[1:])]
+
+    def _detect_tiled(self, image, mask):
+        """Helper method that detects features in tiles in parallel and merges them
+
+        :return: a tuple of Features object with key points of all tiles and number of detected key points
+        """
+        if isinstance(image, cv2.UMat):
+            image = image.get()
+        if isinstance(mask, cv2.UMat):
+            mask = mask.get()
+        tiles = self.tiles(image.shape[1::-1])
+        results = self._tile_pool.map(lambda tile: self._detect_tile(image, mask, *tile), tiles)
+
+        pts = np.concatenate([pts for pts, _, _ in results])
+        attrs = np.concatenate([a for _, a, _ in results])
+        descriptors = [d for _, _, d in results if d is not None]
+        descriptors = np.concatenate(descriptors) if descriptors else None
+        detected = len(pts)
 
-        #if isinstance(descriptors, cv2.UMat):
-        #    # this will enhance matching when using OCL detector/extractor
-        #    descriptors = descriptors.get()
+        max_features = self.max_features
+        if max_features is not None and len(pts) > max_features:
+            indices = anms(pts, attrs['response'], max_features)
+            pts, attrs = pts[indices], attrs[indices]
+            descriptors = descriptors[indices] if descriptors is not None else None
+        return Features(KeyPoints(pts, attrs), descriptors), detected
 
-        return image._replace(features=Features(keypoints, descriptors), feature_type=self._feature_type)
+    def _detect_tile(self, image, mask, tile, extended):
+        """Helper method that detects features of a single tile in a worker thread.
+        Features detected in the overlap are dropped as they belong to the neighbouring tiles.
+
+        :return: key point coordinates in image space, key point attributes and descriptors
+        """
+        if not hasattr(self._tile_local, 'descriptor'):
+            self._tile_local.detector, self._tile_local.descriptor = self._create_descriptor()
+        if self._budget is not None and self._budget.threshold is not None:
+            self._set_threshold(self._tile_local.detector or self._tile_local.descriptor, self._budget.threshold)
+
+        x0, y0, x1, y1 = extended
+        if self._feature_type == 'ORB' and self._tile_features is not None:
+            # detect more features to compensate for the ones that are dropped in the overlap
+            area = float((tile[2] - tile[0]) * (tile[3] - tile[1]))
+            self._tile_local.descriptor.setMaxFeatures(int(np.ceil(self._tile_features * (x1 - x0) * (y1 - y0) /
+                                                              max(area, 1.0))))
+        keypoints, descriptors, _ = self._detect(self._tile_local.detector, self._tile_local.descriptor,
+                                                 image[y0:y1, x0:x1], mask[y0:y1, x0:x1] if mask is not None else None)
+        points = KeyPoints.fromkeypoints(keypoints)
+        pts = points.pts + np.float32([x0, y0])
+
+        keep = (pts[:, 0] >= tile[0]) & (pts[:, 0] < tile[2]) & (pts[:, 1] >= tile[1]) & (pts[:, 1] < tile[3])
+        indices = np.flatnonzero(keep)
+        if self._tile_features is not None and len(indices) > self._tile_features:
+            best = np.argsort(-points.responses[indices], kind='stable')[:self._tile_features]
+            indices = np.sort(indices[best])
+        if descriptors is not None:
+            descriptors = descriptors[indices]
+        return pts[indices], points.attrs[indices], descriptors
 
     def _draw_keypoints(self, image, keypoints):
         """Helper method to draw keypoints"""
@@ -114,56 +447,473 @@ class FeatureExtraction(ProcessorBase):
         cv2.imshow(self.name, img)
 
 
+class Matches(namedtuple('Matches', 'query_idx train_idx distance')):
+    """Feature matches stored as arrays: query indices, train indices and distances.
+
+    Points, key points and descriptors of matched features are gathered with ``query`` and ``train`` methods.
+    """
+    __slots__ = ()
+
+    def __new__(cls, query_idx, train_idx, distance):
+        return super(Matches, cls).__new__(cls, np.asarray(query_idx, dtype=np.int32),
+                                           np.asarray(train_idx, dtype=np.int32),
+                                           np.asarray(distance, dtype=np.float32))
+
+    @property
+    def count(self):
+        """Returns number of matches"""
+        return len(self.query_idx)
+
+    def subset(self, mask):
+        """Returns Matches selected with a boolean mask or an index array"""
+        return Matches(self.query_idx[mask], self.train_idx[mask], self.distance[mask])
+
+    def query(self, data):
+        """Gathers matched elements of query data. See ``gather``"""
+        return Matches.gather(data, self.query_idx)
+
+    def train(self, data):
+        """Gathers matched elements of train data. See ``gather``"""
+        return Matches.gather(data, self.train_idx)
+
+    @staticmethod
+    def gather(data, indices):
+        """Gathers elements with fancy indexing
+
+        :param data: either Features, from which point coordinates are gathered, KeyPoints, descriptors array or UMat
+        :param indices: index array
+        :return: an array, or KeyPoints for KeyPoints
+        """
+        if isinstance(data, Features):
+            return data.pts[indices]
+        elif isinstance(data, cv2.UMat):
+            return data.get()[indices]
+        elif isinstance(data, KeyPoints):
+            return data[indices]
+        return np.asarray(data)[indices]
+
+    def todmatches(self):
+        """Converts matches into a list of cv2.DMatch, e.g. for ``cv2.drawMatches``"""
+        return [cv2.DMatch(q, t, d) for q, t, d in zip(self.query_idx.tolist(), self.train_idx.tolist(),
+                                                       self.distance.tolist())]
+
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+# number of set bits in every byte value, used for Hamming distances if numpy has no bitwise_count
+_POPCOUNT = np.uint8([bin(i).count('1') for i in range(256)])
+
+
+def _hamming(descriptorsA, descriptorsB, indicesA, indicesB):
+    """Computes Hamming distances between pairs of binary descriptors
+
+    :param descriptorsA: NxD uint8 array of binary descriptors
+    :param descriptorsB: MxD uint8 array of binary descriptors
+    :param indicesA: indices of the first descriptors of pairs
+    :param indicesB: indices of the second descriptors of pairs
+    :return: array of distances
+    """
+    if hasattr(np, 'bitwise_count') and descriptorsA.shape[1] % 8 == 0:
+        a = np.ascontiguousarray(descriptorsA).view(np.uint64)
+        b = np.ascontiguousarray(descriptorsB).view(np.uint64)
+        return np.bitwise_count(a[indicesA] ^ b[indicesB]).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[descriptorsA[indicesA] ^ descriptorsB[indicesB]].sum(axis=1, dtype=np.int32)
+
+
+class MatcherConfig(namedtuple('MatcherConfig', 'index_params search_params brute_force_limit')):
+    """Nearest neighbour search configuration of a feature type.
+
+    Contains fields:
+        index_params
+            FLANN index parameters, e.g. LSH index for binary descriptors and KD-tree index for float descriptors
+        search_params
+            FLANN search parameters
+        brute_force_limit
+            Brute force search is used if product of query and train descriptor counts does not exceed the limit
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def fromdict(as_dict):
+        """Creates matcher configuration from dict"""
+        return MatcherConfig(**as_dict)
+
+    def todict(self):
+        """Converts matcher configuration to dict"""
+        return {
+            "index_params": dict(self.index_params),
+            "search_params": dict(self.search_params),
+            "brute_force_limit": self.brute_force_limit
+        }
+
+    @staticmethod
+    def load(path):
+        """Loads matcher configurations saved with ``save``
+
+        :param path: path to a json file
+        :return: dict of feature type and MatcherConfig pairs
+        """
+        with open(path) as f:
+            return {feature_type: MatcherConfig.fromdict(d) for feature_type, d in json.load(f).items()}
+
+    @staticmethod
+    def save(path, configs):
+        """Saves matcher configurations into a json file
+
+        :param path: path to a json file
+        :param configs: dict of feature type and MatcherConfig pairs
+        """
+        with open(path, "w") as f:
+            f.write(json.dumps({feature_type: config.todict() for feature_type, config in configs.items()}, indent=4))
+
+
+LSH_CANDIDATES = tuple((dict(algorithm=FLANN_INDEX_LSH, table_number=table_number, key_size=key_size,
+                             multi_probe_level=multi_probe_level), dict(checks=checks))
+                       for table_number, key_size in ((6, 12), (6, 16), (12, 16), (12, 20))
+                       for multi_probe_level in (1, 2)
+                       for checks in (32, 64))
+
+KDTREE_CANDIDATES = tuple((dict(algorithm=FLANN_INDEX_KDTREE, trees=trees), dict(checks=checks))
+                          for trees in (1, 4, 8)
+                          for checks in (16, 32, 64, 128))
+
+
+def autotune_matcher(queries, trains, binary, candidates=None, min_recall=0.9, repeats=3):
+    """Benchmarks FLANN parameters on sample descriptors and selects the fastest configuration, that finds
+    at least ``min_recall`` of exact nearest neighbours. Brute force limit is estimated from the timings
+    of brute force and selected FLANN search.
+
+    :param queries: list of query descriptor arrays
+    :param trains: list of train descriptor arrays, same length as ``queries``
+    :param binary: indicates whether descriptors are binary
+    :param candidates: list of (index params, search params) pairs to test. By default ``LSH_CANDIDATES`` or
+        ``KDTREE_CANDIDATES`` are used
+    :param min_recall: minimum required fraction of exact nearest neighbours found
+    :param repeats: number of timing repeats, the fastest is used
+    :return: MatcherConfig
+    """
+    if candidates is None:
+        candidates = LSH_CANDIDATES if binary else KDTREE_CANDIDATES
+    pairs = [(q, t) for q, t in zip(queries, trains) if len(q) and len(t) >= 2]
+    if not pairs:
+        raise ValueError("No descriptors to benchmark")
+    norm = cv2.NORM_HAMMING if binary else cv2.NORM_L2
+    dtype = cv2.CV_32S if binary else cv2.CV_32F
+
+    def bench(func):
+        best = None
+        for _ in range(repeats):
+            start = default_timer()
+            result = [func(q, t) for q, t in pairs]
+            elapsed = default_timer() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    bf_time, exact = bench(lambda q, t: cv2.batchDistance(q, t, dtype, normType=norm, K=1)[0].ravel())
+
+    best = None
+    for index_params, search_params in candidates:
+        def search(q, t):
+            _, distances = cv2.flann_Index(t, index_params).knnSearch(q, 1, params=search_params)
+            return np.float32(distances).ravel() if binary else np.sqrt(np.float32(distances)).ravel()
+
+        elapsed, found = bench(search)
+        recall = np.mean(np.concatenate([f <= e * 1.0001 for f, e in zip(found, exact)]))
+        # fastest among candidates that reach min_recall, otherwise the most accurate one
+        score = (recall < min_recall, elapsed if recall >= min_recall else -recall)
+        if best is None or score < best[0]:
+            best = score, index_params, search_params, elapsed
+
+    _, index_params, search_params, flann_time = best
+    # brute force is O(N*M), while FLANN is roughly O(N+M). Limit is where both take the same time for N == M
+    bf_rate = bf_time / sum(len(q) * len(t) for q, t in pairs)
+    flann_rate = flann_time / sum(len(q) + len(t) for q, t in pairs)
+    brute_force_limit = int((2 * flann_rate / bf_rate) ** 2)
+    return MatcherConfig(dict(index_params), dict(search_params), brute_force_limit)
+
+
 class FeatureMatchingMixin(object):
     """Feature matching mixin class that allows to match features extracted with ``FeatureExtraction`` processor.
 
+    Nearest neighbours are searched either with brute force or with FLANN indices. Both return index and distance
+    arrays, so that ratio and distance tests are applied as vectorised operations without any ``cv2.DMatch`` objects.
+    By default (``matcher='auto'``) brute force search is used for small descriptor sets (e.g. stereo pairs or
+    model views), where it is faster and exact, and FLANN index for large sets.
+    LSH index is used for binary descriptors and KD-tree index for float descriptors.
+    Parameters may be set per feature type with ``matcher_config`` keyword argument, which is either a dict of
+    feature type and ``MatcherConfig`` pairs or a path to a json file created with ``autotune_matcher.py`` tool.
+
+    Trained indices are kept in a least recently used cache, so that train descriptors, which are matched repeatedly
+    (e.g. model views), are indexed only once. Descriptors are identified either by object identity or by an explicit
+    key, so cached descriptor arrays must not be modified in place.
+    Cache size may be set with ``index_cache_size`` keyword argument, 0 disables caching.
     """
 
-    SLOTS = ('_matcher_h', '_matcher_l')
+    SLOTS = ('_matcher', '_matcher_configs', '_index_cache', '_index_cache_size')
     __slots__ = ()
 
+    BINARY_FEATURES = ('ORB', 'AKAZE', 'FREAK', 'BRISK')
+    MATCHERS = ('auto', 'bruteforce', 'flann')
+
+    DEFAULT_BINARY_CONFIG = MatcherConfig(dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12,
+                                               multi_probe_level=1), dict(checks=50), 250000)
+    DEFAULT_FLOAT_CONFIG = MatcherConfig(dict(algorithm=FLANN_INDEX_KDTREE, trees=5), dict(checks=50), 4000000)
+
     def __init__(self, *args, **kwargs):
-        self._matcher_l = None
-        self._matcher_h = None
+        matcher = kwargs.pop('matcher', 'auto')
+        if matcher not in self.MATCHERS:
+            raise ValueError("Matcher must be one of {}".format("/".join(self.MATCHERS)))
+        configs = kwargs.pop('matcher_config', None)
+        if isinstance(configs, string_types):
+            configs = MatcherConfig.load(configs)
+        self._matcher = matcher
+        self._matcher_configs = {feature_type: config if isinstance(config, MatcherConfig) else
+                                 MatcherConfig.fromdict(config) for feature_type, config in (configs or {}).items()}
+        self._index_cache = OrderedDict()
+        self._index_cache_size = kwargs.pop('index_cache_size', 16)
         super(FeatureMatchingMixin, self).__init__(*args, **kwargs)
 
     def setup(self):
-        FLANN_INDEX_LSH = 6
-        index_params = dict(algorithm=FLANN_INDEX_LSH,
-                            table_number=6,
-                            key_size=12,
-                            multi_probe_level=1)
-        search_params = dict(checks=50)
-        self._matcher_h = cv2.FlannBasedMatcher(index_params, search_params)
-
-        FLANN_INDEX_KDTREE = 0
-        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        search_params = dict(checks=50)   # or pass empty dictionary
-        self._matcher_l = cv2.FlannBasedMatcher(index_params, search_params)
+        self._index_cache.clear()
         super(FeatureMatchingMixin, self).setup()
 
-    def _match_features(self, descriptorsA, descriptorsB, feature_type, ratio=0.7, distance_thresh=30, min_matches=10):
+    def release(self):
+        self._index_cache.clear()
+        super(FeatureMatchingMixin, self).release()
+
+    @property
+    def matcher(self):
+        """Gets/Sets nearest neighbour search method, either auto, bruteforce or flann"""
+        return self._matcher
+
+    @matcher.setter
+    def matcher(self, value):
+        if value not in self.MATCHERS:
+            raise ValueError("Matcher must be one of {}".format("/".join(self.MATCHERS)))
+        self._matcher = value
+
+    def matcher_config(self, feature_type):
+        """Returns MatcherConfig used for a feature type"""
+        config = self._matcher_configs.get(feature_type)
+        if config is None:
+            return self.DEFAULT_BINARY_CONFIG if feature_type in self.BINARY_FEATURES else self.DEFAULT_FLOAT_CONFIG
+        return config
+
+    def set_matcher_config(self, feature_type, config):
+        """Sets MatcherConfig for a feature type. Cached indices are dropped.
+
+        :param feature_type: feature type
+        :param config: MatcherConfig or None to use the default configuration
+        """
+        if config is None:
+            self._matcher_configs.pop(feature_type, None)
+        else:
+            self._matcher_configs[feature_type] = config
+        self._index_cache.clear()
+
+    def _select_matcher(self, feature_type, query_count, train_count):
+        """Helper method that selects nearest neighbour search method for a pair of descriptor sets
+
+        :return: either bruteforce or flann
+        """
+        if self._matcher != 'auto':
+            return self._matcher
+        if query_count * train_count <= self.matcher_config(feature_type).brute_force_limit:
+            return 'bruteforce'
+        return 'flann'
+
+    @property
+    def index_cache_size(self):
+        """Gets/Sets maximum number of cached trained indices"""
+        return self._index_cache_size
+
+    @index_cache_size.setter
+    def index_cache_size(self, value):
+        self._index_cache_size = value
+        while len(self._index_cache) > max(value, 0):
+            self._index_cache.popitem(last=False)
+
+    def _get_index(self, descriptors, feature_type, key=None, data=None):
+        """Helper method that returns a trained FLANN index for train descriptors.
+        Reuses cached index if the same descriptors (or descriptors with the same key) were indexed before.
+
+        :param descriptors: Train descriptors, either an array or UMat
+        :param feature_type: type of features, that determines index parameters
+        :param key: optional key identifying descriptors, e.g. a version. Object identity is used by default
+        :param data: optional descriptors array, if ``descriptors`` is UMat and was already downloaded
+        :return: FLANN index or None if there are less than 2 descriptors
+        """
+        cache_key = (id(descriptors) if key is None else key, feature_type)
+        entry = self._index_cache.get(cache_key)
+        # identity keys are checked against the cached object, as ids may be reused after the object is deleted
+        if entry is not None and (key is not None or entry[0] is descriptors):
+            # re-insert to mark the entry as most recently used, OrderedDict.move_to_end is not available on python 2.7
+            self._index_cache[cache_key] = self._index_cache.pop(cache_key)
+            return entry[1]
+
+        if data is None:
+            data = descriptors.get() if isinstance(descriptors, cv2.UMat) else descriptors
+        index = cv2.flann_Index(data, self.matcher_config(feature_type).index_params) if len(data) >= 2 else None
+        if self._index_cache_size > 0:
+            # cached entries keep references to descriptors, so that the index data stays valid
+            self._index_cache.pop(cache_key, None)
+            self._index_cache[cache_key] = descriptors, index, data
+            while len(self._index_cache) > self._index_cache_size:
+                self._index_cache.popitem(last=False)
+        return index
+
+    def _match(self, descriptorsA, descriptorsB, feature_type, ratio=0.7, distance_thresh=30, min_matches=10,
+               train_key=None):
         """Helper method to match descriptors extracted with ``FeatureExtraction``
 
         :param descriptorsA: Query descriptors
         :param descriptorsB: Train descriptors
-        :param feature_type: type of features. requires as binary and float descriptors use different matchers
+        :param feature_type: type of features. requires as binary and float descriptors use different indices
         :param ratio: ratio test as per Lowe's paper
         :param distance_thresh: maximum allowed matched feature distance
         :param min_matches: minimum number of features.
-        :return: a list of matches found. match elements contain queryIdx, trainIdx and distance fields. refer to openCV documentation for more.
+        :param train_key: optional key identifying train descriptors in the index cache
+        :return: Matches object or None if less than ``min_matches`` matches were found
         """
-        if feature_type in ['ORB', 'AKAZE', 'FREAK', 'BRISK']:
-            matches = self._matcher_h.knnMatch(descriptorsA, descriptorsB, 2)
+        if descriptorsA is None or descriptorsB is None:
+            return None
+        if isinstance(descriptorsA, cv2.UMat):
+            descriptorsA = descriptorsA.get()
+        if not len(descriptorsA):
+            return None
+
+        binary = feature_type in self.BINARY_FEATURES
+        train = descriptorsB.get() if isinstance(descriptorsB, cv2.UMat) else descriptorsB
+        if len(train) < 2:
+            return None
+        if self._select_matcher(feature_type, len(descriptorsA), len(train)) == 'bruteforce':
+            distances, indices = cv2.batchDistance(descriptorsA, train, cv2.CV_32S if binary else cv2.CV_32F,
+                                                   normType=cv2.NORM_HAMMING if binary else cv2.NORM_L2, K=2)
+            distances = np.float32(distances)
         else:
-            matches = self._matcher_l.knnMatch(descriptorsA, descriptorsB, 2)
+            index = self._get_index(descriptorsB, feature_type, train_key, train)
+            search_params = self.matcher_config(feature_type).search_params
+            indices, distances = index.knnSearch(descriptorsA, 2, params=search_params)
+            distances = np.float32(distances)
+            if not binary:
+                # KD-tree index returns squared euclidean distances
+                np.sqrt(distances, out=distances)
+
+        mask = (indices[:, 1] >= 0) & (distances[:, 0] < distances[:, 1] * ratio) & \
+            (distances[:, 0] < distance_thresh)
+        query_idx = np.flatnonzero(mask)
+        if len(query_idx) < min_matches:
+            return None
+        return Matches(query_idx, indices[query_idx, 0], distances[query_idx, 0])
+
+    def _match_guided(self, descriptorsA, descriptorsB, predicted, ptsB, window, feature_type, ratio=0.7,
+                      distance_thresh=30, min_matches=10):
+        """Helper method to match descriptors only within search windows around predicted locations.
+
+        Train key points are bucketed into a spatial hash grid with cells of the window size, so that every window
+        overlaps at most 2x2 cells. Descriptors are compared only against candidates from these cells, which makes
+        matching roughly linear in the number of features. Ratio test is applied to the best two candidates
+        within a window, a single candidate passes the ratio test.
+
+        :param descriptorsA: Query descriptors
+        :param descriptorsB: Train descriptors
+        :param predicted: Nx2 array of predicted locations of query features in the train image.
+            Non finite locations are not matched
+        :param ptsB: Mx2 array of train key point locations
+        :param window: either a radius of square window or a tuple of (dx min, dx max, dy min, dy max) offsets
+            relative to the predicted location
+        :param feature_type: type of features
+        :param ratio: ratio test as per Lowe's paper
+        :param distance_thresh: maximum allowed matched feature distance
+        :param min_matches: minimum number of features.
+        :return: Matches object or None if less than ``min_matches`` matches were found
+        """
+        if descriptorsA is None or descriptorsB is None:
+            return None
+        if isinstance(descriptorsA, cv2.UMat):
+            descriptorsA = descriptorsA.get()
+        if isinstance(descriptorsB, cv2.UMat):
+            descriptorsB = descriptorsB.get()
+        if not len(descriptorsA) or not len(descriptorsB):
+            return None
 
-        if matches is None:
+        query, train = self._window_candidates(predicted, ptsB, window)
+        if not len(query):
             return None
+        if feature_type in self.BINARY_FEATURES:
+            distances = _hamming(descriptorsA, descriptorsB, query, train)
+        else:
+            diff = descriptorsA[query] - descriptorsB[train]
+            distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        distances = np.float32(distances)
 
-        matches = [M[0] for M in matches if len(M) == 2 and M[0].distance < M[1].distance * ratio and M[0].distance < distance_thresh]
+        # candidates are grouped by query, the best candidate is the first one with the minimum distance
+        first = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+        count = np.diff(np.r_[first, len(query)])
+        group = np.repeat(np.arange(len(first)), count)
+        best_distance = np.minimum.reduceat(distances, first)
+        is_best = np.flatnonzero(distances == best_distance[group])
+        best = is_best[np.r_[True, group[is_best[1:]] != group[is_best[:-1]]]]
+        distances[best] = np.inf
+        second = np.minimum.reduceat(distances, first)
 
-        if len(matches) < min_matches:
+        mask = (best_distance < second * ratio) & (best_distance < distance_thresh)
+        best = best[mask]
+        if len(best) < min_matches:
             return None
+        return Matches(query[best], train[best], best_distance[mask])
+
+    @staticmethod
+    def _window_candidates(predicted, ptsB, window):
+        """Helper method that finds all train points inside query search windows using a spatial hash grid
 
-        return matches
+        :param predicted: Nx2 array of predicted query locations
+        :param ptsB: Mx2 array of train point locations
+        :param window: either a radius of square window or a tuple of (dx min, dx max, dy min, dy max)
+        :return: query and train index arrays of candidate pairs, sorted by query index
+        """
+        if np.isscalar(window):
+            window = (-window, window, -window, window)
+        dx0, dx1, dy0, dy1 = window
+        cell = np.float64([max(dx1 - dx0, 1e-3), max(dy1 - dy0, 1e-3)])
+        predicted = np.float64(predicted).reshape(-1, 2)
+        ptsB = np.float64(ptsB).reshape(-1, 2)
+
+        valid = np.flatnonzero(np.isfinite(predicted).all(axis=1))
+        if not len(valid) or not len(ptsB):
+            return np.int64([]), np.int64([])
+        train_cells = np.floor(ptsB / cell).astype(np.int64)
+        query_cells = np.floor((predicted[valid] + (dx0, dy0)) / cell).astype(np.int64)
+
+        # cell keys must be unique for every cell, that is checked by a query or contains a train point
+        origin = np.minimum(train_cells.min(axis=0), query_cells.min(axis=0))
+        width = max(train_cells[:, 0].max(), query_cells[:, 0].max() + 1) - origin[0] + 1
+        train_keys = (train_cells[:, 1] - origin[1]) * width + train_cells[:, 0] - origin[0]
+        order = np.argsort(train_keys, kind='stable')
+        sorted_keys = train_keys[order]
+
+        query_keys = (query_cells[:, 1] - origin[1]) * width + query_cells[:, 0] - origin[0]
+        query_keys = (query_keys[:, None] + np.int64([0, 1, width, width + 1])).ravel()
+        starts = np.searchsorted(sorted_keys, query_keys, 'left')
+        counts = np.searchsorted(sorted_keys, query_keys, 'right') - starts
+
+        # positions of candidates in sorted train points
+        positions = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        query = np.repeat(np.repeat(valid, 4), counts)
+        # windows are checked with 1d arrays of sorted train coordinates, which is faster than 2d fancy indexing
+        x, y = np.float32(ptsB[order, 0]), np.float32(ptsB[order, 1])
+        dx = x[positions] - np.repeat(np.float32(np.repeat(predicted[valid, 0], 4)), counts)
+        dy = y[positions] - np.repeat(np.float32(np.repeat(predicted[valid, 1], 4)), counts)
+        inside = (dx0 <= dx) & (dx <= dx1) & (dy0 <= dy) & (dy <= dy1)
+        query, train = query[inside], order[positions[inside]]
+        return query, train
+
+    def _match_features(self, descriptorsA, descriptorsB, feature_type, ratio=0.7, distance_thresh=30, min_matches=10):
+        """Helper method to match descriptors extracted with ``FeatureExtraction``. Same as ``_match``,
+        but returns matches as a list of ``cv2.DMatch``.
+
+        :return: a list of matches found. match elements contain queryIdx, trainIdx and distance fields. refer to openCV documentation for more.
+        """
+        matches = self._match(descriptorsA, descriptorsB, feature_type, ratio, distance_thresh, min_matches)
+        return matches.todmatches() if matches is not None else None
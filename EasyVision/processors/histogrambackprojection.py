@@ -53,9 +53,6 @@ class HistogramBackprojection(ProcessorBase):
         self._range_min = range_min
         self._range_max = range_max
         self._invert = invert
-        self._cache_img = None
-        self._cache_mask = None
-        self._cache_mask1 = None
         self._combine_masks = combine_masks
         self._disc = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (10, 10))
         super(HistogramBackprojection, self).__init__(vision, *args, **kwargs)
@@ -92,20 +89,19 @@ class HistogramBackprojection(ProcessorBase):
         return cv2.normalize(hist, hist, 0, 256, cv2.NORM_MINMAX)
 
     def process(self, image):
-        hsv = cv2.cvtColor(image.image, cv2.COLOR_BGR2HSV, dst=self._cache_img)
+        hsv = cv2.cvtColor(image.image, cv2.COLOR_BGR2HSV, dst=self.buffers.get_like(image.image))
         #_mask = cv2.inRange(hsv, self._range_min, self._range_max)
-        self._cache_img = hsv
 
         masks = ()
         for hist in self._hist:
-            mask = cv2.calcBackProject((hsv,), self._channels, hist, self._ranges, 1, dst=self._cache_mask)
-            self._cache_mask = mask
+            mask = cv2.calcBackProject((hsv,), self._channels, hist, self._ranges, 1,
+                                       dst=self.buffers.get_like(hsv, shape=hsv.shape[:2]))
             mask = cv2.filter2D(mask, -1, self._disc, dst=mask)
             mask = cv2.blur(mask, (50, 50), dst=mask)
             _, mask = cv2.threshold(mask, 50, 255, 0, dst=mask)
             #mask = cv2.bitwise_and(_mask, mask)
             if self._invert:
-                mask = 255 - mask
+                mask = cv2.bitwise_not(mask, dst=mask)
             if image.mask is not None:
                 mask = cv2.bitwise_and(mask, image.mask, dst=mask)
             masks += (mask,)
@@ -4,6 +4,7 @@
 """
 
 import cv2
+import numpy as np
 from .base import *
 
 
@@ -23,7 +24,7 @@ class ImageTransform(ProcessorBase):
         self._color = color
         self._ocl = ocl
         self._operator = operator
-        self._cache_img = None
+        self._color_channels = {}
 
         super(ImageTransform, self).__init__(vision, *args, **kwargs)
 
@@ -41,12 +42,19 @@ class ImageTransform(ProcessorBase):
         elif isinstance(img, cv2.UMat):
             img = img.get()
         if self._color:
-            img = cv2.cvtColor(img, self._color)
+            dst = None if isinstance(img, cv2.UMat) else self.buffers.get_like(img, shape=self._color_shape(img))
+            img = cv2.cvtColor(img, self._color, dst=dst)
         if self._operator:
             img = self._operator(img)
 
         if self.display_results:
             cv2.imshow(self.name, img)
 
-        self._cache_img = img
         return image._replace(image=img)
+
+    def _color_shape(self, img):
+        """Helper method that returns the shape of color conversion result for an image"""
+        key = (img.shape[2:], img.dtype.str)
+        if key not in self._color_channels:
+            self._color_channels[key] = cv2.cvtColor(np.zeros((2, 2) + img.shape[2:], img.dtype), self._color).shape[2:]
+        return img.shape[:2] + self._color_channels[key]
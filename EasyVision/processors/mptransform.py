@@ -3,6 +3,10 @@
 
 NOTE: will set ``multiprocessing.connection.BUFSIZE`` to 64Mb in order to increase frame transfer between processes.
 This is needed as using Pipe is much faster than using e.g. RawArray or anything else. Although Pipe is still very slow.
+Frames, control messages and results are transferred using ``EasyVision.codec``, so image arrays are not copied
+into pickle streams.
+Alternatively frames can be transferred through a ring of shared memory slots (``transport='shm'``, Python 3.8+),
+in which case the parent process receives images and descriptors as views into shared memory without any copies.
 By the way, Multiprocessing doesn't really work fine with e.g. feature extraction or any other openCV algorithms
 and usually is a little bit slower than if processing sequentially. See tests for more details.
 """
@@ -10,17 +14,124 @@ and usually is a little bit slower than if processing sequentially. See tests fo
 import multiprocessing as mp
 import multiprocessing.connection
 from .base import *
+from EasyVision import codec
 import functools
+from collections import deque
 
 try:
-    import cPickle as pickle
+    from multiprocessing import shared_memory
 except ImportError:
-    import pickle
+    shared_memory = None
 
 Attr = namedtuple("Attr", 'name method args kwargs')
 multiprocessing.connection.BUFSIZE = 64 * 1024 * 1024
 
 
+class SharedMemoryRing(object):
+    """Ring of frame slots in shared memory, that is used to transfer frames from forked process.
+
+    Every slot is a separate shared memory block of ``slot_size`` bytes. Producer (forked process) encodes frames
+    directly into a free slot using ``EasyVision.codec`` and publishes the slot index. Consumer (parent process)
+    decodes the frame from the slot, so all arrays are views into shared memory.
+
+    Slot recycling is explicit:
+        - consumer holds slots of the last ``slots - 2`` returned frames. When a new frame is taken, the oldest held
+          slot is released, so arrays of that frame may be overwritten after that. Copy them if you need them longer;
+        - only the newest frame is kept published. If producer publishes a frame while the previous one has
+          not been taken yet, the previous slot is freed (overwrite oldest) and ``dropped`` counter is increased.
+    """
+    FREE, WRITING, READY, HELD = range(4)
+
+    def __init__(self, slots=4, slot_size=32 * 1024 * 1024):
+        """SharedMemoryRing instance initialization
+
+        :param slots: number of slots, must be at least 3
+        :param slot_size: size of a slot in bytes. Frames that do not fit are not published.
+        """
+        if shared_memory is None:
+            raise NotImplementedError("Shared memory transport requires Python 3.8 or newer")
+        if slots < 3:
+            raise ValueError("At least 3 slots are required")
+        self._blocks = [shared_memory.SharedMemory(create=True, size=slot_size) for _ in range(slots)]
+        self._lock = mp.Lock()
+        self._states = mp.Array('b', [self.FREE] * slots, lock=False)
+        self._ready = mp.Value('i', -1, lock=False)
+        self._dropped = mp.Value('i', 0, lock=False)
+        self._held = deque()
+
+    @property
+    def slots(self):
+        return len(self._blocks)
+
+    @property
+    def dropped(self):
+        """Number of published frames that were overwritten before being taken"""
+        return self._dropped.value
+
+    def write(self, frame, event):
+        """Encodes a frame into a free slot and publishes it. Called by producer.
+
+        :param frame: frame to publish
+        :param event: event to set once the frame is published
+        :return: True if frame was published, False if there is no free slot or frame does not fit into a slot
+        """
+        with self._lock:
+            try:
+                slot = list(self._states).index(self.FREE)
+            except ValueError:
+                return False
+            self._states[slot] = self.WRITING
+
+        try:
+            codec.pack_into(self._blocks[slot].buf, frame)
+        except ValueError:
+            with self._lock:
+                self._states[slot] = self.FREE
+            return False
+
+        with self._lock:
+            if self._ready.value >= 0:
+                self._states[self._ready.value] = self.FREE
+                self._dropped.value += 1
+            self._states[slot] = self.READY
+            self._ready.value = slot
+            event.set()
+        return True
+
+    def take(self, event):
+        """Takes the published slot and releases the oldest held one. Called by consumer.
+
+        :param event: event to clear if there was a published frame
+        :return: slot index or -1 if there is no published frame
+        """
+        with self._lock:
+            slot = self._ready.value
+            if slot < 0:
+                return -1
+            self._ready.value = -1
+            self._states[slot] = self.HELD
+            event.clear()
+
+            self._held.append(slot)
+            while len(self._held) > self.slots - 2:
+                self._states[self._held.popleft()] = self.FREE
+        return slot
+
+    def read(self, slot):
+        """Decodes a frame from a slot. All arrays will be views into shared memory."""
+        return codec.decode(self._blocks[slot].buf)
+
+    def close(self):
+        """Frees shared memory. Arrays that still reference it will keep their memory mapped until deleted."""
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+            block.unlink()
+        self._blocks = []
+
+
 class MultiProcessing(ProcessorBase):
     """Implements processor stack using multiprocessing
     Allows to set/get properties on the forked process as well as calling methods.
@@ -34,16 +145,35 @@ class MultiProcessing(ProcessorBase):
 
     Usually for streaming devices freerun should be used. Lazy mode is used primarily for tests that use ImagesReader
     so that every frame will be processed.
+
+    Frames are sent through a pipe by default. With ``transport='shm'`` frames are written into a ``SharedMemoryRing``
+    and only slot indices are exchanged between processes. In freerun mode newer frame overwrites the one that
+    has not been captured yet, see ``dropped_frames``. Note, that arrays of a captured frame are views into shared memory
+    and stay valid only for ``slots - 2`` captures. Frames that do not fit into a slot are sent through the pipe.
     """
 
-    def __init__(self, vision, freerun=True, timeout=10, *args, **kwargs):
+    def __init__(self, vision, freerun=True, timeout=10, transport='pipe', slots=4, slot_size=32 * 1024 * 1024,
+                 *args, **kwargs):
         """MultiProcessing instance initialization
 
         :param vision: capturing source object
         :param freerun: indicates whether to execute capturing loop asynchronously
         :param timeout: timeout for calls
+        :param transport: frame transport, either 'pipe' or 'shm'
+        :param slots: number of shared memory slots for 'shm' transport
+        :param slot_size: size of a single shared memory slot in bytes for 'shm' transport
         """
+        if transport not in ('pipe', 'shm'):
+            raise ValueError("Transport must be either 'pipe' or 'shm'")
+        if transport == 'shm' and shared_memory is None:
+            raise NotImplementedError("Shared memory transport requires Python 3.8 or newer")
+        if transport == 'shm' and slots < 3:
+            raise ValueError("At least 3 slots are required")
         self._freerun = freerun
+        self._transport = transport
+        self._slots = slots
+        self._slot_size = slot_size
+        self._ring = None
 
         self._timeout = timeout
         self._running = mp.Value("b", 0)
@@ -107,6 +237,8 @@ class MultiProcessing(ProcessorBase):
 
     def setup(self):
         assert(not self._running.value)
+        if self._transport == 'shm':
+            self._ring = SharedMemoryRing(self._slots, self._slot_size)
         self._process = mp.Process(target=self.run)
         self._process.start()
         if not self._run_event.wait(self._timeout):
@@ -116,6 +248,9 @@ class MultiProcessing(ProcessorBase):
         self._running.value = False
         self._process.join(self._timeout)
         self._process = None
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
 
     @property
     def is_open(self):
@@ -125,6 +260,11 @@ class MultiProcessing(ProcessorBase):
     def description(self):
         return "Allows processors run on a separate process"
 
+    @property
+    def dropped_frames(self):
+        """Number of frames overwritten in shared memory ring before being captured"""
+        return self._ring.dropped if self._ring is not None else 0
+
     def process(self, image):
         return self.remote_call('process', image)
 
@@ -141,8 +281,12 @@ class MultiProcessing(ProcessorBase):
                 return None
             raise TimeoutError("Timeout occured while waiting for a frame")
 
-        frame = Frame.frombytes(self._frame_in.recv_bytes())
-        self._frame_event.clear()
+        slot = self._ring.take(self._frame_event) if self._ring is not None else -1
+        if slot >= 0:
+            frame = self._ring.read(slot)
+        else:
+            frame = codec.recv(self._frame_in)
+            self._frame_event.clear()
         if isinstance(frame, Exception):
             raise frame
         if isinstance(frame, Frame):
@@ -152,15 +296,15 @@ class MultiProcessing(ProcessorBase):
     def _send_ctrl(self, ctrl, lock=True):
         """Helper method to send control messages to a forked process
 
-        :param ctrl: instance of Attr. Will be pickled before sending through a pipe.
+        :param ctrl: instance of Attr. Will be encoded with ``EasyVision.codec`` before sending through a pipe.
         :param lock:
         :return: whatever the _remote_call_handle produced
         """
         assert(self._running.value)
-        self._ctrl_out.send_bytes(pickle.dumps(ctrl, protocol=-1))
+        codec.send(self._ctrl_out, ctrl)
         self._ctrl_sem.release()
         self._res_sem.acquire(lock)
-        res = pickle.loads(self._res_in.recv_bytes())
+        res = codec.recv(self._res_in)
         if isinstance(res, Exception):
             raise res
         return res
@@ -175,10 +319,10 @@ class MultiProcessing(ProcessorBase):
         return self._send_ctrl(Attr(name, 'CALL', args, kwargs))
 
     def _remote_call_handle(self):
-        """Remote call handle. Will receive pickled Attr instances through the pipe, decode them,
-        call appropriate methods from source and send out pickled results."""
+        """Remote call handle. Will receive encoded Attr instances through the pipe, decode them,
+        call appropriate methods from source and send out encoded results."""
         if self._ctrl_sem.acquire(False):
-            ctrl = pickle.loads(self._ctrl_in.recv_bytes())
+            ctrl = codec.recv(self._ctrl_in)
             try:
                 result = None
                 if ctrl.method == 'SET':
@@ -203,9 +347,9 @@ class MultiProcessing(ProcessorBase):
                     result = getattr(self._vision, ctrl.name)(*ctrl.args, **ctrl.kwargs)
                 else:
                     pass
-                self._res_out.send(result)
+                codec.send(self._res_out, result)
             except Exception as e:
-                self._res_out.send(e)
+                codec.send(self._res_out, e)
             finally:
                 self._res_sem.release()
 
@@ -224,6 +368,8 @@ class MultiProcessing(ProcessorBase):
                         self._remote_call_handle()
                         if not self._running.value:
                             break
+                    if not self._running.value:
+                        break
                     self._cap_event.clear()
                     self._send_frame(frame)
 
@@ -248,11 +394,14 @@ class MultiProcessing(ProcessorBase):
         super(MultiProcessing, self).release()
 
     def _send_frame(self, frame):
-        """Helper method to send a frame. Will pickle None, Frame and exceptions."""
+        """Helper method to send a frame. Will encode None, Frame and exceptions.
+        Frames are written into shared memory ring if it is used, everything else is sent through the pipe."""
+        if self._ring is not None and isinstance(frame, Frame) and self._ring.write(frame, self._frame_event):
+            return
         if not self._frame_event.is_set():
-            data = frame.tobytes() if isinstance(frame, Frame) else pickle.dumps(frame, protocol=-1)
-            self._frame_out.send_bytes(data)
+            # event must be set before sending, otherwise frames larger than pipe buffer would block forever
             self._frame_event.set()
+            codec.send(self._frame_out, frame)
 
     @property
     def autoexposure(self):
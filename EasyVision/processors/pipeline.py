@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Runs stages of a processor stack concurrently, each stage in its own thread.
+"""
+
+import threading as mt
+from .base import *
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Pipeline(ProcessorBase):
+    """Stage-parallel executor for processor stacks.
+
+    Normally every ``capture`` pulls a frame through all the nested processors in the caller's thread,
+    so only one of them is busy at a time. Pipeline splits the stack into stages, that run in separate threads and
+    are connected with bounded queues. While the source captures a new frame, the processors above it work on
+    the previous ones. Throughput is then limited by the slowest stage instead of the sum of all stages.
+    Frames are returned in the same order they were captured.
+
+    Processors that implement their own ``capture`` (e.g. CalibratedStereoCamera or MultiThreading) are run
+    together with their sources as a single stage.
+
+    Usage::
+
+        with Pipeline(FeatureExtraction(CalibratedCamera(VideoCapture(0), camera), 'ORB')) as vision:
+            for frame in vision:
+                pass
+    """
+
+    def __init__(self, vision, queue_size=2, stages=None, timeout=10, *args, **kwargs):
+        """Pipeline instance initialization
+
+        :param vision: processor stack
+        :param queue_size: maximum number of frames waiting between two stages
+        :param stages: optional list of processor class names, that start a new stage. Other processors are run
+            in the same thread as the processor below them. By default every processor is a separate stage.
+        :param timeout: timeout for capture
+        """
+        if not isinstance(vision, VisionBase):
+            raise TypeError("Vision object must be of type VisionBase")
+        self._queue_size = queue_size
+        self._stages = stages
+        self._timeout = timeout
+        self._running = False
+        self._finished = False
+        self._threads = []
+        self._queues = []
+        super(Pipeline, self).__init__(vision, *args, **kwargs)
+
+    def split_stages(self):
+        """Splits the processor stack into stages.
+
+        :return: a list of (source, processors) tuples starting from the bottom of the stack.
+            Only the first stage has a source, that is captured from.
+        """
+        processors = []
+        source = self._vision
+        while isinstance(source, ProcessorBase) and not source._overrides_capture():
+            processors.insert(0, source)
+            source = source.source
+
+        stages = [(source, [])]
+        for processor in processors:
+            if self._stages is None or processor.__class__.__name__ in self._stages:
+                stages.append((None, [processor]))
+            else:
+                stages[-1][1].append(processor)
+        return stages
+
+    def setup(self):
+        assert(not self._running)
+        super(Pipeline, self).setup()
+
+        stages = self.split_stages()
+        self._queues = [queue.Queue(self._queue_size) for _ in stages]
+        self._threads = [mt.Thread(target=self._run_stage, args=(source, processors, inbox, outbox))
+                         for (source, processors), inbox, outbox in zip(stages, [None] + self._queues, self._queues)]
+        self._running = True
+        self._finished = False
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def release(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join(self._timeout)
+        self._threads = []
+        self._queues = []
+        super(Pipeline, self).release()
+
+    @property
+    def description(self):
+        return "Runs processor stack stages concurrently"
+
+    def process(self, image):
+        return self.source.process(image)
+
+    def capture(self):
+        if self._finished or not self._running:
+            return None
+        self.update_fps()
+        try:
+            frame = self._queues[-1].get(timeout=self._timeout)
+        except queue.Empty:
+            raise TimeoutError()
+
+        if frame is None:
+            self._finished = True
+        elif isinstance(frame, Exception):
+            self._finished = True
+            raise frame
+        return frame
+
+    def _run_stage(self, source, processors, inbox, outbox):
+        """Thread function of a single stage. End of stream and exceptions are passed on to the next stages."""
+        try:
+            while self._running:
+                if source is not None:
+                    frame = source.capture()
+                else:
+                    frame = self._get(inbox)
+                    if isinstance(frame, Exception):
+                        self._put(outbox, frame)
+                        break
+                for processor in processors:
+                    if frame is None:
+                        break
+                    frame = processor._process_frame(frame)
+                if not self._put(outbox, frame) or frame is None:
+                    break
+        except Exception as e:
+            self._put(outbox, e)
+
+    def _put(self, q, item):
+        """Puts an item into a queue, while checking whether the pipeline is still running"""
+        while self._running:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        """Gets an item from a queue, while checking whether the pipeline is still running"""
+        while self._running:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
@@ -99,6 +99,7 @@ Example using json:
 
 from EasyVision.vision.base import VisionBase
 from EasyVision.processors.base import ProcessorBase
+from EasyVision.processors.pipeline import Pipeline
 from EasyVision.engine.base import EngineBase
 import inspect
 
@@ -285,8 +286,13 @@ class Builder(object):
         self.args = args
         self.kwargs = kwargs
 
-    def build(self):
-        """Builds the processor stack using provided processors and their arguments"""
+    def build(self, pipelined=False, **kwargs):
+        """Builds the processor stack using provided processors and their arguments
+
+        :param pipelined: indicates whether to run processors of the stack concurrently using Pipeline.
+            If the stack ends with an engine, then the stack below the engine is pipelined.
+        :param kwargs: Pipeline arguments, e.g. queue_size or stages
+        """
         index = 0
         args = ()
         cls = None
@@ -304,6 +310,8 @@ class Builder(object):
                 default = {}
                 default.update(arg.kwargs)
                 default.update(self.kwargs)
+                if pipelined and issubclass(cls, EngineBase):
+                    args = (Pipeline(args[0], **kwargs),)
                 obj = cls(*(args + arg.args), **default)
                 args = (obj, )
                 index += 1
@@ -311,6 +319,8 @@ class Builder(object):
                 raise ValueError("Invalid arguments at position: %i" % pos)
         assert(len(args) == 1)
         assert(isinstance(args[0], VisionBase) or isinstance(args[0], EngineBase))
+        if pipelined and isinstance(args[0], VisionBase):
+            return Pipeline(args[0], **kwargs)
         return args[0]
 
     def todict(self):
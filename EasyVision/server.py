@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Processor stack server using Pyro4. Used in conjunction with vision.PyroCapture.
 
-Uses Pyro4 for RPC and raw socket for return data transfer.
+Uses Pyro4 for RPC and raw socket for return data transfer. Return data is encoded using ``EasyVision.codec``.
 
 NOTE: Passing images to the server is very inefficient.
 """
@@ -23,6 +23,7 @@ except ImportError:
     pass
 
 from EasyVision.vision.base import VisionBase
+from EasyVision import codec
 
 try:
     import cPickle as pickle
@@ -91,9 +92,10 @@ class ProxyVision(object):
         return self.send_data(result)
 
     def send_data(self, data):
+        """Encodes data and stores it as a data blob to be sent through blob socket. Returns data blob id."""
         if data is None:
             return None
-        data = pickle.dumps(data, protocol=-1)
+        data = codec.chunks(data)
         data_id = str(uuid.uuid4())
         self._pyroDaemon.datablobs[data_id] = data
         return data_id
@@ -123,7 +125,9 @@ class ProxyVision(object):
         finally:
             print('thread finally')
             with self._result_lock:
-                 self._running = False
+                self._running = False
+                # wakes up a pending get_last_result
+                self._event.set()
             self._exit_event.set()
 
     @Pyro4.expose
@@ -169,6 +173,8 @@ class ProxyVision(object):
             self._event.wait()
 
         with self._result_lock:
+            if not self._result_ready:
+                return None
             result = self._result
             self._result_ready = False
             self._event.clear()
@@ -245,9 +251,7 @@ class ServerDaemon(Pyro4.core.Daemon):
                 file_id = Pyro4.socketutil.receiveData(csock, 36).decode()
                 if file_id is None:
                     return
-                data = self.datablobs.pop(file_id)
-                csock.sendall("{:016}".format(len(data)).encode('utf-8'))
-                csock.sendall(data)
+                codec.sendall(csock, self.datablobs.pop(file_id))
             except:
                 break
         csock.close()
@@ -5,3 +5,4 @@ from .videocapture import VideoCapture
 from .pyrocapture import PyroCapture
 from .images import ImagesReader
 
+from .capturegroup import CaptureGroup
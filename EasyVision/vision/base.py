@@ -6,13 +6,9 @@
 from EasyVision.base import *
 from collections import namedtuple
 from datetime import datetime
+from EasyVision import codec
 import cv2
 
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
 
 class Image(NamedTupleExtendHelper, namedtuple('_Image', ['source', 'image', 'original', 'mask', 'features', 'feature_type'])):
     """Image is class derived from namedtuple and represents a captured and/or processed image.
@@ -51,30 +47,30 @@ class Image(NamedTupleExtendHelper, namedtuple('_Image', ['source', 'image', 'or
         return super(Image, cls).__new__(cls, source, image, original, mask, features, feature_type)
 
     def tobytes(self):
-        """Uses pickle to serialize Image object into bytes"""
-        return pickle.dumps(self, protocol=-1)
+        """Uses ``EasyVision.codec`` to serialize Image object into bytes"""
+        return codec.dumps(self)
 
     @staticmethod
     def frombytes(data):
-        """Uses pickle to deserialize Image object from bytes"""
-        return pickle.loads(data)
+        """Uses ``EasyVision.codec`` to deserialize Image object from bytes. Arrays will be writable views into data."""
+        return codec.loads(data)
 
     def tobuffer(self, buf):
-        """Uses pickle to serialize Image object into a buffer
+        """Uses ``EasyVision.codec`` to serialize Image object into a buffer
 
         :param buf: Buffer-like object, that supports read/write methods
         :return: None
         """
-        pickle.dump(self, buf, protocol=-1)
+        codec.dump(self, buf)
 
     @staticmethod
     def frombuffer(buf):
-        """Uses pickle to deserialize Image object from a buffer
+        """Uses ``EasyVision.codec`` to deserialize Image object from a buffer
 
         :param buf: Buffer-like object, that supports read/write methods
         :return: Image object
         """
-        return pickle.load(buf)
+        return codec.load(buf)
 
     def __reduce__(self):
         """Used for pickle to properly convert between UMat and numpy array"""
@@ -89,7 +85,8 @@ class Image(NamedTupleExtendHelper, namedtuple('_Image', ['source', 'image', 'or
         return self.__class__, d
 
 
-class Frame(NamedTupleExtendHelper, namedtuple('_Frame', ['timestamp', 'index', 'images', 'processor_mask'])):
+class Frame(NamedTupleExtendHelper, namedtuple('_Frame', ['timestamp', 'index', 'images', 'processor_mask', 'timestamps',
+                                                          'rectified'])):
     """Frame is a class derived from namedtuple and represents a synchronously captured/processed set of images.
 
     Contains fields:
@@ -101,6 +98,15 @@ class Frame(NamedTupleExtendHelper, namedtuple('_Frame', ['timestamp', 'index',
             A tuple containing Image objects.
         processor_mask
             A string of "1" and "0" that is used to determine if the image from the tuple has to be processed.
+        timestamps
+            A tuple of per source grab timestamps if the frame was captured from several sources, e.g. by
+            ``CaptureGroup``. None otherwise.
+        rectified
+            True if images are a rectified stereo pair, i.e. epipolar lines are aligned with image rows.
+
+    Implements properties:
+        skew
+            Time difference in seconds between the earliest and the latest grab timestamps.
 
     Implements methods:
         get_image
@@ -112,14 +118,24 @@ class Frame(NamedTupleExtendHelper, namedtuple('_Frame', ['timestamp', 'index',
 
     __slots__ = ()
 
-    def __new__(cls, timestamp, index, images, processor_mask=None):
+    def __new__(cls, timestamp, index, images, processor_mask=None, timestamps=None, rectified=False):
         if not isinstance(timestamp, datetime):
             raise TypeError("Timestamp must be datetime object")
         if not isinstance(index, int):
             raise TypeError("Index must be integer")
         if not isinstance(images, tuple) or not all(isinstance(i, Image) for i in images):
             raise TypeError("Images must be a tuple of Image objects")
-        return super(Frame, cls).__new__(cls, timestamp, index, tuple(images), Frame.tidy_processor_mask(processor_mask))
+        if timestamps is not None and not all(isinstance(i, datetime) for i in timestamps):
+            raise TypeError("Timestamps must be datetime objects")
+        return super(Frame, cls).__new__(cls, timestamp, index, tuple(images), Frame.tidy_processor_mask(processor_mask),
+                                         tuple(timestamps) if timestamps is not None else None, bool(rectified))
+
+    @property
+    def skew(self):
+        """Returns time difference in seconds between the earliest and the latest grab timestamps"""
+        if not self.timestamps:
+            return 0.0
+        return (max(self.timestamps) - min(self.timestamps)).total_seconds()
 
     def get_image(self, source):
         """Returns an image from specified source object. Useful to get left/right views for stereo camera setup.
@@ -153,30 +169,30 @@ class Frame(NamedTupleExtendHelper, namedtuple('_Frame', ['timestamp', 'index',
         return "".join(i and "1" or "0" for i in processor_mask) if isinstance(processor_mask, tuple) else processor_mask
 
     def tobytes(self):
-        """Uses pickle to serialize Frame object into bytes"""
-        return pickle.dumps(self, protocol=-1)
+        """Uses ``EasyVision.codec`` to serialize Frame object into bytes"""
+        return codec.dumps(self)
 
     @staticmethod
     def frombytes(data):
-        """Uses pickle to deserialize Frame object from bytes"""
-        return pickle.loads(data)
+        """Uses ``EasyVision.codec`` to deserialize Frame object from bytes. Arrays will be writable views into data."""
+        return codec.loads(data)
 
     def tobuffer(self, buf):
-        """Uses pickle to serialize Frame object into a buffer
+        """Uses ``EasyVision.codec`` to serialize Frame object into a buffer
 
         :param buf: Buffer-like object, that supports read/write methods
         :return: None
         """
-        pickle.dump(self, buf, protocol=-1)
+        codec.dump(self, buf)
 
     @staticmethod
     def frombuffer(buf):
-        """Uses pickle to deserialize Frame object from a buffer
+        """Uses ``EasyVision.codec`` to deserialize Frame object from a buffer
 
         :param buf: Buffer-like object, that supports read/write methods
         :return: Frame object
         """
-        return pickle.load(buf)
+        return codec.load(buf)
 
 
 class VisionBase(EasyVisionBase):
@@ -245,6 +261,19 @@ class VisionBase(EasyVisionBase):
         super(VisionBase, self).next()
         self.update_fps()
 
+    def grab(self):
+        """Grabs a frame from capturing device without decoding it, so that several devices can be grabbed
+        back-to-back. Grabbed frame is returned by ``retrieve``.
+        Default implementation does nothing and ``retrieve`` captures the whole frame.
+
+        :return: False if no more frames available
+        """
+        return True
+
+    def retrieve(self):
+        """Decodes and returns a frame grabbed with ``grab``. Default implementation calls ``capture``."""
+        return self.capture()
+
     @abstractproperty
     def is_open(self):
         """Abstract property. Indicates whether any frames are available."""
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Implements synchronized capturing from a group of capturing sources, e.g. a multi camera rig.
+
+"""
+
+from .base import *
+from multiprocessing.pool import ThreadPool
+
+
+class CaptureGroup(VisionBase):
+    """Class for capturing frames from N capturing sources at once.
+
+    On every capture ``grab`` is issued on all sources back-to-back, so that sensors are sampled as close in time
+    as possible. Then every source retrieves, decodes and processes its frame in parallel.
+    Sources that do not support grabbing (e.g. processors that implement their own ``capture``) are captured
+    in parallel as a whole.
+
+    Resulting frame contains images from all sources in order and per source grab ``timestamps``.
+    Inter-camera skew of the last captured frame is available as ``skew`` property of the frame.
+    """
+
+    def __init__(self, sources, *args, **kwargs):
+        """CaptureGroup instance initialization
+
+        :param sources: a list of capturing sources
+        """
+        if not len(sources) or not all(isinstance(source, VisionBase) for source in sources):
+            raise TypeError("Sources must be a non empty list of VisionBase objects")
+        self._sources = tuple(sources)
+        self._pool = None
+        super(CaptureGroup, self).__init__(*args, **kwargs)
+
+    def setup(self):
+        for source in self._sources:
+            source.setup()
+        self._pool = ThreadPool(len(self._sources))
+        super(CaptureGroup, self).setup()
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        for source in self._sources:
+            source.release()
+        super(CaptureGroup, self).release()
+
+    def capture(self):
+        super(CaptureGroup, self).capture()
+        if not all([source.grab() for source in self._sources]):
+            return None
+
+        frames = self._pool.map(CaptureGroup._retrieve, self._sources)
+        if any(frame is None for frame in frames):
+            return None
+
+        images = sum((frame.images for frame in frames), ())
+        if any(frame.processor_mask is not None for frame in frames):
+            processor_mask = "".join(frame.processor_mask or "1" * len(frame.images) for frame in frames)
+        else:
+            processor_mask = None
+        return frames[0]._replace(images=images, processor_mask=processor_mask,
+                                  timestamps=tuple(frame.timestamp for frame in frames))
+
+    @staticmethod
+    def _retrieve(source):
+        """Helper method that is run in parallel for every source"""
+        return source.retrieve()
+
+    @property
+    def sources(self):
+        """Returns a tuple of capturing sources"""
+        return self._sources
+
+    def get_source(self, name):
+        """Recursively searches for a source class by class name in every capturing source.
+
+        :return: a tuple of found sources
+        """
+        return tuple(source.get_source(name) if hasattr(source, 'get_source') else
+                     (source if source.__class__.__name__ == name else None) for source in self._sources)
+
+    def __getattr__(self, name):
+        """Returns a tuple of attributes from every capturing source"""
+        # this line is required for pickling/unpickling
+        if '_sources' not in self.__dict__:
+            raise AttributeError("Sources were not set")
+        try:
+            return super(CaptureGroup, self).__getattr__(name)
+        except AttributeError:
+            return tuple(getattr(source, name) for source in self._sources)
+
+    @property
+    def is_open(self):
+        return all(source.is_open for source in self._sources)
+
+    @property
+    def frame_size(self):
+        return self._sources[0].frame_size
+
+    @property
+    def fps(self):
+        return self._sources[0].fps
+
+    @property
+    def name(self):
+        return "({})".format(" : ".join(source.name for source in self._sources))
+
+    @property
+    def frame_count(self):
+        return self._sources[0].frame_count
+
+    @property
+    def path(self):
+        return " : ".join(str(source.path) for source in self._sources)
+
+    @property
+    def description(self):
+        return "Synchronized capturing from a group of sources"
+
+    @property
+    def devices(self):
+        return self._sources[0].devices
+
+    @property
+    def autoexposure(self):
+        return tuple(source.autoexposure for source in self._sources)
+
+    @property
+    def autofocus(self):
+        return tuple(source.autofocus for source in self._sources)
+
+    @property
+    def autowhitebalance(self):
+        return tuple(source.autowhitebalance for source in self._sources)
+
+    @property
+    def autogain(self):
+        return tuple(source.autogain for source in self._sources)
+
+    @property
+    def exposure(self):
+        return tuple(source.exposure for source in self._sources)
+
+    @property
+    def focus(self):
+        return tuple(source.focus for source in self._sources)
+
+    @property
+    def whitebalance(self):
+        return tuple(source.whitebalance for source in self._sources)
+
+    @property
+    def gain(self):
+        return tuple(source.gain for source in self._sources)
+
+    @autoexposure.setter
+    def autoexposure(self, value):
+        for source in self._sources:
+            source.autoexposure = value
+
+    @autofocus.setter
+    def autofocus(self, value):
+        for source in self._sources:
+            source.autofocus = value
+
+    @autowhitebalance.setter
+    def autowhitebalance(self, value):
+        for source in self._sources:
+            source.autowhitebalance = value
+
+    @autogain.setter
+    def autogain(self, value):
+        for source in self._sources:
+            source.autogain = value
+
+    @exposure.setter
+    def exposure(self, value):
+        for source in self._sources:
+            source.exposure = value
+
+    @focus.setter
+    def focus(self, value):
+        for source in self._sources:
+            source.focus = value
+
+    @whitebalance.setter
+    def whitebalance(self, value):
+        for source in self._sources:
+            source.whitebalance = value
+
+    @gain.setter
+    def gain(self, value):
+        for source in self._sources:
+            source.gain = value
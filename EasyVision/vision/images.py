@@ -6,37 +6,73 @@
 from .base import *
 import cv2
 from datetime import datetime
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 
 class ImagesReader(VisionBase):
-    """Class for capturing frames from a list of images."""
+    """Class for capturing frames from a list of images.
 
-    def __init__(self, image_paths, img_args=(), *args, **kwargs):
+    Images can be decoded ahead of time by a pool of threads (``prefetch`` argument). As cv2.imread releases the GIL,
+    decoding scales with the number of threads. Frames are still returned in strict order.
+    """
+
+    def __init__(self, image_paths, img_args=(), prefetch=0, read_ahead=None, *args, **kwargs):
         """Initializes ImagesReader object
 
         :param image_paths: a list of image paths to be captured
         :param img_args: arguments for cv2.imread method
+        :param prefetch: number of threads that decode images ahead of time. 0 disables prefetching
+        :param read_ahead: maximum number of images decoded ahead of time. Defaults to twice the number of threads
         """
+        if prefetch < 0:
+            raise ValueError("Number of prefetch threads must not be negative")
         self._name = 'images'
         self._paths = image_paths[:]
         self._images = image_paths
         self._frame_count = len(image_paths)
         self._frame_index = 0
         self._img_args = img_args
+        self._prefetch = prefetch
+        self._read_ahead = max(read_ahead or 2 * prefetch, 1)
+        self._pool = None
+        self._pending = deque()
+        self._next_index = 0
         super(ImagesReader, self).__init__(*args, **kwargs)
 
     def setup(self):
         super(ImagesReader, self).setup()
         self._frame_index = 0
+        if self._prefetch:
+            self._pool = ThreadPool(self._prefetch)
+            self._next_index = 0
+            self._pending.clear()
+            self._fill_pending()
 
     def release(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pending.clear()
         super(ImagesReader, self).release()
 
+    def _fill_pending(self):
+        """Helper method that schedules images to be decoded until read-ahead queue is full"""
+        while len(self._pending) < self._read_ahead and self._next_index < self._frame_count:
+            self._pending.append(self._pool.apply_async(ImagesReader.load_image, (self._paths[self._next_index], ),
+                                                        dict(_self=self, img_args=self._img_args)))
+            self._next_index += 1
+
     def capture(self):
         super(ImagesReader, self).capture()
         if not self._frame_index < self._frame_count:
             return None
-        image = ImagesReader.load_image(self._paths[self._frame_index], _self=self, img_args=self._img_args)
+        if self._pool is not None:
+            image = self._pending.popleft().get()
+            self._fill_pending()
+        else:
+            image = ImagesReader.load_image(self._paths[self._frame_index], _self=self, img_args=self._img_args)
         self._frame_index += 1
         timestamp = datetime.now()
         if self.display_results:
@@ -7,7 +7,10 @@ from EasyVision.base import lru_cache
 from .base import *
 import Pyro4
 import socket
+import threading as mt
+from collections import deque
 from EasyVision.server import Command
+from EasyVision import codec
 
 try:
     import cPickle as pickle
@@ -21,20 +24,45 @@ class PyroCapture(VisionBase):
     Uses Pyro4 remote object names. Should be used in conjunction with ``EasyVision.server``.
     Best results are achieved using EasyVision.base.server and Pyro4-ns.
 
+    In pipelined mode (``prefetch`` > 0) a background thread with its own Pyro proxy and data socket keeps requesting
+    frames, so that the next frame is already in flight while the current one is being processed. Up to ``prefetch``
+    received frames are buffered. If ``drop_stale`` is set, the oldest buffered frame is dropped when the buffer is
+    full, so that ``capture`` always returns the freshest frames, otherwise requesting is paused.
+    Dropped frames are counted in ``dropped_frames``.
     """
 
-    def __init__(self, name, nameserver=None, *args, **kwargs):
+    def __init__(self, name, nameserver=None, prefetch=0, drop_stale=False, *args, **kwargs):
+        """PyroCapture instance initialization
+
+        :param name: Pyro4 name of the remote processor stack
+        :param nameserver: Pyro4 name server host
+        :param prefetch: number of frames to request ahead of time. 0 disables pipelined mode
+        :param drop_stale: indicates whether to drop the oldest prefetched frames instead of pausing requests
+        """
         self._name = name
+        self._prefetch = prefetch
+        self._drop_stale = drop_stale
+        self._prefetch_thread = None
+        self._prefetch_running = False
+        self._prefetch_cond = mt.Condition()
+        self._prefetched = deque()
+        self._dropped_frames = 0
         with Pyro4.locateNS(host=nameserver) as ns:
             uri = ns.lookup(self._name)
 
         self._proxy = Pyro4.Proxy(uri)
-        self._sock = Pyro4.socketutil.createSocket(timeout=Pyro4.config.COMMTIMEOUT, nodelay=False)  # socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024)
-        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024*1024*10)
-        self._sock.connect(tuple(self._proxy.getsockname()))
+        self._sock = PyroCapture._connect(self._proxy)
         super(PyroCapture, self).__init__(*args, **kwargs)
 
+    @staticmethod
+    def _connect(proxy):
+        """Helper method that connects a socket for data transfer"""
+        sock = Pyro4.socketutil.createSocket(timeout=Pyro4.config.COMMTIMEOUT, nodelay=False)  # socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024*1024*10)
+        sock.connect(tuple(proxy.getsockname()))
+        return sock
+
     def __delete__(self, instance):
         self._sock.close()
 
@@ -71,13 +99,11 @@ class PyroCapture(VisionBase):
     def _hasattr(self, name):
         return self._proxy.hasattr(name)
 
-    def __receive_blob(self, blob_id):
+    def __receive_blob(self, blob_id, sock=None):
         if blob_id is not None:
-            self._sock.sendall(blob_id.encode('utf-8'))
-            size = int(Pyro4.socketutil.receiveData(self._sock, 16).decode())
-            data = Pyro4.socketutil.receiveData(self._sock, size)
-            assert(size == len(data))
-            result = pickle.loads(data)
+            sock = sock or self._sock
+            sock.sendall(blob_id.encode('utf-8'))
+            result = codec.recvall(sock)
             if isinstance(result, Frame):
                 result = result._replace(images=tuple(i._replace(source=self) for i in result.images))
             return result
@@ -100,16 +126,80 @@ class PyroCapture(VisionBase):
     def setup(self):
         super(PyroCapture, self).setup()
         self._proxy.setup()
+        if self._prefetch:
+            self._prefetched.clear()
+            self._dropped_frames = 0
+            self._prefetch_running = True
+            self._prefetch_thread = mt.Thread(target=self._prefetch_loop, args=(self._proxy._pyroUri, ))
+            self._prefetch_thread.daemon = True
+            self._prefetch_thread.start()
 
     def release(self):
+        if self._prefetch_thread is not None:
+            with self._prefetch_cond:
+                self._prefetch_running = False
+                self._prefetch_cond.notify_all()
         self._proxy.release()
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join(Pyro4.config.COMMTIMEOUT or None)
+            self._prefetch_thread = None
+            self._prefetched.clear()
         super(PyroCapture, self).release()
 
     def capture(self):
         super(PyroCapture, self).capture()
+        if self._prefetch_thread is not None:
+            return self._capture_prefetched()
         blob_id = self._proxy.capture()
         return self.__receive_blob(blob_id)
 
+    def _capture_prefetched(self):
+        """Helper method that returns the oldest prefetched frame"""
+        with self._prefetch_cond:
+            while not self._prefetched:
+                self._prefetch_cond.wait()
+            result = self._prefetched.popleft()
+            if result is None:
+                # end of stream stays in the buffer
+                self._prefetched.appendleft(result)
+            self._prefetch_cond.notify_all()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _prefetch_loop(self, uri):
+        """Background thread loop that keeps requesting frames in pipelined mode.
+        Pyro proxies should not be shared between threads, so a separate proxy and data socket are used."""
+        proxy = Pyro4.Proxy(uri)
+        sock = None
+        try:
+            sock = PyroCapture._connect(proxy)
+            while self._prefetch_running:
+                result = self.__receive_blob(proxy.capture(), sock)
+                with self._prefetch_cond:
+                    while len(self._prefetched) >= self._prefetch and not self._drop_stale and self._prefetch_running:
+                        self._prefetch_cond.wait()
+                    if len(self._prefetched) >= self._prefetch:
+                        self._prefetched.popleft()
+                        self._dropped_frames += 1
+                    self._prefetched.append(result)
+                    self._prefetch_cond.notify_all()
+                if result is None:
+                    break
+        except Exception as e:
+            with self._prefetch_cond:
+                self._prefetched.append(e)
+                self._prefetch_cond.notify_all()
+        finally:
+            if sock is not None:
+                sock.close()
+            proxy._pyroRelease()
+
+    @property
+    def dropped_frames(self):
+        """Number of prefetched frames that were dropped as stale"""
+        return self._dropped_frames
+
     def compute(self):
         super(PyroCapture, self).capture()
         blob_id = self._proxy.compute()
@@ -5,14 +5,43 @@
 
 from .base import *
 from .exceptions import DeviceNotFound
+import threading as mt
 import cv2
 from datetime import datetime
 
 
 class VideoCapture(VisionBase):
-    """Class for capturing images from a video file or capturing device using OpenCV"""
-
-    def __init__(self, path, width=None, height=None, fps=None, name=None, *args, **kwargs):
+    """Class for capturing images from a video file or capturing device using OpenCV
+
+    In latest frame mode (``grab_latest=True``) a background thread keeps grabbing frames from the device, so that they
+    do not queue up in the driver when processing is slower than the camera. ``capture`` then decodes only the newest
+    grabbed frame. Frames that were grabbed but never retrieved are counted in ``dropped_frames``.
+    Unlike ``MultiThreading`` processor, dropped frames are never decoded.
+    """
+
+    def __init__(self, path, width=None, height=None, fps=None, name=None, grab_latest=False, timeout=10,
+                 *args, **kwargs):
+        """VideoCapture instance initialization
+
+        :param path: device index or a path to a video file or stream
+        :param width: requested frame width
+        :param height: requested frame height
+        :param fps: requested frame rate
+        :param name: name of the capturing device
+        :param grab_latest: indicates whether to grab frames in a background thread and retrieve only the newest one
+        :param timeout: timeout for waiting for a grabbed frame in latest frame mode
+        """
+        self._grab_latest = grab_latest
+        self._timeout = timeout
+        self._grab_thread = None
+        self._grab_cond = mt.Condition()
+        self._grab_running = False
+        self._grabbing = False
+        self._retrieving = False
+        self._grabbed = False
+        self._grab_index = -1
+        self._grab_timestamp = None
+        self._dropped_frames = 0
         self._name = name
         self._path = path
         self._frame_index = 0
@@ -43,7 +72,22 @@ class VideoCapture(VisionBase):
 
         self._frame_index = 0
 
+        if self._grab_latest:
+            self._grabbed = self._grabbing = self._retrieving = False
+            self._grab_index = -1
+            self._dropped_frames = 0
+            self._grab_running = True
+            self._grab_thread = mt.Thread(target=self._grab_loop)
+            self._grab_thread.daemon = True
+            self._grab_thread.start()
+
     def release(self):
+        if self._grab_thread is not None:
+            with self._grab_cond:
+                self._grab_running = False
+                self._grab_cond.notify_all()
+            self._grab_thread.join(self._timeout)
+            self._grab_thread = None
         if self._capture:
             self._capture.release()
             self._is_open = False
@@ -52,6 +96,8 @@ class VideoCapture(VisionBase):
 
     def capture(self):
         super(VideoCapture, self).capture()
+        if self._grab_latest:
+            return self._capture_latest()
         if not self.is_open:
             return None
 
@@ -64,6 +110,94 @@ class VideoCapture(VisionBase):
         self._frame_index += 1
         return Frame(timestamp, self._frame_index - 1, (Image(self, image), ))
 
+    def grab(self):
+        """Grabs a frame from the device without decoding it. Does nothing in latest frame mode."""
+        super(VideoCapture, self).capture()
+        if self._grab_latest or not self.is_open:
+            return self.is_open
+        self._is_open = self._capture.grab()
+        self._grab_timestamp = datetime.now()
+        self._grabbed = self._is_open
+        return self._is_open
+
+    def retrieve(self):
+        """Decodes a frame grabbed by ``grab``. Frame is timestamped at grab time."""
+        if self._grab_latest or not self._grabbed:
+            return self.capture()
+        self._grabbed = False
+        ret, image = self._capture.retrieve()
+        if not ret:
+            return None
+        if self.display_results:
+            cv2.imshow(self.name, image)
+        self._frame_index += 1
+        return Frame(self._grab_timestamp, self._frame_index - 1, (Image(self, image), ))
+
+    def _capture_latest(self):
+        """Helper method that retrieves the newest grabbed frame in latest frame mode"""
+        with self._grab_cond:
+            while not self._grabbed and self._is_open:
+                if not self._grab_cond.wait(self._timeout) and not self._grabbed and self._is_open:
+                    raise TimeoutError("Timeout occured while waiting for a frame")
+            if not self._grabbed:
+                return None
+            self._retrieving = True
+            # grab in progress will produce even newer frame, so wait for it instead of blocking the device
+            while self._grabbing:
+                self._grab_cond.wait()
+            self._grabbed = False
+            index, timestamp = self._grab_index, self._grab_timestamp
+
+        try:
+            ret, image = self._capture.retrieve()
+        finally:
+            with self._grab_cond:
+                self._retrieving = False
+                self._grab_cond.notify_all()
+
+        if not ret:
+            return None
+        if self.display_results:
+            cv2.imshow(self.name, image)
+        self._frame_index = index + 1
+        return Frame(timestamp, index, (Image(self, image), ))
+
+    def _grab_loop(self):
+        """Background thread loop that keeps grabbing frames in latest frame mode"""
+        while True:
+            with self._grab_cond:
+                while self._retrieving and self._grab_running:
+                    self._grab_cond.wait()
+                if not self._grab_running:
+                    break
+                self._grabbing = True
+
+            ret = self._capture.grab()
+            timestamp = datetime.now()
+
+            with self._grab_cond:
+                self._grabbing = False
+                if ret:
+                    if self._grabbed:
+                        self._dropped_frames += 1
+                    self._grabbed = True
+                    self._grab_index += 1
+                    self._grab_timestamp = timestamp
+                else:
+                    # failed grab invalidates previously grabbed frame
+                    if self._grabbed:
+                        self._dropped_frames += 1
+                    self._grabbed = False
+                    self._is_open = False
+                self._grab_cond.notify_all()
+                if not ret:
+                    break
+
+    @property
+    def dropped_frames(self):
+        """Number of frames that were grabbed but never retrieved in latest frame mode"""
+        return self._dropped_frames
+
     @property
     def frame_size(self):
         return self._frame_size
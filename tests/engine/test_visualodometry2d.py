@@ -77,4 +77,69 @@ def test_visual_odometry_dataset():
             cv2.imshow('Trajectory', traj)
             cv2.waitKey(1)
 
-    cv2.waitKey(0)
\ No newline at end of file
+    cv2.waitKey(0)
+
+
+@mark.main
+def test_visual_odometry_2d_guided():
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), camera_kitti)
+    with VisualOdometry2DEngine(cam_left, feature_type='ORB', search_radius=50) as engine:
+        poses = [pose for _, pose in engine]
+        assert(poses[0] is None)
+        assert(poses[-1] is not None and engine.relative_pose is not None)
+        # forward motion
+        assert(abs(engine.relative_pose.translation[2]) > 0.9)
+
+    R, _ = cv2.Rodrigues(np.float64([0, 0.05, 0]))
+    pts = np.float32([[600, 180], [100, 50], [1200, 300]])
+    predicted = VisualOdometry2DEngine._predict_rotation(pts, R, camera_kitti.matrix)
+    rays = np.linalg.inv(camera_kitti.matrix).dot(np.vstack((pts.T, np.ones(3))))
+    expected = camera_kitti.matrix.dot(R.T.dot(rays))
+    assert(predicted == approx((expected[:2] / expected[2]).T, abs=1e-3))
+    assert(VisualOdometry2DEngine._predict_rotation(pts, None, camera_kitti.matrix) == approx(pts))
+
+
+@mark.main
+def test_visual_odometry_2d_tracking():
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    for feature_type in ('FAST', 'GFTT'):
+        cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), camera_kitti)
+        with VisualOdometry2DEngine(cam_left, feature_type=feature_type, min_features=0) as engine:
+            extractor = engine.vision.get_source('FeatureExtraction')
+            assert(not extractor.enabled)
+            frame, pose = engine.compute()
+            assert(pose is None)
+            assert(frame.images[0].features is None)
+            detected = len(engine._last_kps)
+
+            counts = []
+            for _, pose in engine:
+                counts.append(len(engine._last_kps))
+                # forward motion
+                assert(abs(engine.relative_pose.translation[2]) > 0.9)
+            # features are not detected again, while there are enough tracked points
+            assert(detected >= counts[0] >= counts[1] > 100)
+        assert(extractor.enabled)
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), camera_kitti)
+    with VisualOdometry2DEngine(cam_left, feature_type='FAST', min_features=10 ** 6) as engine:
+        engine.compute()
+        frame, pose = engine.compute()
+        assert(pose is not None)
+        # all features of the current frame are detected again
+        assert(len(engine._last_kps) == len(engine._detect_features(frame.images[0])))
+
+    # nothing detected on a blank frame is detected again instead of tracked
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), camera_kitti)
+    with VisualOdometry2DEngine(cam_left, feature_type='FAST') as engine:
+        frame, _ = engine.compute()
+        empty = np.zeros((0, 2), np.float32)
+        last, current = engine._track_features(engine._reference, engine._reference, empty)
+        assert(len(last) == len(current) == 0)
+        engine._last_kps = empty
+        frame, pose = engine.compute()
+        assert(pose is None)
+        assert(len(engine._last_kps) > 100)
@@ -35,5 +35,26 @@ def test_visual_odometry_3d2d_debug_kitti():
     common_test_visual_odometry_kitti('FREAK', mp=True, ocl=False, debug=True, color=cv2.COLOR_BGR2GRAY, odometry_class=VisualOdometry3D2DEngine, pose="00")
 
 
+@mark.main
+def test_visual_odometry_3d2d_guided():
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), camera_kitti)
+    with VisualOdometry3D2DEngine(cam_left, feature_type='ORB', search_radius=50) as engine:
+        poses = [pose for _, pose in engine]
+        assert(poses[-1] is not None and engine.relative_pose is not None)
+
+    rs = np.random.RandomState(0)
+    points = rs.uniform((-10, -5, 5), (10, 5, 50), (20, 3))
+    r, t = np.float64([0.01, -0.02, 0.03]), np.float64([0.1, 0.2, -1.0])
+    expected, _ = cv2.projectPoints(points, r, t, camera_kitti.matrix, None)
+    # odometry engines keep the inverse of solvePnP pose
+    R, _ = cv2.Rodrigues(-r)
+    predicted = VisualOdometry3D2DEngine._predict_projection(points, R, -t, camera_kitti.matrix)
+    assert(predicted == approx(expected.reshape(-1, 2)))
+    predicted = VisualOdometry3D2DEngine._predict_projection(-points, R, -t, camera_kitti.matrix)
+    assert(np.isnan(predicted).all())
+
+
 if __name__ == "__main__":
     common_test_visual_odometry_kitti('FREAK', mp=False, ocl=True, debug=False, color=cv2.COLOR_BGR2GRAY, odometry_class=VisualOdometry3D2DEngine)
@@ -89,3 +89,163 @@ def test_visual_odometry_kitti_stereo():
                 break
 
     cv2.waitKey(0)
+
+
+@mark.main
+def test_visual_odometry_stereo_guided():
+    camera = StereoCamera(camera_kitti, camera_kitti_right, R_kitti, T_kitti, None, None, None)
+
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+    images_kitti_r = ['test_data/kitti00/image_1/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), FeatureExtraction(cam_right, 'ORB'), camera)
+    with VisualOdometryStereoEngine(cam, search_radius=30) as engine:
+        poses = [pose for _, pose in engine]
+        assert(poses[0] is None)
+        assert(poses[-1] is not None and engine.relative_pose is not None)
+
+
+@mark.main
+def test_visual_odometry_stereo_rows():
+    camera = StereoCamera(camera_kitti, camera_kitti_right, R_kitti, T_kitti, None, None, None)
+
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+    images_kitti_r = ['test_data/kitti00/image_1/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), FeatureExtraction(cam_right, 'ORB'), camera)
+    with VisualOdometryStereoEngine(cam, stereo_matching='rows') as engine:
+        frame = cam.capture()
+        assert(not frame.rectified)
+        left, right, points, descriptors = engine._calculate_3d(frame.images[0].features, frame.images[1].features)
+        assert(len(left) == len(right) == len(points) == len(descriptors))
+        assert(np.abs(left[:, 1] - right[:, 1]).max() < 2)
+        disparity = left[:, 0] - right[:, 0]
+        assert(disparity.min() > 0 and disparity.max() < 300)
+        assert((points[:, 2] > 0).all())
+
+        engine.stereo_matching = 'full'
+        full = engine._calculate_3d(frame.images[0].features, frame.images[1].features)
+        assert(len(left) > len(full[0]))
+        engine.stereo_matching = 'auto'
+        auto = engine._calculate_3d(frame.images[0].features, frame.images[1].features, rectified=True)
+        assert(np.array_equal(auto[0], left))
+
+        poses = [pose for _, pose in engine]
+        assert(poses[-1] is not None)
+
+        with raises(ValueError):
+            engine.stereo_matching = 'dense'
+
+
+@mark.main
+def test_visual_odometry_stereo_no_features(monkeypatch):
+    camera = StereoCamera(camera_kitti, camera_kitti_right, R_kitti, T_kitti, None, None, None)
+
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+    images_kitti_r = ['test_data/kitti00/image_1/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), FeatureExtraction(cam_right, 'ORB'), camera)
+    with VisualOdometryStereoEngine(cam, stereo_matching='rows') as engine:
+        engine.compute()
+        assert(engine._last_3dfeatures is not None)
+
+        # no stereo features in the second frame
+        monkeypatch.setattr(engine, '_calculate_3d', lambda *args: None)
+        frame, pose = engine.compute()
+        assert(frame is not None and pose is None)
+        assert(engine._last_3dfeatures is None)
+
+        # the third frame starts over
+        monkeypatch.undo()
+        frame, pose = engine.compute()
+        assert(pose is None)
+        assert(engine._last_3dfeatures is not None)
+
+
+@mark.main
+def test_visual_odometry_stereo_disparity():
+    f, cx, cy = camera_kitti.focal_point[0], camera_kitti.center[0], camera_kitti.center[1]
+    Q = [[1, 0, 0, -cx], [0, 1, 0, -cy], [0, 0, 0, f], [0, 0, -1.0 / T_kitti[0][0], 0]]
+    camera = StereoCamera(camera_kitti, camera_kitti_right, R_kitti, T_kitti, None, None, Q)
+
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+    images_kitti_r = ['test_data/kitti00/image_1/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), cam_right, camera, calculate_disparity=True,
+                                 num_disparities=128, block_size=11, disparity_scale=0.5)
+    with VisualOdometryStereoEngine(cam, stereo_matching='disparity') as engine:
+        assert(engine.feature_type == 'ORB')
+        frame = cam.capture()
+        assert(frame.images[1].features is None)
+        left, right, points, descriptors = engine._sample_disparity(frame.images[0].features, frame.images[2].image)
+        assert(len(left) == len(right) == len(points) == len(descriptors))
+        assert(np.array_equal(left[:, 1], right[:, 1]))
+        disparity = left[:, 0] - right[:, 0]
+        assert((disparity > 0).all())
+        # depth of rectified stereo is focal length * baseline / disparity
+        assert(points[:, 2] == approx(-f * T_kitti[0][0] / disparity, rel=1e-4))
+
+        poses = [pose for _, pose in engine]
+        assert(poses[-1] is not None and engine.relative_pose is not None)
+
+    # triangulated depth of the same features agrees with the disparity map
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), FeatureExtraction(cam_right, 'ORB'), camera)
+    with VisualOdometryStereoEngine(cam, stereo_matching='rows') as engine:
+        frame = cam.capture()
+        rows = engine._calculate_3d(frame.images[0].features, frame.images[1].features)
+    _, ia, ib = np.intersect1d(left[:, 0] * 10000 + left[:, 1], rows[0][:, 0] * 10000 + rows[0][:, 1],
+                               return_indices=True)
+    assert(len(ia) > 100)
+    assert(np.median(points[ia, 2] / rows[2][ib, 2]) == approx(1, abs=0.1))
+
+    with raises(ValueError):
+        VisualOdometryStereoEngine(CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), cam_right,
+                                                          camera._replace(Q=None)), stereo_matching='disparity')
+
+    with raises(ValueError):
+        VisualOdometryStereoEngine(CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), cam_right, camera,
+                                                          calculate_disparity=True, async_disparity=True),
+                                   stereo_matching='disparity')
+
+
+@mark.main
+def test_visual_odometry_stereo_disparity_invalid(monkeypatch):
+    f, cx, cy = camera_kitti.focal_point[0], camera_kitti.center[0], camera_kitti.center[1]
+    Q = [[1, 0, 0, -cx], [0, 1, 0, -cy], [0, 0, 0, f], [0, 0, -1.0 / T_kitti[0][0], 0]]
+    camera = StereoCamera(camera_kitti, camera_kitti_right, R_kitti, T_kitti, None, None, Q)
+
+    images_kitti_l = ['test_data/kitti00/image_0/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+    images_kitti_r = ['test_data/kitti00/image_1/{}.png'.format(str(i).zfill(6)) for i in range(3)]
+
+    cam_left = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_l), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam_right = CalibratedCamera(ImageTransform(ImagesReader(images_kitti_r), ocl=False, color=cv2.COLOR_BGR2GRAY), None)
+    cam = CalibratedStereoCamera(FeatureExtraction(cam_left, 'ORB'), cam_right, camera, calculate_disparity=True,
+                                 num_disparities=128, block_size=11, disparity_scale=0.5)
+    capture = cam.capture
+
+    def capture_invalid():
+        frame = capture()
+        disparity = frame.images[2]
+        disparity = disparity._replace(image=np.zeros_like(disparity.image))
+        return frame._replace(images=frame.images[:2] + (disparity,))
+
+    with VisualOdometryStereoEngine(cam, stereo_matching='disparity') as engine:
+        engine.compute()
+        assert(engine._last_3dfeatures is not None)
+
+        # second frame has no valid disparity
+        monkeypatch.setattr(cam, 'capture', capture_invalid)
+        frame, pose = engine.compute()
+        assert(engine._sample_disparity(frame.images[0].features, frame.images[2].image) is None)
+        assert(pose is None)
+        assert(engine._last_3dfeatures is None)
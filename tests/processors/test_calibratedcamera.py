@@ -48,6 +48,92 @@ def test_calibrated_camera_setter():
         assert(not vision._calibrate)
 
 
+@mark.main
+def test_calibrated_camera_buffers():
+    vision = ImagesReader(images_left)
+    with CalibratedCamera(vision, PinholeCamera((640, 480), M_left, d_left)) as vision:
+        frame = vision.capture()
+        source_frame = vision.source.capture()
+        image = source_frame.images[0].image.copy()
+        next_frame = vision.process(source_frame.images[0])
+        # output must never alias the input or the previous frame that is still referenced
+        assert(next_frame.image is not source_frame.images[0].image)
+        assert(next_frame.image is not frame.images[0].image)
+        assert(np.array_equal(source_frame.images[0].image, image))
+
+        # once the frames are released their buffers are reused
+        mapped = (id(frame.images[0].image), id(next_frame.image))
+        del frame, next_frame
+        assert(id(vision.capture().images[0].image) in mapped)
+        assert(len(vision.buffers) == 2)
+
+
+@mark.main
+def test_camera_digest():
+    camera = PinholeCamera((640, 480), M_left, d_left)
+    assert(camera.digest == PinholeCamera.fromdict(camera.todict()).digest)
+    assert(camera.digest != PinholeCamera((640, 480), M_left, d_right).digest)
+    assert(camera.digest != PinholeCamera((640, 480), M_left, d_left, np.eye(3), M_left).digest)
+
+
+@mark.main
+def test_calibrated_camera_maps():
+    camera = PinholeCamera((640, 480), M_left, d_left)
+    with CalibratedCamera(ImagesReader(images_left), camera, fixed_point=False, interpolation=cv2.INTER_LINEAR) as vision:
+        assert(vision._map1.dtype == np.float32)
+        expected = vision.capture().images[0].image
+    with CalibratedCamera(ImagesReader(images_left), camera, interpolation=cv2.INTER_LINEAR) as vision:
+        assert(vision._map1.dtype == np.int16 and vision._map1.shape == (480, 640, 2))
+        assert(vision._map2.dtype == np.uint16)
+        image = vision.capture().images[0].image
+        assert(image.shape == expected.shape)
+        assert(np.abs(np.int16(image) - expected).mean() < 1)
+        assert(vision.undistorted_camera.size == (640, 480))
+        assert(np.all(vision.undistorted_camera.matrix == camera.matrix))
+
+    with CalibratedCamera(ImagesReader(images_left), camera, alpha=0, crop=True) as vision:
+        image = vision.capture().images[0].image
+        undistorted = vision.undistorted_camera
+        assert(image.shape[1::-1] == undistorted.size)
+        assert(undistorted.width <= 640 and undistorted.height <= 480)
+        assert(not np.any(undistorted.distortion))
+
+
+@mark.main
+def test_calibrated_camera_map_cache(tmpdir, mocker):
+    camera = PinholeCamera((640, 480), M_left, d_left)
+    with CalibratedCamera(ImagesReader(images_left), camera, map_cache=str(tmpdir)) as vision:
+        map1 = vision._map1
+    assert(len(tmpdir.listdir()) == 1)
+
+    compute = mocker.spy(CalibratedCamera, '_compute_maps')
+    with CalibratedCamera(ImagesReader(images_left), camera, map_cache=str(tmpdir)) as vision:
+        assert(np.array_equal(vision._map1, map1))
+        assert(vision.capture() is not None)
+    assert(compute.call_count == 0)
+
+    with CalibratedCamera(ImagesReader(images_left), camera, map_cache=str(tmpdir), alpha=1) as vision:
+        pass
+    assert(compute.call_count == 1)
+    assert(len(tmpdir.listdir()) == 2)
+
+
+@mark.main
+def test_calibrated_camera_map_cache_overwrite(tmpdir):
+    camera = PinholeCamera((640, 480), M_left, d_left)
+    with CalibratedCamera(ImagesReader(images_left), camera, map_cache=str(tmpdir)) as vision:
+        map1 = vision._map1
+    path, = tmpdir.listdir()
+
+    # unreadable cache file is overwritten, temporary files are not left behind
+    path.write_binary(b'corrupted')
+    with CalibratedCamera(ImagesReader(images_left), camera, map_cache=str(tmpdir)) as vision:
+        assert(np.array_equal(vision._map1, map1))
+    assert(tmpdir.listdir() == [path])
+    with np.load(str(path)) as data:
+        assert(np.array_equal(data['map1'], map1))
+
+
 @mark.slow
 def test_calibrate():
     vision = ImagesReader(images_left)
@@ -76,4 +162,82 @@ def test_calibrated():
 
         for frame in vision:
             pass
-            cv2.waitKey(0)
\ No newline at end of file
+            cv2.waitKey(0)
+
+
+@mark.main
+def test_calibrated_camera_points():
+    camera = PinholeCamera((640, 480), M_left, d_left)
+    with raises(ValueError):
+        CalibratedCamera(ImagesReader(images_left), camera, mode='pixels')
+
+    with FeatureExtraction(ImagesReader(images_left), 'ORB', nfeatures=500) as vision:
+        expected = vision.capture().images[0]
+
+    calibrated = CalibratedCamera(ImagesReader(images_left), camera, mode='points')
+    with FeatureExtraction(calibrated, 'ORB', nfeatures=500) as vision:
+        assert(calibrated._map1 is None)
+        assert(calibrated.undistorted_camera.size == (640, 480))
+        image = vision.capture().images[0]
+        assert(np.array_equal(image.image, expected.image))
+        assert(np.array_equal(image.features.descriptors, expected.features.descriptors))
+
+        points = cv2.undistortPoints(expected.features.pts.reshape(-1, 1, 2), camera.matrix, camera.distortion,
+                                     P=camera.matrix).reshape(-1, 2)
+        assert(image.features.pts == approx(points, abs=1e-3))
+        assert(image.features.points.sizes == approx(expected.features.points.sizes))
+
+
+@mark.slow
+def test_find_chessboard_corners():
+    from EasyVision.processors.calibratedcamera import find_chessboard_corners, find_chessboard_corners_batch
+    image = cv2.imread(images_left[0], cv2.IMREAD_GRAYSCALE)
+    ret, expected = cv2.findChessboardCorners(image, (9, 6), None)
+    expected = cv2.cornerSubPix(image, expected, (11, 11), (-1, -1),
+                                (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
+
+    ret, corners, size = find_chessboard_corners(images_left[0], (9, 6), max_size=320)
+    assert(ret and size == (640, 480))
+    assert(corners.reshape(-1, 2) == approx(expected.reshape(-1, 2), abs=0.1))
+
+    results = find_chessboard_corners_batch(images_left[:4] + ["test_data/34838518832_fd00147042_k.jpg"], (9, 6),
+                                            processes=2)
+    assert([ret for ret, _, _ in results] == [True, True, True, True, False])
+
+
+@mark.slow
+def test_calibrate_offline():
+    cam = CalibratedCamera.calibrate_offline(images_left, grid_shape=(9, 6), processes=2)
+    assert(isinstance(cam, PinholeCamera))
+    assert(cam.size == (640, 480))
+    assert(cam.focal_point[0] == approx(M_left[0][0], rel=5e-2))
+    assert(cam.center[1] == approx(M_left[1][2], rel=5e-2))
+    with raises(ValueError):
+        CalibratedCamera.calibrate_offline(images_left[:1], grid_shape=(5, 5), processes=1)
+
+
+@mark.slow
+def test_select_calibration_views():
+    from EasyVision.processors.calibratedcamera import find_chessboard_corners_batch, chessboard_object_points, \
+        select_calibration_views
+    imgpoints = [corners for ret, corners, _ in find_chessboard_corners_batch(images_left, (9, 6), processes=1) if ret]
+    objpoints = [chessboard_object_points((9, 6), 1)] * len(imgpoints)
+
+    assert(select_calibration_views(objpoints, imgpoints, (640, 480)) == list(range(len(imgpoints))))
+    indices = select_calibration_views(objpoints, imgpoints, (640, 480), max_views=6)
+    assert(len(indices) == 6 and indices == sorted(set(indices)))
+
+    # duplicate views add no coverage and are not selected
+    duplicated = imgpoints[:3] * 4
+    indices = select_calibration_views(objpoints[:1] * 12, duplicated, (640, 480), max_views=3)
+    assert(sorted(i % 3 for i in indices) == [0, 1, 2])
+
+    # a view with corrupted corners is dropped by refinement
+    corrupted = list(imgpoints)
+    corrupted[5] = imgpoints[5] + np.random.RandomState(0).normal(0, 8, imgpoints[5].shape).astype(np.float32)
+    indices = select_calibration_views(objpoints, corrupted, (640, 480), refine=2)
+    assert(5 not in indices)
+
+    # stereo views are selected in pairs
+    indices = select_calibration_views(objpoints, list(zip(imgpoints, imgpoints)), (640, 480), max_views=4)
+    assert(len(indices) == 4)
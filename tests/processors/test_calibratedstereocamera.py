@@ -76,6 +76,21 @@ def test_stereo_calibrate():
             assert(False)
 
 
+@mark.slow
+def test_stereo_calibrate_offline():
+    cam = CalibratedStereoCamera.calibrate_offline(images_left, images_right, grid_shape=(9, 6), square_size=1,
+                                                   processes=2)
+    assert(isinstance(cam, StereoCamera))
+    assert(cam.left.size == (640, 480))
+    assert(cam.left.focal_point[0] == approx(left_camera.focal_point[0], rel=1e-1))
+    assert(cam.right.center[0] == approx(right_camera.center[0], rel=1e-1))
+    assert(cam.T.ravel() == approx(np.array(T).ravel(), rel=1e-1, abs=1e-1))
+    assert(StereoCamera.fromdict(cam.todict()).left.size == cam.left.size)
+
+    with raises(ValueError):
+        CalibratedStereoCamera.calibrate_offline(images_left, images_right[:-1])
+
+
 @mark.complex
 def test_stereo_calibrated():
     from datetime import datetime
@@ -137,3 +152,43 @@ def test_stereo_properties():
         assert(s.exposure == (5, 5))
         assert(s.focus == (6, 6))
         assert(s.whitebalance == (7, 7))
+
+
+@mark.main
+def test_stereo_rectified():
+    camera = StereoCamera(left_camera, right_camera, R, T, E, F, Q)
+    left = CalibratedCamera(ImagesReader(images_left), camera.left)
+    right = CalibratedCamera(ImagesReader(images_right), camera.right)
+    with CalibratedStereoCamera(left, right, camera) as vision:
+        assert(vision.rectified)
+        frame = vision.capture()
+        assert(frame.rectified)
+        found_l, corners_l = cv2.findChessboardCorners(frame.images[0].image, (9, 6))
+        found_r, corners_r = cv2.findChessboardCorners(frame.images[1].image, (9, 6))
+        assert(found_l and found_r)
+        assert(np.abs(corners_l[..., 1] - corners_r[..., 1]).mean() < 2.0)
+
+    left = CalibratedCamera(ImagesReader(images_left), camera.left)
+    right = CalibratedCamera(ImagesReader(images_right), camera.right)
+    with CalibratedStereoCamera(left, right, camera, rectify=False) as vision:
+        assert(not vision.capture().rectified)
+
+    unrectified = StereoCamera(left_camera._replace(rectify=None), right_camera, R, T, E, F, Q)
+    vision = CalibratedStereoCamera(CalibratedCamera(VisionSubclass(), None), CalibratedCamera(VisionSubclass(), None),
+                                    unrectified)
+    assert(not vision.rectified)
+    with raises(ValueError):
+        CalibratedStereoCamera(CalibratedCamera(VisionSubclass(), None), CalibratedCamera(VisionSubclass(), None),
+                               unrectified, rectify=True)
+
+    left = CalibratedCamera(ImagesReader(images_left), camera.left, mode='points')
+    right = CalibratedCamera(ImagesReader(images_right), camera.right, mode='points')
+    with CalibratedStereoCamera(left, right, camera) as vision:
+        assert(not vision.rectified)
+        assert(not vision.capture().rectified)
+
+    left = CalibratedCamera(ImagesReader(images_left), camera.left, mode='points')
+    right = CalibratedCamera(ImagesReader(images_right), camera.right, mode='points')
+    with raises(ValueError):
+        with CalibratedStereoCamera(left, right, camera, rectify=True):
+            pass
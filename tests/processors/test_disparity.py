@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from pytest import raises, mark
+from EasyVision.vision import *
+from EasyVision.processors import *
+import numpy as np
+from tests.common import *
+
+
+def rectified_pair():
+    camera = StereoCamera(left_camera, right_camera, R, T, E, F, Q)
+    left = CalibratedCamera(ImagesReader(images_left), camera.left)
+    right = CalibratedCamera(ImagesReader(images_right), camera.right)
+    with CalibratedStereoCamera(left, right, camera) as vision:
+        frame = vision.capture()
+    return frame.images[0].image, frame.images[1].image
+
+
+@mark.main
+def test_stereo_disparity():
+    left, right = rectified_pair()
+    for algorithm in StereoDisparity.ALGORITHMS:
+        disparity = StereoDisparity(algorithm, num_disparities=60, block_size=15)
+        disparity.setup()
+        assert(disparity.num_disparities == 64)
+        disp, points = disparity.compute(left, right)
+        disparity.release()
+        assert(disp.shape == left.shape[:2])
+        assert(disp.dtype == np.int16)
+        assert(points is None)
+        assert((disp > 0).any())
+
+    with raises(ValueError):
+        StereoDisparity('XYZ')
+    with raises(ValueError):
+        StereoDisparity(scale=2)
+
+
+@mark.main
+def test_stereo_disparity_scale_roi():
+    left, right = rectified_pair()
+    disparity = StereoDisparity('SGBM', num_disparities=64, block_size=5)
+    disparity.setup()
+    full, _ = disparity.compute(left, right)
+    disparity.release()
+
+    disparity = StereoDisparity('SGBM', num_disparities=64, block_size=5, scale=0.5)
+    disparity.setup()
+    small, _ = disparity.compute(left, right)
+    disparity.release()
+    assert(small.shape == full.shape)
+    valid = (small > 0) & (full > 0)
+    assert(np.median(np.abs(np.int32(small[valid]) - full[valid])) < 3 * 16)
+
+    roi = (200, 100, 240, 200)
+    disparity = StereoDisparity('BM', num_disparities=64, block_size=15)
+    disparity.setup()
+    full, _ = disparity.compute(left, right)
+    disparity.release()
+    disparity = StereoDisparity('BM', num_disparities=64, block_size=15, roi=roi)
+    disparity.setup()
+    cropped, _ = disparity.compute(left, right)
+    disparity.release()
+    assert(cropped.shape == full.shape)
+    assert((cropped[:100] == StereoDisparity.INVALID).all())
+    assert((cropped[:, :200] == StereoDisparity.INVALID).all())
+    assert(np.array_equal(cropped[110:290, 210:430], full[110:290, 210:430]))
+
+
+@mark.main
+def test_stereo_disparity_async():
+    left, right = rectified_pair()
+    black = np.zeros_like(left)
+    disparity = StereoDisparity('BM', num_disparities=64, asynchronous=True)
+    disparity.setup()
+    expected, _ = disparity.compute(left, right)
+    first, _ = disparity.submit(left, right)
+    second, _ = disparity.submit(black, black)
+    third, _ = disparity.submit(black, black)
+    disparity.release()
+    assert(np.array_equal(first, expected))
+    assert(np.array_equal(second, expected))
+    assert(not np.array_equal(third, expected))
+
+
+@mark.main
+def test_stereo_camera_disparity():
+    camera = StereoCamera(left_camera, right_camera, R, T, E, F, Q)
+    left = CalibratedCamera(ImagesReader(images_left), camera.left)
+    right = CalibratedCamera(ImagesReader(images_right), camera.right)
+    with CalibratedStereoCamera(left, right, camera, calculate_disparity=True, num_disparities=64,
+                                disparity_algorithm='SGBM', block_size=5, async_disparity=True,
+                                reproject=True) as vision:
+        frame = vision.capture()
+        assert(len(frame.images) == 3)
+        assert(frame.processor_mask == "110")
+        disparity = frame.images[2]
+        assert(disparity.source is vision)
+        assert(disparity.image.shape == frame.images[0].image.shape[:2])
+        assert(disparity.feature_type == 'points3d')
+        assert(isinstance(disparity.features, Features))
+        assert(disparity.features.points is None)
+        assert(disparity.features.points3d.shape == frame.images[0].image.shape[:2] + (3,))
+        valid = disparity.image > 0
+        depth = disparity.features.points3d[..., 2][valid]
+        assert(np.isfinite(depth).all() and (depth > 0).all())
@@ -6,6 +6,7 @@ from pytest import raises, approx, mark
 from EasyVision.vision import *
 from EasyVision.processors import *
 import cv2
+import numpy as np
 
 
 images = ["test_data/34838518832_fd00147042_k.jpg", "test_data/2732011028_f0f033e678_b.jpg", "test_data/4472701625_6b23da9a23_b.jpg"]
@@ -48,3 +49,284 @@ def test_load_and_display_images():
             cv2.waitKey(0)
 
         assert(frame_count == 3)
+
+
+@mark.main
+def test_keypoints():
+    image = ImagesReader.load_image(images[0])
+    orb = cv2.ORB_create(1000)
+    kps, descriptors = orb.detectAndCompute(image.image, None)
+
+    features = Features(kps, descriptors)
+    assert(isinstance(features.points, KeyPoints))
+    assert(len(features.points) == len(kps))
+    assert(features.pts.shape == (len(kps), 2))
+    assert(features.pts.dtype == np.float32)
+    assert(features.pts.flags.c_contiguous)
+    assert(features.keypoints is features.keypoints)
+    assert(features.points[5].pt == approx(kps[5].pt))
+    assert(features.points[5].octave == kps[5].octave)
+
+    subset = features.points[[1, 3, 5]]
+    assert(isinstance(subset, KeyPoints))
+    assert(subset.pts[2] == approx(kps[5].pt))
+    assert(subset.keypoints[2].size == approx(kps[5].size))
+
+    restored = Features.fromdict(features.todict())
+    assert(restored.points == features.points)
+    assert(Features.frombytes(features.tobytes()).points == features.points)
+
+
+@mark.main
+def test_tiled_extraction():
+    image = ImagesReader.load_image(images[0])
+    with FeatureExtraction(ImagesReader(images), 'ORB', nfeatures=2400, grid=(4, 3)) as vision:
+        features = vision.process(image).features
+        tiles = vision.tiles(image.image.shape[1::-1])
+
+    assert(len(tiles) == 12)
+    assert(len(features.points) == len(features.descriptors))
+    pts = features.pts
+    counts = [((pts[:, 0] >= x0) & (pts[:, 0] < x1) & (pts[:, 1] >= y0) & (pts[:, 1] < y1)).sum()
+              for (x0, y0, x1, y1), _ in tiles]
+    assert(max(counts) == 200)
+    assert(sum(counts) == len(pts))
+
+    # descriptors near tile borders are computed the same way as for the whole image
+    level0 = np.flatnonzero(features.points.octaves == 0)
+    keypoints, descriptors = cv2.ORB_create().compute(image.image, [features.points.keypoints[i] for i in level0])
+    assert(len(keypoints) == len(level0))
+    assert(np.array_equal(descriptors, features.descriptors[level0]))
+
+    with raises(ValueError):
+        FeatureExtraction(ImagesReader(images), 'ORB', grid=(0, 3))
+
+
+@mark.main
+def test_anms():
+    from EasyVision.processors.featureextractor import anms
+    rs = np.random.RandomState(0)
+    pts = rs.uniform(0, 100, (400, 2))
+    pts[:40] = pts[40:80] + rs.normal(0, 0.1, (40, 2))
+    responses = rs.uniform(0, 1, 400)
+
+    radii = np.array([min([np.square(pts[i] - pts[j]).sum() for j in range(len(pts))
+                           if responses[j] * 0.9 > responses[i]] or [np.inf]) for i in range(len(pts))])
+    indices = anms(pts, responses, 50)
+    assert(len(indices) == 50 and np.all(np.diff(indices) > 0))
+    assert(np.sort(radii[indices]) == approx(np.sort(radii)[-50:]))
+    assert(np.array_equal(anms(pts[:10], responses[:10], 50), np.arange(10)))
+
+    image = ImagesReader.load_image(images[0])
+    with FeatureExtraction(ImagesReader(images), 'ORB', max_features=500) as vision:
+        features = vision.process(image).features
+        assert(vision.max_features == 500)
+    assert(len(features.points) == len(features.descriptors) == 500)
+
+
+@mark.main
+def test_feature_budget():
+    image = ImagesReader.load_image(images[0])
+    budget = FeatureBudget(target_count=500)
+    with FeatureExtraction(ImagesReader(images), 'ORB', budget=budget) as vision:
+        threshold = budget.threshold
+        assert(threshold == 20)
+        for i in range(8):
+            features = vision.process(image).features
+            assert(len(features.points) == 500)
+        assert(budget.threshold > threshold)
+        assert(vision._descriptor.getFastThreshold() == int(round(budget.threshold)))
+        assert('extraction' in budget.times)
+
+    budget = FeatureBudget(target_time=1e-3, min_features=200, max_features=4000)
+    with FeatureExtraction(ImagesReader(images), 'ORB', budget=budget) as vision:
+        counts = [len(vision.process(image).features.points) for i in range(4)]
+    assert(counts[0] == 4000 and counts == sorted(counts, reverse=True) and counts[-1] < 4000)
+    budget.report('matching', 1.0)
+    assert(budget.update(1000) < counts[-1])
+
+    with raises(ValueError):
+        FeatureBudget()
+    with raises(TypeError):
+        FeatureExtraction(ImagesReader(images), 'ORB', budget=500)
+
+
+class MatcherBase(object):
+    def setup(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class Matcher(FeatureMatchingMixin, MatcherBase):
+    pass
+
+
+@mark.main
+def test_matches():
+    image = ImagesReader.load_image(images[0]).image
+    shifted = np.ascontiguousarray(image[40:, 25:])
+    orb = cv2.ORB_create(2000)
+    featuresA = Features(*orb.detectAndCompute(image, None))
+    featuresB = Features(*orb.detectAndCompute(shifted, None))
+
+    matcher = Matcher()
+    matcher.setup()
+    matches = matcher._match(featuresA.descriptors, featuresB.descriptors, 'ORB', 0.7, 64, 10)
+    assert(isinstance(matches, Matches))
+    assert(matches.count > 100)
+    assert(matches.query_idx.dtype == np.int32 and matches.distance.dtype == np.float32)
+    assert(np.all(matches.distance < 64))
+    shift = matches.query(featuresA) - matches.train(featuresB)
+    assert(np.median(shift, axis=0) == approx([25, 40]))
+    assert(np.array_equal(matches.train(featuresB.descriptors), featuresB.descriptors[matches.train_idx]))
+    assert(np.array_equal(matches.query(cv2.UMat(featuresA.descriptors)), featuresA.descriptors[matches.query_idx]))
+    assert(matches.train(featuresB.points) == featuresB.points[matches.train_idx])
+
+    subset = matches.subset(matches.distance < 20)
+    assert(subset.count == (matches.distance < 20).sum())
+    dmatches = subset.todmatches()
+    assert([m.queryIdx for m in dmatches] == subset.query_idx.tolist())
+    assert(matcher._match_features(featuresA.descriptors, featuresB.descriptors, 'ORB', 0.7, 64, 10)[0].trainIdx ==
+           matches.train_idx[0])
+    assert(matcher._match(featuresA.descriptors, featuresB.descriptors, 'ORB', 0.7, 64, 100000) is None)
+
+    rs = np.random.RandomState(0)
+    train = rs.uniform(0, 1, (500, 16)).astype(np.float32)
+    order = rs.permutation(500)[:200]
+    query = train[order] + rs.normal(0, 0.01, (200, 16)).astype(np.float32)
+    matches = matcher._match(query, train, 'SIFT', 0.8, 1.0, 10)
+    assert(matches.count > 190)
+    assert(np.array_equal(matches.train_idx, order[matches.query_idx]))
+    assert(matches.distance == approx(np.linalg.norm(query[matches.query_idx] - train[matches.train_idx], axis=1),
+                                      rel=1e-3))
+
+
+@mark.main
+def test_index_cache():
+    rs = np.random.RandomState(0)
+    views = [rs.randint(0, 256, (300, 32)).astype(np.uint8) for _ in range(3)]
+    query = views[1][50:150].copy()
+
+    matcher = Matcher(index_cache_size=2, matcher='flann')
+    matcher.setup()
+    index = matcher._get_index(views[0], 'ORB')
+    assert(matcher._get_index(views[0], 'ORB') is index)
+    assert(matcher._get_index(views[0].copy(), 'ORB') is not index)
+
+    matches = matcher._match(query, views[1], 'ORB')
+    assert(matches.count > 90)
+    assert(np.array_equal(matches.train_idx, matches.query_idx + 50))
+    assert(len(matcher._index_cache) == 2)
+    assert(matcher._get_index(views[1], 'ORB') is matcher._get_index(views[1], 'ORB'))
+    assert(matcher._get_index(views[0], 'ORB') is not index)
+
+    index = matcher._get_index(views[2], 'ORB', key=('view', 1))
+    assert(matcher._get_index(views[1], 'ORB', key=('view', 1)) is index)
+    assert(matcher._get_index(views[0][:1], 'ORB') is None)
+
+    matcher.index_cache_size = 1
+    assert(len(matcher._index_cache) == 1)
+    matcher.index_cache_size = 0
+    assert(matcher._get_index(views[2], 'ORB') is not matcher._get_index(views[2], 'ORB'))
+    assert(not matcher._index_cache)
+    matcher.index_cache_size = 2
+    matcher._get_index(views[2], 'ORB')
+    matcher.release()
+    assert(not matcher._index_cache)
+
+
+@mark.main
+def test_matcher_selection(tmpdir):
+    image = ImagesReader.load_image(images[0]).image
+    shifted = np.ascontiguousarray(image[40:, 25:])
+    orb = cv2.ORB_create(500)
+    descriptorsA = orb.detectAndCompute(image, None)[1]
+    descriptorsB = orb.detectAndCompute(shifted, None)[1]
+
+    matcher = Matcher()
+    matcher.setup()
+    assert(matcher.matcher == 'auto')
+    assert(matcher.matcher_config('ORB') is Matcher.DEFAULT_BINARY_CONFIG)
+    assert(matcher.matcher_config('SIFT') is Matcher.DEFAULT_FLOAT_CONFIG)
+    assert(matcher._select_matcher('ORB', 500, 500) == 'bruteforce')
+    assert(matcher._select_matcher('ORB', 1000, 1000) == 'flann')
+
+    exact = matcher._match(descriptorsA, descriptorsB, 'ORB', 0.7, 64, 10)
+    assert(not matcher._index_cache)
+    matcher.matcher = 'flann'
+    approximate = matcher._match(descriptorsA, descriptorsB, 'ORB', 0.7, 64, 10)
+    assert(len(matcher._index_cache) == 1)
+    common = np.intersect1d(exact.query_idx, approximate.query_idx)
+    assert(len(common) > 0.8 * exact.count)
+    assert(np.mean(exact.subset(np.isin(exact.query_idx, common)).train_idx ==
+                   approximate.subset(np.isin(approximate.query_idx, common)).train_idx) > 0.95)
+    with raises(ValueError):
+        matcher.matcher = 'linear'
+
+    rs = np.random.RandomState(0)
+    train = rs.uniform(0, 1, (400, 16)).astype(np.float32)
+    query = train[:200] + rs.normal(0, 0.01, (200, 16)).astype(np.float32)
+    # a single KD-tree with one check misses most neighbours of unrelated points, linear index is exact
+    unrelated = rs.uniform(0, 1, (200, 16)).astype(np.float32)
+    candidates = [(dict(algorithm=1, trees=1), dict(checks=1)), (dict(algorithm=0), dict(checks=1))]
+    config = autotune_matcher([unrelated], [train], False, candidates, min_recall=0.99, repeats=1)
+    assert(config.index_params == candidates[1][0] and config.search_params == candidates[1][1])
+    assert(config.brute_force_limit > 0)
+
+    path = str(tmpdir.join('matcher.json'))
+    MatcherConfig.save(path, {'SIFT': config})
+    assert(MatcherConfig.load(path) == {'SIFT': config})
+    matcher = Matcher(matcher_config=path)
+    matcher.setup()
+    assert(matcher.matcher_config('SIFT') == config)
+    matcher.set_matcher_config('SIFT', config._replace(brute_force_limit=0))
+    assert(matcher._select_matcher('SIFT', 2, 2) == 'flann')
+    matches = matcher._match(query, train, 'SIFT', 0.8, 1.0, 10)
+    assert(np.array_equal(matches.train_idx, matches.query_idx))
+    matcher.set_matcher_config('SIFT', None)
+    assert(matcher.matcher_config('SIFT') is Matcher.DEFAULT_FLOAT_CONFIG)
+    with raises(ValueError):
+        Matcher(matcher='linear')
+
+
+@mark.main
+def test_guided_matching():
+    image = ImagesReader.load_image(images[0]).image
+    shifted = np.ascontiguousarray(image[40:, 25:])
+    orb = cv2.ORB_create(3000)
+    featuresA = Features(*orb.detectAndCompute(image, None))
+    featuresB = Features(*orb.detectAndCompute(shifted, None))
+
+    matcher = Matcher(matcher='bruteforce')
+    matcher.setup()
+    exact = matcher._match(featuresA.descriptors, featuresB.descriptors, 'ORB', 0.7, 64, 10)
+    guided = matcher._match_guided(featuresA.descriptors, featuresB.descriptors, featuresA.pts, featuresB.pts,
+                                   10000, 'ORB', 0.7, 64, 10)
+    assert(np.array_equal(exact.query_idx, guided.query_idx))
+    assert(np.array_equal(exact.train_idx, guided.train_idx))
+    assert(guided.distance == approx(exact.distance))
+
+    predicted = featuresA.pts - (25, 40)
+    predicted[:100] = np.nan
+    guided = matcher._match_guided(featuresA.descriptors, featuresB.descriptors, predicted, featuresB.pts,
+                                   3, 'ORB', 0.7, 64, 10)
+    assert(guided.count > 0.9 * exact.count)
+    assert(guided.query_idx.min() >= 100)
+    assert(np.abs(guided.query(featuresA) - guided.train(featuresB) - (25, 40)).max() <= 3)
+
+    window = (-30, 0, -2, 2)
+    query, train = Matcher._window_candidates(featuresA.pts, featuresB.pts, window)
+    delta = featuresB.pts[None, :, :] - featuresA.pts[:, None, :]
+    inside = (delta[..., 0] >= -30) & (delta[..., 0] <= 0) & (np.abs(delta[..., 1]) <= 2)
+    assert(sorted(zip(query.tolist(), train.tolist())) == list(zip(*np.nonzero(inside))))
+    assert(np.all(np.diff(query) >= 0))
+
+    rs = np.random.RandomState(0)
+    train = rs.uniform(0, 1, (500, 16)).astype(np.float32)
+    query = train[:200] + rs.normal(0, 0.01, (200, 16)).astype(np.float32)
+    pts = rs.uniform(0, 100, (500, 2))
+    guided = matcher._match_guided(query, train, pts[:200] + 1, pts, 2, 'SIFT', 0.8, 1.0, 10)
+    assert(np.array_equal(guided.query_idx, guided.train_idx) and guided.count == 200)
+    assert(matcher._match_guided(query, train, pts[:200] + 50, pts, 1, 'SIFT', 0.8, 1.0, 10) is None)
@@ -10,6 +10,7 @@ from EasyVision.vision import *
 from collections import namedtuple
 from tests.common import VisionSubclass, MyException
 from time import sleep
+import numpy as np
 
 Payload = namedtuple('Payload', ('a', 'b'))
 
@@ -51,6 +52,54 @@ def test_capture_mp_freerun():
                 break
 
 
+class ProcessorB(ProcessorBase):
+
+    @property
+    def description(self):
+        return "Array processor"
+
+    def process(self, image):
+        return image._replace(source=self, image=np.full((480, 640, 3), 7, dtype=np.uint8))
+
+
+@pytest.mark.main
+def test_capture_mp_shm_freerun():
+    vision = VisionSubclass(0)
+    processor = ProcessorB(vision)
+    with MultiProcessing(processor, transport='shm', slots=3, slot_size=2 * 1024 * 1024) as mp:
+        for index, img in enumerate(mp):
+            assert(isinstance(img, Frame))
+            assert(img.images[0].source is mp)
+            image = img.images[0].image
+            assert(image.shape == (480, 640, 3))
+            assert(not image.flags.owndata)
+            assert(np.all(image == 7))
+            sleep(.01)
+            if index > 5:
+                assert(img.index > index)
+                assert(mp.dropped_frames > 0)
+                break
+
+
+@pytest.mark.main
+def test_capture_mp_shm_fallback():
+    vision = VisionSubclass(0)
+    processor = ProcessorB(vision)
+    with MultiProcessing(processor, freerun=False, transport='shm', slot_size=1024) as mp:
+        img = mp.capture()
+        assert(isinstance(img, Frame))
+        assert(np.all(img.images[0].image == 7))
+        assert(mp.dropped_frames == 0)
+
+
+@pytest.mark.main
+def test_capture_mp_shm_args():
+    with raises(ValueError):
+        MultiProcessing(VisionSubclass(0), transport='unknown')
+    with raises(ValueError):
+        MultiProcessing(VisionSubclass(0), transport='shm', slots=2)
+
+
 @pytest.mark.main
 def test_capture_mp_get():
     vision = VisionSubclass(0)
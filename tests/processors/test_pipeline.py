@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from pytest import raises
+import threading as mt
+from EasyVision.processors import Pipeline
+from tests.common import VisionSubclass, ProcessorA, ProcessorB, MyException
+
+
+class ThreadRecorder(ProcessorA):
+
+    def __init__(self, vision, *args, **kwargs):
+        super(ThreadRecorder, self).__init__(vision, *args, **kwargs)
+        self._threads = set()
+
+    def process(self, image):
+        self._threads.add(mt.current_thread().ident)
+        return super(ThreadRecorder, self).process(image)
+
+
+class FailingProcessor(ProcessorB):
+
+    def process(self, image):
+        raise MyException()
+
+
+class LimitedVision(VisionSubclass):
+
+    def capture(self):
+        if self._frame >= 5:
+            return None
+        return super(LimitedVision, self).capture()
+
+
+@pytest.mark.main
+def test_pipeline():
+    vision = VisionSubclass("Test", num_images=2)
+    a = ThreadRecorder(vision)
+    b = ProcessorB(a)
+    with Pipeline(b, queue_size=1) as processor:
+        for i, frame in enumerate(processor):
+            assert(frame.index == i)
+            assert(frame.images[0].image == "An Image")
+            assert(frame.images[1].image == "An Image1")
+            assert(frame.images[0].source is b)
+            if i > 10:
+                break
+        assert(processor.get_source('VisionSubclass') is vision)
+        assert(processor.get_source('ProcessorA') is None)
+        assert(processor.get_source('ThreadRecorder') is a)
+        assert(processor.test_remote_get == 'success')
+        assert(len(processor.split_stages()) == 3)
+    assert(a._threads and mt.current_thread().ident not in a._threads)
+
+
+@pytest.mark.main
+def test_pipeline_stages():
+    vision = VisionSubclass("Test")
+    with Pipeline(ProcessorB(ThreadRecorder(vision)), stages=["ProcessorB"]) as processor:
+        stages = processor.split_stages()
+        assert(len(stages) == 2)
+        assert(stages[0][0] is vision)
+        assert([p.__class__.__name__ for p in stages[0][1]] == ["ThreadRecorder"])
+        assert([p.__class__.__name__ for p in stages[1][1]] == ["ProcessorB"])
+        frame = processor.capture()
+        assert(frame.images[0].image == "An Image")
+
+
+@pytest.mark.main
+def test_pipeline_end_of_stream():
+    with Pipeline(ProcessorA(LimitedVision())) as processor:
+        frames = [frame for frame in processor]
+        assert([frame.index for frame in frames] == list(range(5)))
+        assert(processor.capture() is None)
+
+
+@pytest.mark.main
+def test_pipeline_exception():
+    with Pipeline(ProcessorA(FailingProcessor(VisionSubclass()))) as processor:
+        with raises(MyException):
+            processor.capture()
+        assert(processor.capture() is None)
+
+
+@pytest.mark.main
+def test_pipeline_invalid():
+    with raises(TypeError):
+        Pipeline(None)
@@ -110,6 +110,58 @@ def test_capture_mask_processor_override_append():
         assert(img.images[2].image == "AN IMAGE1")
 
 
+@pytest.mark.main
+def test_capture_parallel_images():
+    vision = VisionSubclass(0, num_images=3, processor_mask="101")
+
+    with ProcessorA(vision, parallel_images=2) as processor:
+        img = processor.capture()
+        assert(isinstance(img, Frame))
+        assert([i.image for i in img.images] == ["AN IMAGE", "an image1", "AN IMAGE2"])
+        assert([i.source for i in img.images] == [processor, vision, processor])
+    assert(processor._pool is None)
+
+
+@pytest.mark.main
+def test_capture_parallel_images_append():
+    from multiprocessing.pool import ThreadPool
+    vision = VisionSubclass(0, num_images=3)
+    pool = ThreadPool(2)
+
+    with ProcessorA(vision, append=True, null_image=True, processor_mask="011", executor=pool) as processor:
+        img = processor.capture()
+        assert(len(img.images) == 5)
+        assert([i.image for i in img.images] == ["an image", "an image1", "an image2", None, None])
+        assert(img.images[3].source is processor)
+
+    # shared executor is not released by the processor
+    assert(pool.map(str.upper, ["a"]) == ["A"])
+    pool.terminate()
+
+
+@pytest.mark.main
+def test_buffer_pool():
+    import numpy as np
+    pool = BufferPool(max_buffers=2)
+    a = pool.get((4, 3), np.float32)
+    assert(a.shape == (4, 3) and a.dtype == np.float32)
+    b = pool.get((4, 3), np.float32)
+    assert(b is not a)
+    assert(pool.get((4, 3), np.uint8) is not a)
+
+    view = a[1:]
+    c = pool.get((4, 3), np.float32)
+    assert(c is not a and c is not b)
+    assert(len(pool) == 3)
+
+    address = b.__array_interface__['data'][0]
+    del b
+    assert(pool.get_like(view, shape=(4, 3)).__array_interface__['data'][0] == address)
+
+    pool.clear()
+    assert(len(pool) == 0)
+
+
 @pytest.mark.main
 def test_capture_incorrect():
     vision = VisionSubclass(0)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from pytest import mark
+from EasyVision import codec
+from EasyVision.vision.base import *
+from EasyVision.processors.base import *
+from datetime import datetime
+import multiprocessing as mp
+import threading
+import numpy as np
+import cv2
+import io
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+
+def make_frame():
+    image = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+    kps = [cv2.KeyPoint(x=1.0 * i, y=2.0 * i, size=3.0) for i in range(10)]
+    descriptors = np.random.randint(0, 255, (10, 32), dtype=np.uint8)
+    features = Features(kps, descriptors)
+    return Frame(datetime.now(), 3, (Image(None, image, features=features, feature_type='ORB'), Image(None, image[:, :, 0].copy())))
+
+
+def assert_frame(frame, result):
+    assert(isinstance(result, Frame))
+    assert(result.index == frame.index)
+    assert(result.timestamp == frame.timestamp)
+    assert(np.array_equal(result.images[0].image, frame.images[0].image))
+    assert(np.array_equal(result.images[1].image, frame.images[1].image))
+    assert(np.array_equal(result.images[0].features.descriptors, frame.images[0].features.descriptors))
+    assert(result.images[0].features.points[3].pt == frame.images[0].features.points[3].pt)
+    assert(result.images[0].feature_type == 'ORB')
+
+
+@mark.main
+def test_codec_roundtrip():
+    frame = make_frame()
+    data = codec.dumps(frame)
+    result = codec.loads(data)
+    assert_frame(frame, result)
+    assert(result.images[0].image.flags.writeable)
+    result.images[0].image[0, 0] = 0
+
+
+@mark.main
+def test_codec_zero_copy():
+    frame = make_frame()
+    header, buffers, payload = codec.encode(frame)
+    if not codec.OUT_OF_BAND:
+        pytest.skip("pickle protocol 5 is not available")
+
+    assert(any(np.shares_memory(np.asarray(buf), frame.images[0].image) for buf in buffers))
+    assert(len(payload) < frame.images[1].image.nbytes)
+
+    body = bytearray(codec.dumps(frame))
+    result = codec.decode(body)
+    assert(np.shares_memory(result.images[0].image, np.frombuffer(body, dtype=np.uint8)))
+    assert(result.images[0].image.flags.writeable)
+    assert(result.images[0].image.flags.aligned)
+
+
+@mark.main
+def test_codec_legacy_pickle():
+    frame = make_frame()
+    result = Frame.frombytes(pickle.dumps(frame, protocol=-1))
+    assert_frame(frame, result)
+
+
+@mark.main
+def test_codec_buffer():
+    frame = make_frame()
+    buf = io.BytesIO()
+    frame.tobuffer(buf)
+    buf.seek(0)
+    assert_frame(frame, Frame.frombuffer(buf))
+
+
+@mark.main
+def test_codec_features_points3d():
+    features = Features(np.float32([[1, 2], [3, 4]]), np.uint8([[1], [2]]), np.float32([[1, 2, 3], [4, 5, 6]]))
+    result = Features.frombytes(features.tobytes())
+    assert(np.array_equal(result.points, features.points))
+    assert(np.array_equal(result.points3d, features.points3d))
+
+
+@mark.main
+def test_codec_pipe():
+    frame = make_frame()
+    a, b = mp.Pipe(True)
+
+    def sender():
+        codec.send(a, None)
+        codec.send(a, frame)
+        codec.send(a, ValueError("test"))
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    assert(codec.recv(b) is None)
+    assert_frame(frame, codec.recv(b))
+    assert(isinstance(codec.recv(b), ValueError))
+    thread.join()
@@ -271,6 +271,28 @@ def test_psb_Builder_simple():
             break
 
 
+@mark.main
+def test_psb_Builder_pipelined():
+    builder = Builder(
+        VisionSubclass, Args("path/to/images", keyword_argument=True),
+        ProcessorA, Args(color='color'),
+        ProcessorB, Args(camera='camera')
+    )
+
+    processor = builder.build(pipelined=True, queue_size=3)
+
+    assert(isinstance(processor, Pipeline))
+    assert(isinstance(processor.source, ProcessorB))
+    assert(processor._queue_size == 3)
+
+    with processor as vision:
+        for i, frame in enumerate(vision):
+            assert(frame.index == i)
+            assert(frame.images[0].source is processor.source)
+            if i > 5:
+                break
+
+
 @mark.main
 def test_psb_Builder_simple_obj():
     builder = Builder(
@@ -27,11 +27,11 @@ def create_server(images, camera, name):
     return server
 
 
-def __test_helper(callable):
+def __test_helper(callable, **kwargs):
     server = create_server(images_left, left_camera, 'LeftCamera')
 
     try:
-        cap = PyroCapture('LeftCamera')
+        cap = PyroCapture('LeftCamera', **kwargs)
 
         callable(cap)
     except:
@@ -62,6 +62,34 @@ def test_server_client():
     __test_helper(callable)
 
 
+@mark.slow
+def test_server_client_prefetch():
+    def callable(cap):
+        with cap as vision:
+            assert(vision.feature_type == "ORB")
+            for idx, img in enumerate(vision):
+                assert(isinstance(img, Frame))
+                assert(img.images[0].source is vision)
+                assert(idx < len(images_left) + 1)
+            assert(vision.capture() is None)
+    __test_helper(callable, prefetch=2)
+
+
+@mark.slow
+def test_server_client_prefetch_drop_stale():
+    def callable(cap):
+        with cap as vision:
+            indices = []
+            for img in vision:
+                indices.append(img.index)
+                time.sleep(0.5)
+            assert(vision.dropped_frames > 0)
+            assert(len(indices) < len(images_left))
+            assert(all(a < b for a, b in zip(indices, indices[1:])))
+            assert(any(b - a > 1 for a, b in zip(indices, indices[1:])))
+    __test_helper(callable, prefetch=1, drop_stale=True)
+
+
 @mark.slow
 def test_server_client_vo2d():
     def callable(cap):
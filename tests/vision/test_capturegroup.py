@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from pytest import raises
+from EasyVision.vision import *
+from EasyVision.processors import ImageTransform
+from tests.common import VisionSubclass
+from tests.vision.test_videocapture import VideoCaptureMockClass
+
+
+class GrabMockClass(VideoCaptureMockClass):
+    calls = []
+
+    def grab(self):
+        GrabMockClass.calls.append('grab')
+        return True
+
+    def retrieve(self):
+        GrabMockClass.calls.append('retrieve')
+        return True, "image"
+
+
+@pytest.mark.main
+def test_capture_group(mocker):
+    mocker.patch('cv2.VideoCapture', GrabMockClass)
+    GrabMockClass.calls = []
+    with CaptureGroup([VideoCapture(0), VideoCapture(0), VideoCapture(0)]) as vision:
+        frame = vision.capture()
+        assert(isinstance(frame, Frame))
+        assert(len(frame.images) == 3)
+        assert(all(img.image == "image" for img in frame.images))
+        assert(frame.images[1].source is vision.sources[1])
+        assert(len(frame.timestamps) == 3)
+        assert(frame.skew >= 0)
+        assert(GrabMockClass.calls[:3] == ['grab', 'grab', 'grab'])
+        assert(GrabMockClass.calls.count('retrieve') == 3)
+
+
+@pytest.mark.main
+def test_capture_group_sources():
+    sources = [VisionSubclass("A"), VisionSubclass("B", num_images=2)]
+    with CaptureGroup(sources) as vision:
+        for i, frame in enumerate(vision):
+            assert(frame.index == i)
+            assert(len(frame.images) == 3)
+            assert(frame.images[0].source is sources[0])
+            assert(frame.images[2].source is sources[1])
+            if i > 5:
+                break
+        assert(vision.name == "(A : B)")
+        assert(vision.test_remote_get == ('success', 'success'))
+        vision.exposure = 1
+        assert(vision.exposure == (1, 1))
+
+
+@pytest.mark.main
+def test_capture_group_processors(mocker):
+    mocker.patch('cv2.VideoCapture', GrabMockClass)
+    GrabMockClass.calls = []
+    left = ImageTransform(VideoCapture(0), enabled=False)
+    right = ImageTransform(VideoCapture(0), enabled=False)
+    with CaptureGroup([left, right]) as vision:
+        frame = vision.capture()
+        assert(len(frame.images) == 2)
+        assert(GrabMockClass.calls[:2] == ['grab', 'grab'])
+        assert(vision.get_source('VideoCapture') == (left.source, right.source))
+
+
+@pytest.mark.main
+def test_capture_group_invalid():
+    with raises(TypeError):
+        CaptureGroup([])
+    with raises(TypeError):
+        CaptureGroup([VisionSubclass(), "not a vision"])
@@ -26,6 +26,25 @@ def test_load_images():
         assert(frame_count == 3)
 
 
+@pytest.mark.main
+def test_load_images_prefetch():
+    paths = ["test_data/left{:02d}.jpg".format(i + 1) for i in range(9)]
+    with ImagesReader(paths, prefetch=3, read_ahead=4) as vision:
+        frame_count = 0
+        for frame in vision:
+            assert(isinstance(frame, Frame))
+            assert(frame.index == frame_count)
+            assert(frame.images[0].source is vision)
+            assert(np.array_equal(frame.images[0].image, cv2.imread(paths[frame_count])))
+            frame_count += 1
+
+        assert(frame_count == 9)
+
+    with raises(IOError):
+        with ImagesReader(["no-such-file.jpg"], prefetch=2) as vision:
+            vision.capture()
+
+
 @pytest.mark.main
 def test_load_image():
     image = ImagesReader.load_image("test_data/34838518832_fd00147042_k.jpg")
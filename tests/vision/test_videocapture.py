@@ -5,6 +5,7 @@ import pytest
 from pytest import raises, approx
 from EasyVision.vision import *
 import cv2
+from time import sleep
 
 
 class VideoCaptureMockClass(object):
@@ -22,6 +23,13 @@ class VideoCaptureMockClass(object):
     def read(self):
         return self.isOpened(), "image"
 
+    def grab(self):
+        sleep(0.005)
+        return self.isOpened()
+
+    def retrieve(self):
+        return self.isOpened(), "image"
+
     def release(self): pass
 
 
@@ -35,6 +43,22 @@ def test_monocular_vision(mocker):
     vision = VideoCapture(0)
 
 
+@pytest.mark.main
+def test_monocular_vision_grab_latest(mocker):
+    mocker.patch('cv2.VideoCapture', VideoCaptureMock)
+    with VideoCapture(0, grab_latest=True) as vision:
+        last_index = -1
+        for i in range(5):
+            img = vision.capture()
+            assert(isinstance(img, Frame))
+            assert(img.images[0].image == "image")
+            assert(img.index > last_index)
+            last_index = img.index
+            sleep(0.03)
+        assert(vision.dropped_frames > 0)
+        assert(vision.dropped_frames <= last_index)
+
+
 @pytest.mark.main
 def test_monocular_vision_devicenotfound(mocker):
     mocker.patch('cv2.VideoCapture', VideoCaptureMock)